@@ -1,31 +1,91 @@
 # admin.py
 from aiogram import Router, F
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove, FSInputFile
-from aiogram.filters import Command, CommandStart
+from aiogram.types import (
+    Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, FSInputFile
+)
+from aiogram.filters import Command, CommandStart, CommandObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
+import asyncio
 import logging
+from datetime import datetime, timedelta
 
 from config import ADMINS
 from database import (
+    STATUS_PENDING,
+    STATUS_ANSWERED,
     get_message_by_id,
     update_status_and_response,
-    export_all_messages,
-    get_all_messages
+    get_messages_page,
+    search_messages,
+    get_clusters,
+    get_cluster,
+    answer_cluster,
+    rebuild_search_index,
+    get_stats,
+    get_outbox_summary,
+    requeue_dead_outbox,
+    cache_stats
 )
+from notify import enqueue
+from throttle import throttle_stats
+from metrics import counters, top_histograms
+from export import FORMATS, ExportProgress, export_messages as run_export, get_snapshot
 
 router = Router()
 logger = logging.getLogger(__name__)
 
 
+INBOX_PAGE_SIZE = 10
+SEARCH_PAGE_SIZE = 5
+CLUSTERS_LIMIT = 10
+CLUSTER_PREVIEW_LEN = 200
+EXPORT_PROGRESS_INTERVAL = 3  # секунды между обновлениями прогресса экспорта
+
+# Короткие коды фильтров — callback_data ограничена 64 байтами
+STATUS_FILTERS = {
+    "all": ("Все", None),
+    "open": ("⏳ Ожидают", STATUS_PENDING),
+    "done": ("✅ Отвечены", STATUS_ANSWERED),
+}
+TYPE_FILTERS = {
+    "all": ("Все типы", None),
+    "mgr": ("Руководитель", "руководитель"),
+    "gen": ("Общий", "общий"),
+    "dir": ("Директор", "директор"),
+    "idea": ("Идея", "идея"),
+}
+
+
 class AdminStates(StatesGroup):
-    choosing_message = State()
     typing_response = State()
+    typing_cluster_response = State()
+
+
+class InboxPage(CallbackData, prefix="inbox"):
+    status: str = "all"
+    type: str = "all"
+    cursor: int = 0
+    newer: bool = False
+
+
+class InboxItem(CallbackData, prefix="msg"):
+    id: int
 
 
-def is_admin(message: Message) -> bool:
+class SearchPage(CallbackData, prefix="search"):
+    page: int
+
+
+class ClusterItem(CallbackData, prefix="cluster"):
+    id: int
+
+
+def is_admin(event: Message | CallbackQuery) -> bool:
     # Важно: ADMINS должен быть списком int в config.py
-    return message.from_user and message.from_user.id in ADMINS
+    return event.from_user and event.from_user.id in ADMINS
 
 
 # На /start у админа очищаем его админское состояние, чтобы не мешало обычным хендлерам
@@ -38,22 +98,140 @@ async def admin_reset_on_start(message: Message, state: FSMContext):
         # Ничего не отвечаем — общий /start обработается user-хендлером
 
 
-# Экспорт обращений в Excel
+def parse_export_args(args: str | None) -> dict:
+    """
+    Разбирает аргументы /export: [xlsx|csv|csv.gz] [from=ГГГГ-ММ-ДД] [to=ГГГГ-ММ-ДД] [status=open|done]
+    [since ГГГГ-ММ-ДД]. Дата to включительная; since — созданные или изменённые с этой даты.
+    """
+    params = {"fmt": "xlsx", "date_from": None, "date_to": None, "status": None, "since": None}
+    args = iter((args or "").split())
+    for arg in args:
+        key, _, value = arg.partition("=")
+        if key == "since" and not value:
+            value = next(args, "")
+            if not value:
+                raise ValueError("после since нужна дата")
+        if key == "since":
+            params["since"] = datetime.strptime(value, "%Y-%m-%d")
+        elif not value:
+            if key not in FORMATS:
+                raise ValueError(f"неизвестный формат {key}")
+            params["fmt"] = key
+        elif key == "from":
+            params["date_from"] = datetime.strptime(value, "%Y-%m-%d")
+        elif key == "to":
+            params["date_to"] = datetime.strptime(value, "%Y-%m-%d") + timedelta(days=1)
+        elif key == "status" and value in STATUS_FILTERS:
+            params["status"] = STATUS_FILTERS[value][1]
+        else:
+            raise ValueError(f"неизвестный параметр {arg}")
+    return params
+
+
+# Экспорт обращений в Excel / CSV
 @router.message(Command("export"))
-async def export_messages(message: Message):
+async def export_messages(message: Message, command: CommandObject):
     if not is_admin(message):
         await message.answer("❌ У вас нет доступа.")
         return
 
     try:
-        file_path = export_all_messages()
+        params = parse_export_args(command.args)
+    except ValueError as e:
+        await message.answer(
+            f"⚠️ {e}.\nФормат: /export [xlsx|csv|csv.gz] [from=ГГГГ-ММ-ДД] [to=ГГГГ-ММ-ДД] [status=open|done] "
+            "[since ГГГГ-ММ-ДД]"
+        )
+        return
+
+    fmt = params["fmt"]
+    if not any(params[key] for key in ("date_from", "date_to", "status", "since")):
+        # Полный экспорт — готовый снимок, без чтения таблицы
+        try:
+            path, rows, created_at = await get_snapshot(fmt)
+            await message.answer_document(
+                FSInputFile(path, filename=f"exported_messages.{fmt}"),
+                caption=f"📊 Экспортировано обращений: {rows} (по состоянию на {created_at})"
+            )
+        except Exception as e:
+            logger.error(f"Ошибка экспорта: {e}")
+            await message.answer("❌ Ошибка при экспорте.")
+        return
+
+    progress = ExportProgress()
+    status_msg = await message.answer("⏳ Экспорт запущен...")
+    task = asyncio.create_task(run_export(progress=progress, **params))
+    try:
+        # Пока файл пишется в отдельном потоке — показываем прогресс
+        while not task.done():
+            await asyncio.wait({task}, timeout=EXPORT_PROGRESS_INTERVAL)
+            if not task.done() and progress.total:
+                try:
+                    await status_msg.edit_text(f"⏳ Экспорт: {progress.done} из {progress.total} строк...")
+                except TelegramBadRequest:
+                    pass
+        file_path = task.result()
         file = FSInputFile(file_path)
-        await message.answer_document(file, caption="📊 Все обращения экспортированы")
+        await message.answer_document(file, caption=f"📊 Экспортировано обращений: {progress.total}")
+        await status_msg.delete()
     except Exception as e:
         logger.error(f"Ошибка экспорта: {e}")
         await message.answer("❌ Ошибка при экспорте.")
 
 
+async def build_inbox(page: InboxPage):
+    rows, has_more = await get_messages_page(
+        cursor_id=page.cursor or None,
+        newer=page.newer,
+        limit=INBOX_PAGE_SIZE,
+        status=STATUS_FILTERS[page.status][1],
+        msg_type=TYPE_FILTERS[page.type][1],
+    )
+
+    kb = []
+    for r in rows:
+        # r: (id, type, message, status)
+        label = f"🆔#{r[0]} | {r[1]} | {r[3]}"
+        kb.append([InlineKeyboardButton(text=label, callback_data=InboxItem(id=r[0]).pack())])
+
+    # Есть ли страницы новее/старее текущей
+    has_newer = has_more if page.newer else bool(page.cursor)
+    has_older = bool(page.cursor) if page.newer else has_more
+    nav = []
+    if rows and has_newer:
+        nav.append(InlineKeyboardButton(
+            text="⬅ Новее",
+            callback_data=InboxPage(status=page.status, type=page.type, cursor=rows[0][0], newer=True).pack()
+        ))
+    if rows and has_older:
+        nav.append(InlineKeyboardButton(
+            text="Старее ➡",
+            callback_data=InboxPage(status=page.status, type=page.type, cursor=rows[-1][0]).pack()
+        ))
+    if nav:
+        kb.append(nav)
+
+    kb.append([
+        InlineKeyboardButton(
+            text=("• " if code == page.status else "") + label,
+            callback_data=InboxPage(status=code, type=page.type).pack()
+        )
+        for code, (label, _) in STATUS_FILTERS.items()
+    ])
+    type_buttons = [
+        InlineKeyboardButton(
+            text=("• " if code == page.type else "") + label,
+            callback_data=InboxPage(status=page.status, type=code).pack()
+        )
+        for code, (label, _) in TYPE_FILTERS.items()
+    ]
+    kb.append(type_buttons[:3])
+    kb.append(type_buttons[3:])
+
+    text = "Выберите сообщение для ответа:" if rows else "Нет обращений по выбранному фильтру."
+    return text, InlineKeyboardMarkup(inline_keyboard=kb)
+
+
 # Открыть админ-панель
 @router.message(Command("admin"))
 async def admin_panel(message: Message, state: FSMContext):
@@ -61,50 +239,308 @@ async def admin_panel(message: Message, state: FSMContext):
         await message.answer("⛔ У вас нет прав.")
         return
 
-    rows = get_all_messages()
-    if not rows:
-        await message.answer("Пока нет обращений.")
+    await state.clear()
+    text, kb = await build_inbox(InboxPage())
+    await message.answer(text, reply_markup=kb)
+
+
+# Листание и фильтры админ-панели
+@router.callback_query(InboxPage.filter())
+async def admin_inbox_page(callback: CallbackQuery, callback_data: InboxPage):
+    if not is_admin(callback):
+        await callback.answer("⛔ У вас нет прав.", show_alert=True)
         return
 
-    kb = []
+    text, kb = await build_inbox(callback_data)
+    try:
+        await callback.message.edit_text(text, reply_markup=kb)
+    except TelegramBadRequest:
+        # Страница не изменилась (повторное нажатие того же фильтра)
+        pass
+    await callback.answer()
+
+
+async def build_search_results(query: str, page: int):
+    rows, has_more = await search_messages(query, limit=SEARCH_PAGE_SIZE, offset=page * SEARCH_PAGE_SIZE)
+    if not rows:
+        return f"🔍 По запросу «{query}» ничего не найдено.", None
+
+    entries, kb = [], []
     for r in rows:
-        # r: (id, type, message, status)
-        label = f"🆔#{r[0]} | {r[1]} | {r[3]}"
-        kb.append([KeyboardButton(text=label)])
+        # r: (id, type, status, snippet)
+        entries.append(f"🆔#{r[0]} | {r[1]} | {r[2]}\n{r[3]}")
+        kb.append([InlineKeyboardButton(text=f"Ответить на #{r[0]}", callback_data=InboxItem(id=r[0]).pack())])
 
-    await message.answer(
-        "Выберите сообщение для ответа:",
-        reply_markup=ReplyKeyboardMarkup(keyboard=kb, resize_keyboard=True)
-    )
-    await state.set_state(AdminStates.choosing_message)
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton(text="⬅ Назад", callback_data=SearchPage(page=page - 1).pack()))
+    if has_more:
+        nav.append(InlineKeyboardButton(text="Дальше ➡", callback_data=SearchPage(page=page + 1).pack()))
+    if nav:
+        kb.append(nav)
 
+    text = f"🔍 «{query}», стр. {page + 1}:\n\n" + "\n\n".join(entries)
+    return text, InlineKeyboardMarkup(inline_keyboard=kb)
 
-# Выбор сообщения для ответа
-@router.message(AdminStates.choosing_message)
-async def admin_choose_message(message: Message, state: FSMContext):
-    # Если прилетела команда (например, /start или /export), не обрабатываем тут
-    if message.text and message.text.startswith("/"):
+
+# Полнотекстовый поиск по обращениям
+@router.message(Command("search"))
+async def admin_search(message: Message, command: CommandObject, state: FSMContext):
+    if not is_admin(message):
+        await message.answer("⛔ У вас нет прав.")
+        return
+    if not command.args:
+        await message.answer("Использование: /search <слова для поиска>")
+        return
+
+    # Запрос не влезает в callback_data — храним его в состоянии админа
+    await state.update_data(search_query=command.args)
+    text, kb = await build_search_results(command.args, 0)
+    await message.answer(text, reply_markup=kb)
+
+
+@router.callback_query(SearchPage.filter())
+async def admin_search_page(callback: CallbackQuery, callback_data: SearchPage, state: FSMContext):
+    if not is_admin(callback):
+        await callback.answer("⛔ У вас нет прав.", show_alert=True)
         return
 
+    query = (await state.get_data()).get("search_query")
+    if not query:
+        await callback.answer("Поиск устарел, повторите /search.", show_alert=True)
+        return
+    text, kb = await build_search_results(query, callback_data.page)
     try:
-        # Ожидаем формат кнопки: "🆔#<id> | ..."
-        msg_id = int(message.text.split("#")[1].split(" ")[0])
-        record = get_message_by_id(msg_id)
-        if not record:
-            await message.answer("⚠️ Обращение не найдено. Нажмите /admin и выберите из списка.")
-            return
+        await callback.message.edit_text(text, reply_markup=kb)
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
+
+
+# Группы похожих неотвеченных обращений (dedup.py)
+@router.message(Command("clusters"))
+async def admin_clusters(message: Message, state: FSMContext):
+    if not is_admin(message):
+        await message.answer("⛔ У вас нет прав.")
+        return
+
+    await state.clear()
+    rows = await get_clusters(limit=CLUSTERS_LIMIT)
+    if not rows:
+        await message.answer("🔁 Похожих неотвеченных обращений нет.")
+        return
 
-        # record: (id, user_id, type, message, name, position, is_anonymous, reason, file_path, status, answer, created_at)
-        await state.update_data(selected_id=msg_id, user_id=record[1], is_anonymous=record[6])
+    entries, kb = [], []
+    for cluster_id, count, named, _, text in rows:
+        entries.append(f"🔁 Группа #{cluster_id}: {count} обращений (не анонимных: {named})\n"
+                       f"{text[:CLUSTER_PREVIEW_LEN]}")
+        kb.append([InlineKeyboardButton(text=f"Ответить группе #{cluster_id}",
+                                        callback_data=ClusterItem(id=cluster_id).pack())])
+    await message.answer("\n\n".join(entries), reply_markup=InlineKeyboardMarkup(inline_keyboard=kb))
 
-        # ВАЖНО: текст обращения — record[3], а не record[2]
-        text = f"📨 Сообщение #{msg_id}:\n\n{record[3]}\n\nВведите ответ:"
-        await message.answer(text, reply_markup=ReplyKeyboardRemove())
-        await state.set_state(AdminStates.typing_response)
 
+@router.callback_query(ClusterItem.filter())
+async def admin_choose_cluster(callback: CallbackQuery, callback_data: ClusterItem, state: FSMContext):
+    if not is_admin(callback):
+        await callback.answer("⛔ У вас нет прав.", show_alert=True)
+        return
+
+    members = await get_cluster(callback_data.id)
+    if not members:
+        await callback.answer("⚠️ В группе нет неотвеченных обращений.", show_alert=True)
+        return
+
+    await state.update_data(selected_cluster=callback_data.id)
+    # m: (id, user_id, is_anonymous, message)
+    lines = [f"#{m[0]}: {m[3][:CLUSTER_PREVIEW_LEN]}" for m in members[:CLUSTERS_LIMIT]]
+    if len(members) > CLUSTERS_LIMIT:
+        lines.append(f"… и ещё {len(members) - CLUSTERS_LIMIT}")
+    text = (f"🔁 Группа #{callback_data.id}, обращений: {len(members)}\n\n" + "\n\n".join(lines)
+            + "\n\nВведите ответ — он будет сохранён для всех обращений группы:")
+    await callback.message.answer(text)
+    await state.set_state(AdminStates.typing_cluster_response)
+    await callback.answer()
+
+
+@router.message(AdminStates.typing_cluster_response)
+async def admin_send_cluster_response(message: Message, state: FSMContext):
+    cluster_id = (await state.get_data())["selected_cluster"]
+    response = message.text
+
+    try:
+        answered = await answer_cluster(cluster_id, response)
+        for msg_id, user_id, is_anonymous in answered:
+            if not is_anonymous:
+                await enqueue(
+                    [user_id], f"📩 Ответ на ваше обращение (ID: {msg_id}):\n\n{response}", message_id=msg_id
+                )
+        sent = sum(not is_anonymous for _, _, is_anonymous in answered)
+        await message.answer(f"✅ Ответ сохранён для обращений: {len(answered)}, "
+                             f"поставлен в очередь отправки авторам: {sent}.")
     except Exception as e:
-        logger.warning(f"Неверный формат выбора в админке: {e}")
-        await message.answer("⚠️ Неверный формат. Нажмите /admin и выберите сообщение из списка.")
+        logger.error(f"Ошибка при ответе группе #{cluster_id}: {e}")
+        await message.answer("❌ Не удалось сохранить ответ, попробуйте ещё раз.")
+
+    await state.clear()
+
+
+# Перестроить поисковый индекс (например, после ручного импорта в messages.db)
+@router.message(Command("reindex"))
+async def admin_reindex(message: Message):
+    if not is_admin(message):
+        await message.answer("⛔ У вас нет прав.")
+        return
+
+    await rebuild_search_index()
+    await message.answer("✅ Поисковый индекс перестроен.")
+
+
+def format_duration(seconds: float | None) -> str:
+    if seconds is None:
+        return "—"
+    if seconds < 3600:
+        return f"{round(seconds / 60)} мин"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f} ч"
+    return f"{seconds / 86400:.1f} дн"
+
+
+def format_stats(stats: dict) -> str:
+    lines = ["📈 Статистика обращений", ""]
+    by_status = stats["by_status"]
+    lines.append(f"⏳ Ожидают ответа: {by_status.get(STATUS_PENDING, 0)}")
+    lines.append(f"✅ Отвечены: {by_status.get(STATUS_ANSWERED, 0)}")
+
+    lines += ["", "По типам:"]
+    for _, (label, value) in list(TYPE_FILTERS.items())[1:]:
+        lines.append(f"• {label}: {stats['by_type'].get(value, 0)}")
+
+    backlog = sorted(stats["open_by_recipient"].items(), key=lambda kv: -kv[1])
+    if backlog:
+        lines += ["", "Без ответа по руководителям:"]
+        lines += [f"• {name}: {count}" for name, count in backlog]
+
+    lines += ["", "Медиана времени ответа:"]
+    for days, created, answered, median in stats["windows"]:
+        lines.append(f"• {days} дн: {format_duration(median)} (новых {created}, отвечено {answered})")
+
+    if stats["daily"]:
+        lines += ["", "По дням (новых / отвечено):"]
+        lines += [f"• {day}: {created} / {answered}" for day, created, answered in stats["daily"]]
+    return "\n".join(lines)
+
+
+# Сводная статистика из таблиц счётчиков
+@router.message(Command("stats"))
+async def admin_stats(message: Message):
+    if not is_admin(message):
+        await message.answer("⛔ У вас нет прав.")
+        return
+
+    text = format_stats(await get_stats())
+    # Счётчики флуд-контроля — этого процесса с момента запуска
+    text += (
+        f"\n\n🚦 Отброшено апдейтов: дешёвых {throttle_stats['dropped_cheap']}, "
+        f"дорогих {throttle_stats['dropped_expensive']}, повторов {throttle_stats['coalesced']}"
+    )
+    await message.answer(text)
+
+
+PERF_SECTIONS = [
+    ("Хендлеры", "handler_seconds", lambda l: f"{l['handler']} [{l['state'] or '—'}]"),
+    ("БД", "db_seconds", lambda l: l["query"]),
+    ("Bot API", "telegram_api_seconds", lambda l: l["method"]),
+    ("Файлы", "save_file_seconds", lambda l: "save_file"),
+]
+
+
+def format_perf(limit: int = 5) -> str:
+    ms = 1000
+    lines = ["⏱ Задержки (мс, p50 / p95 / p99, число вызовов), самые затратные:"]
+    for title, name, label in PERF_SECTIONS:
+        top = top_histograms(name, limit)
+        if not top:
+            continue
+        lines += ["", f"{title}:"]
+        for labels, h in top:
+            lines.append(
+                f"• {label(labels)}: {h.quantile(0.5) * ms:.1f} / {h.quantile(0.95) * ms:.1f} / "
+                f"{h.quantile(0.99) * ms:.1f}, {h.count}"
+            )
+    errors = sum(v for (name, _), v in counters.items() if name == "telegram_api_errors_total")
+    calls = sum(v for (name, _), v in counters.items() if name == "telegram_api_calls_total")
+    lines += ["", f"Вызовов Bot API: {calls}, ошибок: {errors}"]
+    lines += ["", "Кэш БД (попаданий / промахов, записей):"]
+    for name, (hits, misses, size) in cache_stats().items():
+        lines.append(f"• {name}: {hits} / {misses}, {size}")
+    return "\n".join(lines)
+
+
+# Горячие точки по метрикам этого процесса
+@router.message(Command("perf"))
+async def admin_perf(message: Message):
+    if not is_admin(message):
+        await message.answer("⛔ У вас нет прав.")
+        return
+
+    await message.answer(format_perf())
+
+
+OUTBOX_LABELS = {"pending": "⏳ в очереди", "sent": "✅ доставлено", "dead": "❌ не доставлено"}
+
+
+# Состояние очереди исходящих: /outbox, /outbox <ID обращения>, /outbox retry
+@router.message(Command("outbox"))
+async def admin_outbox(message: Message, command: CommandObject):
+    if not is_admin(message):
+        await message.answer("⛔ У вас нет прав.")
+        return
+
+    arg = (command.args or "").strip()
+    if arg == "retry":
+        count = await requeue_dead_outbox()
+        await message.answer(f"🔁 Возвращено в очередь: {count}")
+        return
+    if arg and not arg.isdigit():
+        await message.answer("Использование: /outbox [ID обращения | retry]")
+        return
+
+    counts, rows = await get_outbox_summary(int(arg) if arg else None)
+    lines = ["📤 Очередь отправки: " + ", ".join(
+        f"{label} {counts.get(status, 0)}" for status, label in OUTBOX_LABELS.items()
+    )]
+    if rows:
+        lines.append("")
+        lines.append(f"Обращение #{arg}:" if arg else "Последние недоставленные (/outbox retry — повторить):")
+    for outbox_id, msg_id, chat_id, kind, status, attempts, error in rows:
+        line = f"• #{msg_id} → {chat_id} ({kind}): {OUTBOX_LABELS.get(status, status)}, попыток {attempts}"
+        if error and status != "sent":
+            line += f"\n  {error[:200]}"
+        lines.append(line)
+    await message.answer("\n".join(lines))
+
+
+# Выбор сообщения для ответа
+@router.callback_query(InboxItem.filter())
+async def admin_choose_message(callback: CallbackQuery, callback_data: InboxItem, state: FSMContext):
+    if not is_admin(callback):
+        await callback.answer("⛔ У вас нет прав.", show_alert=True)
+        return
+
+    msg_id = callback_data.id
+    record = await get_message_by_id(msg_id)
+    if not record:
+        await callback.answer("⚠️ Обращение не найдено.", show_alert=True)
+        return
+
+    # record: (id, user_id, type, message, name, position, is_anonymous, reason, file_path, status, answer, created_at)
+    await state.update_data(selected_id=msg_id, user_id=record[1], is_anonymous=record[6])
+
+    # ВАЖНО: текст обращения — record[3], а не record[2]
+    text = f"📨 Сообщение #{msg_id}:\n\n{record[3]}\n\nВведите ответ:"
+    await callback.message.answer(text)
+    await state.set_state(AdminStates.typing_response)
+    await callback.answer()
 
 
 # Ввод и отправка ответа
@@ -117,18 +553,14 @@ async def admin_send_response(message: Message, state: FSMContext):
     response = message.text
 
     try:
-        update_status_and_response(msg_id, "✅ Ответ отправлен", response)
+        await update_status_and_response(msg_id, STATUS_ANSWERED, response)
 
         if not is_anonymous:
-            try:
-                await message.bot.send_message(
-                    chat_id=user_id,
-                    text=f"📩 Ответ на ваше обращение (ID: {msg_id}):\n\n{response}"
-                )
-                await message.answer("✅ Ответ сохранён и отправлен пользователю.")
-            except Exception as e:
-                logger.error(f"Ошибка отправки пользователю {user_id}: {e}")
-                await message.answer("⚠️ Ответ сохранён, но не удалось отправить пользователю.")
+            # Доставкой (с повторами) занимается очередь notify.py
+            await enqueue(
+                [user_id], f"📩 Ответ на ваше обращение (ID: {msg_id}):\n\n{response}", message_id=msg_id
+            )
+            await message.answer(f"✅ Ответ сохранён и поставлен в очередь отправки. Статус: /outbox {msg_id}")
         else:
             await message.answer("✅ Ответ сохранён и отправлен пользователю.")
 
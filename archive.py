@@ -0,0 +1,84 @@
+# archive.py
+"""
+Перенос старых отвеченных обращений в архивную БД.
+
+messages растёт бесконечно, а работа идёт в основном со свежими и
+неотвеченными обращениями. Archiver раз в ARCHIVE_INTERVAL переносит
+отвеченные обращения, не менявшиеся ARCHIVE_AFTER_DAYS дней, в отдельный
+файл (database.archive_path), пачками по ARCHIVE_BATCH_SIZE через общую
+очередь записей, затем сжимает поисковый индекс и возвращает освободившееся
+место incremental_vacuum.
+
+Архив подключён к каждому соединению, поэтому карточка обращения, история
+«Мои обращения», поиск и экспорт видят обе таблицы. Админка (список
+обращений) читает только живую таблицу. Ответ на архивное обращение сначала
+возвращает его в messages.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from config import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL
+from database import archive_batch, enable_incremental_vacuum, incremental_vacuum, merge_search_index
+
+logger = logging.getLogger(__name__)
+
+BATCH_PAUSE = 0.05     # секунды между пачками — чтобы между ними проходили обычные записи
+VACUUM_PAGES = 1000    # страниц за один шаг incremental_vacuum
+MERGE_PAGES = 500      # страниц за один шаг сжатия поискового индекса
+
+
+class Archiver:
+    def __init__(self, after_days: int = ARCHIVE_AFTER_DAYS, batch_size: int = ARCHIVE_BATCH_SIZE,
+                 interval: float = ARCHIVE_INTERVAL):
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run_once(self, now=None) -> int:
+        """Один проход: переносит всё, что пора, и сжимает файл. Возвращает число перенесённых."""
+        now = now or datetime.now()
+        cutoff = int((now - timedelta(days=self.after_days)).timestamp())
+        moved = 0
+        while True:
+            count = await archive_batch(cutoff, self.batch_size)
+            moved += count
+            if count < self.batch_size:
+                break
+            await asyncio.sleep(BATCH_PAUSE)
+        if moved:
+            while await merge_search_index(MERGE_PAGES):
+                await asyncio.sleep(BATCH_PAUSE)
+            left = await incremental_vacuum(VACUUM_PAGES)
+            while left:
+                await asyncio.sleep(BATCH_PAUSE)
+                previous, left = left, await incremental_vacuum(VACUUM_PAGES)
+                if left >= previous:
+                    break   # свободные страницы не убывают — дальше не сжать
+            logger.info(f"В архив перенесено обращений: {moved}")
+        return moved
+
+    async def _run(self):
+        try:
+            if await enable_incremental_vacuum():
+                logger.info("Для messages.db включён auto_vacuum = INCREMENTAL")
+        except Exception as e:
+            logger.error(f"Не удалось включить incremental vacuum: {e}")
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка архивации: {e}")
+            await asyncio.sleep(self.interval)
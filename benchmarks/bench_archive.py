@@ -0,0 +1,124 @@
+# benchmarks/bench_archive.py
+"""
+Архивация: задержка горячих запросов (вставка обращения, список неотвеченных
+в админке, история пользователя, карточка) при растущей истории — без архива
+и после переноса старых отвеченных обращений в архив (archive.Archiver).
+Живая часть во всех прогонах одинаковая (LIVE свежих обращений), меняется
+только объём старой истории. Печатает медианы и p95 в микросекундах и размер
+основного файла БД до и после (с incremental_vacuum).
+
+    python benchmarks/bench_archive.py [объём истории ...]
+"""
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database  # noqa: E402
+from dedup import fingerprint  # noqa: E402
+from archive import Archiver  # noqa: E402
+
+LIVE = 5000
+USERS = 2000
+REPEATS = 300
+TYPES = ["руководитель", "общий", "директор", "идея"]
+
+
+def seed(conn, history, rnd):
+    now = datetime.now()
+    old = int((now - timedelta(days=400)).timestamp())
+    columns = "user_id, type, message, name, position, is_anonymous, reason, status, answer, created_at, " \
+              "recipient, answered_at, updated_at"
+    sql = f"INSERT INTO messages ({columns}) VALUES ({', '.join('?' * 13)})"
+    with conn:
+        types = [database._code(conn, "message_types", name) for name in TYPES]
+        pending = database._code(conn, "message_statuses", database.STATUS_PENDING)
+        answered = database._code(conn, "message_statuses", database.STATUS_ANSWERED)
+        conn.executemany(sql, (
+            (rnd.randrange(USERS), rnd.choice(types), "Старое обращение " * rnd.randint(1, 20), "Сотрудник",
+             "Должность", 0, "", answered, "Ответ", old, "", old, old)
+            for _ in range(history)
+        ))
+        for i in range(LIVE):
+            created = int((now - timedelta(minutes=LIVE - i)).timestamp())
+            status = pending if i % 3 else answered
+            conn.execute(sql, (rnd.randrange(USERS), rnd.choice(types), "Свежее обращение", "Сотрудник",
+                               "Должность", 0, "", status, "", created, "", None, created))
+
+
+def file_size(conn):
+    # В WAL файл БД уменьшается только на checkpoint
+    conn.execute("PRAGMA main.wal_checkpoint(TRUNCATE)")
+    return os.path.getsize(database.DB_NAME) / 2**20
+
+
+def timings(func, rnd):
+    values = []
+    for _ in range(REPEATS):
+        started = time.perf_counter()
+        func(rnd)
+        values.append((time.perf_counter() - started) * 1e6)
+    values.sort()
+    return statistics.median(values), values[int(len(values) * 0.95)]
+
+
+def measure(conn, rnd):
+    max_id = conn.execute("SELECT MAX(id) FROM messages").fetchone()[0]
+
+    def insert(rnd):
+        data = {"user_id": rnd.randrange(USERS), "type": rnd.choice(TYPES),
+                "message": "Новое обращение", "name": "Иван", "position": "Инженер"}
+        with conn:
+            database._insert_message(conn, data, fingerprint(data["message"]))
+
+    queries = {
+        "вставка": insert,
+        "админка: неотвеченные": lambda rnd: database._get_messages_page(
+            conn, None, False, 10, database.STATUS_PENDING, rnd.choice(TYPES)),
+        "история пользователя": lambda rnd: database._get_user_messages_page(conn, rnd.randrange(USERS),
+                                                                             None, 10, 200),
+        "карточка (свежая)": lambda rnd: database._get_message_by_id(conn, max_id - rnd.randrange(LIVE)),
+    }
+    return {name: timings(func, rnd) for name, func in queries.items()}
+
+
+async def run(history):
+    rnd = random.Random(1)
+    workdir = tempfile.mkdtemp()
+    database.DB_NAME = os.path.join(workdir, "messages.db")
+    conn = database.connect()
+    database._init_db(conn)
+    seed(conn, history, rnd)
+    before = measure(conn, rnd)
+    size_before = file_size(conn)
+
+    started = time.perf_counter()
+    moved = await Archiver(after_days=180, batch_size=1000).run_once()
+    archived_in = time.perf_counter() - started
+    after = measure(conn, rnd)
+    hot, cold = database._archive_counts(conn)
+    size = file_size(conn)
+    conn.close()
+    database.close_db()
+    database._executor = database.ThreadPoolExecutor(max_workers=database.DB_POOL_SIZE, thread_name_prefix="db")
+    database._writer = database.ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
+    print(f"\nИстория {history}: перенесено {moved} за {archived_in:.1f} с; "
+          f"в messages {hot}, в архиве {cold}; messages.db {size_before:.1f} -> {size:.1f} МБ")
+    print(f"  {'запрос':24} {'без архива p50/p95':>22} {'с архивом p50/p95':>22}  мкс")
+    for name in before:
+        b, a = before[name], after[name]
+        print(f"  {name:24} {b[0]:10.0f} {b[1]:10.0f} {a[0]:10.0f} {a[1]:10.0f}")
+
+
+if __name__ == "__main__":
+    sizes = [int(n) for n in sys.argv[1:]] or [0, 50_000, 200_000]
+    for history in sizes:
+        asyncio.run(run(history))
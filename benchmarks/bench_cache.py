@@ -0,0 +1,104 @@
+# benchmarks/bench_cache.py
+"""
+Кэш чтений database.py: проверка, что после update_status_and_response и
+insert_message ни карточка, ни история, ни админка не показывают старые
+данные (в том числе при чтениях, идущих параллельно с записью), и доля
+попаданий на типичной нагрузке. Если найдено хоть одно устаревшее чтение,
+код выхода — 1.
+
+    python benchmarks/bench_cache.py [раундов]
+"""
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database  # noqa: E402
+from fake_bot import temp_database  # noqa: E402
+
+USERS = 20
+
+
+def message(user_id):
+    return {"user_id": user_id, "type": "общий", "message": "Текст", "name": "Иван", "position": "Инженер"}
+
+
+async def reader(stop, ids):
+    # Непрерывные чтения, чтобы они пересекались с записями
+    while not stop.is_set():
+        msg_id = random.choice(ids)
+        await database.get_message_by_id(msg_id)
+        await database.get_user_messages_page(msg_id % USERS)
+        await database.get_messages_page()
+        # Попадание в кэш не уступает управление — уступаем сами
+        await asyncio.sleep(0)
+
+
+async def check(rounds):
+    ids = [await database.insert_message(message(user_id)) for user_id in range(USERS)]
+    owner = {msg_id: user_id for msg_id, user_id in zip(ids, range(USERS))}
+    stop = asyncio.Event()
+    readers = [asyncio.create_task(reader(stop, ids)) for _ in range(8)]
+    stale = 0
+    for n in range(rounds):
+        msg_id = random.choice(ids)
+        answer = f"Ответ {n}"
+        await database.update_status_and_response(msg_id, database.STATUS_ANSWERED, answer)
+        # Сразу после записи все три чтения обязаны видеть новый ответ
+        record = await database.get_message_by_id(msg_id)
+        history, _ = await database.get_user_messages_page(owner[msg_id])
+        inbox, _ = await database.get_messages_page(limit=100)
+        if record[10] != answer or record[9] != database.STATUS_ANSWERED:
+            stale += 1
+        if not any(row[0] == msg_id and row[5] for row in history):
+            stale += 1
+        if not any(row[0] == msg_id and row[3] == database.STATUS_ANSWERED for row in inbox):
+            stale += 1
+        await database.update_status_and_response(msg_id, database.STATUS_PENDING, "")
+        if (await database.get_message_by_id(msg_id))[9] != database.STATUS_PENDING:
+            stale += 1
+        if n % 10 == 0:
+            # Новое обращение должно сразу появиться в истории и в админке
+            user_id = random.randrange(USERS)
+            new_id = await database.insert_message(message(user_id))
+            history, _ = await database.get_user_messages_page(user_id)
+            inbox, _ = await database.get_messages_page()
+            if history[0][0] != new_id or inbox[0][0] != new_id:
+                stale += 1
+    stop.set()
+    await asyncio.gather(*readers)
+    return stale
+
+
+async def hit_rate(reads):
+    # Счётчики накопительные — считаем разницу
+    before = {k: v[:2] for k, v in database.cache_stats().items()}
+    started = time.perf_counter()
+    for _ in range(reads):
+        user_id = random.randrange(USERS)
+        await database.get_user_messages_page(user_id)
+        await database.get_messages_page()
+    elapsed = time.perf_counter() - started
+    after = database.cache_stats()
+    for name, (hits, misses, size) in after.items():
+        h, m = hits - before[name][0], misses - before[name][1]
+        if h + m:
+            print(f"  {name}: попаданий {h / (h + m):.0%} из {h + m}, записей {size}")
+    return elapsed / (reads * 2) * 1_000_000
+
+
+async def main(rounds):
+    with temp_database():
+        await database.init_db()
+        stale = await check(rounds)
+        print(f"Устаревших чтений после записи: {stale} из {rounds} раундов — {'OK' if not stale else 'FAIL'}")
+        per_read = await hit_rate(5000)
+        print(f"Среднее чтение с кэшем: {per_read:.1f} мкс")
+        return stale
+
+
+if __name__ == "__main__":
+    sys.exit(1 if asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 300)) else 0)
@@ -0,0 +1,165 @@
+# benchmarks/bench_dedup.py
+"""
+Поиск похожих обращений (dedup.py) на большом индексе.
+
+Индекс заполняется отпечатками N сгенерированных обращений (по умолчанию
+1 000 000), затем измеряются:
+  - скорость расчёта отпечатка (minhash + подпись + ключи полос), обращений/с;
+  - поиск похожих через LSH (find_similar): p50/p95 и доля найденных
+    почти-дубликатов (правка пары слов, регистр, пунктуация) и ложных находок
+    среди новых текстов;
+  - полный путь fingerprint + record_fingerprint (расчёт, поиск, запись) пачками
+    по транзакциям;
+  - для сравнения — полный перебор подписей на нескольких запросах;
+  - размер индекса на диске в байтах на обращение.
+
+    python benchmarks/bench_dedup.py [обращений]
+"""
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import dedup  # noqa: E402
+from migrations import apply_migrations  # noqa: E402
+
+QUERIES = 2000
+SCAN_QUERIES = 3
+RECORDS = 5000
+SYLLABLES = ["ра", "бо", "та", "ни", "ко", "ме", "ст", "ло", "ва", "пре", "дла", "же", "ни", "е", "от", "дел",
+             "гра", "фик", "зар", "пла", "ту", "ре", "мон", "кон", "тро", "ль", "сто", "ло", "ва", "я"]
+
+
+def make_vocabulary(rnd, size=20000):
+    return ["".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))) for _ in range(size)]
+
+
+def make_text(rnd, words):
+    return " ".join(rnd.choice(words) for _ in range(rnd.randint(10, 40)))
+
+
+def near_duplicate(rnd, text, words):
+    parts = text.split()
+    for _ in range(rnd.randint(1, 2)):
+        parts[rnd.randrange(len(parts))] = rnd.choice(words)
+    text = " ".join(parts)
+    return rnd.choice([text, text.upper(), text + "!!!", text.replace(" ", ", ", 1)])
+
+
+def fill(conn, texts):
+    batch_fp, batch_bands = [], []
+
+    def flush():
+        with conn:
+            conn.executemany("INSERT INTO message_fingerprints (message_id, signature) VALUES (?, ?)", batch_fp)
+            conn.executemany("INSERT OR IGNORE INTO message_bands (key, message_id) VALUES (?, ?)", batch_bands)
+        batch_fp.clear()
+        batch_bands.clear()
+
+    for message_id, text in enumerate(texts, 1):
+        slots = dedup.minhash(text)
+        batch_fp.append((message_id, dedup.signature(slots)))
+        batch_bands.extend((key, message_id) for key in dedup.band_keys(slots))
+        if len(batch_fp) == 20000:
+            flush()
+    flush()
+
+
+def percentiles(values):
+    values = sorted(values)
+    return statistics.median(values), values[int(len(values) * 0.95)]
+
+
+def jaccard(a, b):
+    a, b = dedup.shingles(a), dedup.shingles(b)
+    return len(a & b) / len(a | b)
+
+
+def measure_lookup(conn, queries):
+    timings, hits = [], []
+    for text, expected in queries:
+        started = time.perf_counter()
+        found = dedup.find_similar(conn, dedup.fingerprint(text))
+        timings.append((time.perf_counter() - started) * 1e6)
+        hits.append(any(message_id == expected for message_id, _, _ in found) if expected else bool(found))
+    return percentiles(timings), hits
+
+
+def full_scan(conn, text):
+    own = dedup.signature(dedup.minhash(text))
+    return [message_id for message_id, stored in conn.execute("SELECT message_id, signature FROM message_fingerprints")
+            if dedup.similarity(own, stored) >= dedup.SIMILARITY_THRESHOLD]
+
+
+def run(count):
+    rnd = random.Random(1)
+    words = make_vocabulary(rnd)
+    texts = [make_text(rnd, words) for _ in range(count)]
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "dedup.db")
+    conn = sqlite3.connect(path)
+    apply_migrations(conn)
+
+    sample = texts[:QUERIES]
+    started = time.perf_counter()
+    for text in sample:
+        dedup.fingerprint(text)
+    fingerprint_rate = len(sample) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    fill(conn, texts)
+    filled_in = time.perf_counter() - started
+
+    duplicates = [(near_duplicate(rnd, texts[i], words), i + 1) for i in rnd.sample(range(count), QUERIES)]
+    fresh = [(make_text(rnd, words), None) for _ in range(QUERIES)]
+    (dup_p50, dup_p95), found = measure_lookup(conn, duplicates)
+    (new_p50, new_p95), false_found = measure_lookup(conn, fresh)
+    recall = sum(found) / len(found)
+    # Правка двух слов в коротком тексте может опустить сходство ниже порога —
+    # такие пары и не должны находиться; отдельно — доля найденных среди остальных
+    close = [hit for hit, (text, expected) in zip(found, duplicates)
+             if jaccard(text, texts[expected - 1]) >= dedup.SIMILARITY_THRESHOLD]
+    close_recall = sum(close) / len(close)
+    false_rate = sum(false_found) / len(false_found)
+
+    started = time.perf_counter()
+    for offset in range(0, RECORDS, 100):
+        with conn:
+            for i in range(offset, min(offset + 100, RECORDS)):
+                text = near_duplicate(rnd, texts[i], words) if i % 2 else make_text(rnd, words)
+                dedup.record_fingerprint(conn, count + i + 1, dedup.fingerprint(text))
+    record_rate = RECORDS / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for text, _ in duplicates[:SCAN_QUERIES]:
+        full_scan(conn, text)
+    scan_ms = (time.perf_counter() - started) / SCAN_QUERIES * 1000
+
+    pages = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"))
+    index_bytes = sum(size for name, size in pages.items()
+                      if name.startswith(("message_fingerprints", "message_bands", "idx_fingerprints")))
+    conn.close()
+    os.remove(path)
+    os.rmdir(workdir)
+
+    print(f"\n{count} обращений в индексе (заполнен за {filled_in:.0f} с)")
+    print(f"  отпечаток:                 {fingerprint_rate:10.0f} обращений/с")
+    print(f"  поиск почти-дубликата:     {dup_p50:10.0f} / {dup_p95:.0f} мкс p50/p95, найдено {recall:.1%} "
+          f"(со сходством >= {dedup.SIMILARITY_THRESHOLD}: {close_recall:.1%})")
+    print(f"  поиск нового текста:       {new_p50:10.0f} / {new_p95:.0f} мкс p50/p95, ложных находок {false_rate:.2%}")
+    print(f"  record_fingerprint:        {record_rate:10.0f} обращений/с (расчёт + поиск + запись)")
+    print(f"  полный перебор подписей:   {scan_ms:10.0f} мс на запрос")
+    print(f"  индекс на диске:           {index_bytes / count:10.0f} байт на обращение, "
+          f"{index_bytes / 2**20:.1f} МБ")
+
+
+if __name__ == "__main__":
+    sizes = [int(n) for n in sys.argv[1:]] or [1_000_000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,102 @@
+# benchmarks/bench_download.py
+"""
+Скачивание вложений через utils.save_file с локальной заглушкой файлового API
+Telegram на aiohttp: время, пиковая память и отказ для файлов больше лимита.
+
+    python benchmarks/bench_download.py [файлов] [размер_МБ]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from aiohttp import web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.types import Message  # noqa: E402
+
+import utils  # noqa: E402
+
+TOKEN = "42:TEST"
+PORT = 8765
+
+
+def make_app(sizes):
+    async def get_file(request):
+        file_id = (await request.post())["file_id"]
+        return web.json_response({"ok": True, "result": {
+            "file_id": file_id, "file_unique_id": file_id,
+            "file_size": sizes[file_id], "file_path": f"documents/{file_id}",
+        }})
+
+    async def download(request):
+        size = sizes[request.match_info["name"]]
+        response = web.StreamResponse()
+        # Размер не сообщаем заранее — лимит должен сработать во время скачивания
+        await response.prepare(request)
+        chunk = b"x" * 65536
+        sent = 0
+        while sent < size:
+            part = chunk[:size - sent]
+            await response.write(part)
+            sent += len(part)
+        await response.write_eof()
+        return response
+
+    app = web.Application()
+    app.router.add_post(f"/bot{TOKEN}/getFile", get_file)
+    app.router.add_get(f"/file/bot{TOKEN}/documents/{{name}}", download)
+    return app
+
+
+def make_message(bot, file_id):
+    return Message.model_validate({
+        "message_id": 1, "date": 0,
+        "chat": {"id": 1, "type": "private"},
+        "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+        "document": {"file_id": file_id, "file_unique_id": file_id, "file_name": f"{file_id}.pdf"},
+    }, context={"bot": bot})
+
+
+async def main(count, size_mb):
+    sizes = {f"f{i}": size_mb * 1024 * 1024 for i in range(count)}
+    sizes["too_big"] = utils.MAX_FILE_SIZE + 1
+    runner = web.AppRunner(make_app(sizes))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{PORT}"))
+    bot = Bot(token=TOKEN, session=session)
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    try:
+        tracemalloc.start()
+        started = time.perf_counter()
+        await asyncio.gather(*(utils.save_file(make_message(bot, f"f{i}")) for i in range(count)))
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{count} файлов по {size_mb} МБ: {elapsed:.2f} с, пик памяти Python {peak / 1024 / 1024:.1f} МБ")
+
+        try:
+            await utils.save_file(make_message(bot, "too_big"))
+            print("ОШИБКА: файл больше лимита сохранён")
+        except utils.FileTooLargeError:
+            leftovers = list(Path("uploads").glob("too_big*"))
+            print(f"Файл больше лимита отклонён, остатков на диске: {len(leftovers)}")
+    finally:
+        await session.close()
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    size_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    asyncio.run(main(count, size_mb))
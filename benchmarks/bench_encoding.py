@@ -0,0 +1,133 @@
+# benchmarks/bench_encoding.py
+"""
+Формат хранения messages: v1 (статус и тип — строки, время — текст) против
+v2 (коды из справочников и секунды Unix, migrations._compact_encoding).
+
+Одна и та же таблица строится в v1, копия переводится миграцией в v2 (время
+миграции тоже печатается). Сравниваются размер строки и индексов (dbstat),
+размер файла и время запросов: страница админки с фильтром по статусу,
+подсчёт за диапазон дат, сортировка без индекса и группировка по статусу и типу.
+
+    python benchmarks/bench_encoding.py [строк]
+"""
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from migrations import apply_migrations  # noqa: E402
+
+USERS = 2000
+REPEAT = 20
+TYPES = ["руководитель", "общий", "директор", "идея"]
+STATUSES = ["Ожидает ответа", "✅ Ответ отправлен"]
+START = datetime(2023, 1, 1)
+
+# {created} — колонка или выражение времени, {status} — параметр статуса
+QUERIES = {
+    "админка: страница по статусу": """
+        SELECT id, type, message, status FROM messages WHERE status = :status
+        ORDER BY created_at DESC, id DESC LIMIT 20
+    """,
+    "подсчёт за 30 дней": "SELECT COUNT(*) FROM messages WHERE created_at >= :since AND created_at < :until",
+    "сортировка без индекса": """
+        SELECT id FROM messages NOT INDEXED WHERE created_at >= :since ORDER BY created_at DESC
+    """,
+    "группировка статус × тип": "SELECT status, type, COUNT(*) FROM messages GROUP BY status, type",
+}
+
+
+def fill(conn, rows):
+    rnd = random.Random(1)
+    batch = []
+    for i in range(rows):
+        created = (START + timedelta(seconds=rnd.randint(0, 86400 * 900))).strftime("%Y-%m-%d %H:%M:%S")
+        batch.append((rnd.randint(1, USERS), rnd.choice(TYPES), f"Сообщение {i}", "Иван", "Инженер", 0, "",
+                      rnd.choice(STATUSES), "", created, "", created, i + 1, created))
+        if len(batch) == 10000:
+            _insert(conn, batch)
+            batch.clear()
+    if batch:
+        _insert(conn, batch)
+
+
+def _insert(conn, batch):
+    with conn:
+        conn.executemany("""
+            INSERT INTO messages (
+                user_id, type, message, name, position, is_anonymous, reason,
+                status, answer, created_at, recipient, answered_at, change_seq, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, batch)
+
+
+def sizes(conn, rows):
+    pages = dict(conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"))
+    indexes = [name for name, in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'messages'")]
+    return pages["messages"] / rows, sum(pages[name] for name in indexes) / 2**20
+
+
+def params(v2):
+    since, until = START + timedelta(days=300), START + timedelta(days=330)
+    if v2:
+        return {"status": 1, "since": int(since.timestamp()), "until": int(until.timestamp())}
+    fmt = "%Y-%m-%d %H:%M:%S"
+    return {"status": STATUSES[0], "since": since.strftime(fmt), "until": until.strftime(fmt)}
+
+
+def measure(conn, sql, args):
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        conn.execute(sql, args).fetchall()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def run(rows):
+    workdir = tempfile.mkdtemp()
+    v1_path, v2_path = os.path.join(workdir, "v1.db"), os.path.join(workdir, "v2.db")
+    conn = sqlite3.connect(v1_path)
+    apply_migrations(conn, target=9)
+    fill(conn, rows)
+    conn.execute("VACUUM")
+    conn.close()
+    shutil.copy(v1_path, v2_path)
+
+    conn = sqlite3.connect(v2_path)
+    started = time.perf_counter()
+    apply_migrations(conn, target=10)
+    migrated_in = time.perf_counter() - started
+    conn.execute("VACUUM")
+    conn.close()
+
+    results = {}
+    for label, path, v2 in (("v1", v1_path, False), ("v2", v2_path, True)):
+        conn = sqlite3.connect(path)
+        row_bytes, index_mb = sizes(conn, rows)
+        timings = {name: measure(conn, sql, params(v2)) for name, sql in QUERIES.items()}
+        results[label] = (row_bytes, index_mb, os.path.getsize(path) / 2**20, timings)
+        conn.close()
+    shutil.rmtree(workdir)
+
+    print(f"\n{rows} строк, миграция v1 -> v2: {migrated_in:.1f} с")
+    print(f"  {'':32} {'v1':>10} {'v2':>10}")
+    v1, v2 = results["v1"], results["v2"]
+    print(f"  {'строка таблицы, байт':32} {v1[0]:10.1f} {v2[0]:10.1f}")
+    print(f"  {'индексы messages, МБ':32} {v1[1]:10.2f} {v2[1]:10.2f}")
+    print(f"  {'файл БД, МБ':32} {v1[2]:10.2f} {v2[2]:10.2f}")
+    for name in QUERIES:
+        print(f"  {name + ', мс':32} {v1[3][name]:10.3f} {v2[3][name]:10.3f}")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000)
@@ -0,0 +1,62 @@
+# benchmarks/bench_fsm_storage.py
+"""
+Сравнение SQLiteStorage с MemoryStorage на типичном шаге формы
+(get_state + get_data + update_data + set_state) и проверка, что состояние
+переживает перезапуск.
+
+    python benchmarks/bench_fsm_storage.py [пользователей] [шагов]
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aiogram.fsm.storage.base import StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+
+import database  # noqa: E402
+from fake_bot import temp_database  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+
+async def form_step(storage, key, step):
+    await storage.get_state(key)
+    await storage.get_data(key)
+    await storage.update_data(key, {"message": f"Текст {step}", "history": ["Form:entering_name"] * 3})
+    await storage.set_state(key, f"Form:step_{step}")
+
+
+async def run(storage, users, steps):
+    keys = [StorageKey(bot_id=1, chat_id=u, user_id=u) for u in range(users)]
+    started = time.perf_counter()
+    for step in range(steps):
+        for key in keys:
+            await form_step(storage, key, step)
+    elapsed = time.perf_counter() - started
+    return elapsed / (users * steps) * 1_000_000
+
+
+async def main(users, steps):
+    with temp_database():
+        await database.init_db()
+        memory = await run(MemoryStorage(), users, steps)
+        storage = SQLiteStorage(flush_interval=0.05)
+        sqlite = await run(storage, users, steps)
+        await storage.close()
+
+        print(f"MemoryStorage: {memory:7.1f} мкс на шаг формы")
+        print(f"SQLiteStorage: {sqlite:7.1f} мкс на шаг формы (первое обращение к ключу читает БД)")
+
+        restarted = SQLiteStorage()
+        key = StorageKey(bot_id=1, chat_id=0, user_id=0)
+        state = await restarted.get_state(key)
+        await restarted.close()
+        print(f"После перезапуска: {state}")
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 6
+    asyncio.run(main(users, steps))
@@ -0,0 +1,98 @@
+# benchmarks/bench_indexes.py
+"""
+Латентность запросов истории пользователя и списка админки до и после
+миграции с индексами.
+
+    python benchmarks/bench_indexes.py 10000 100000 1000000
+"""
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from migrations import apply_migrations  # noqa: E402
+
+USERS = 2000
+REPEAT = 50
+
+USER_HISTORY = """
+    SELECT id, type, message, status, answer
+    FROM messages
+    WHERE user_id = ?
+    ORDER BY created_at DESC, id DESC
+"""
+ADMIN_LISTING = """
+    SELECT id, type, message, status
+    FROM messages
+    ORDER BY created_at DESC, id DESC
+    LIMIT 20
+"""
+
+
+def fill(conn, rows):
+    start = datetime(2023, 1, 1)
+    batch = []
+    for i in range(rows):
+        created = start + timedelta(seconds=random.randint(0, 86400 * 900))
+        batch.append((
+            random.randint(1, USERS), "общий", f"Сообщение {i}", "Иван", "Инженер",
+            0, "", None, "Ожидает ответа", "", created.strftime("%Y-%m-%d %H:%M:%S"),
+        ))
+        if len(batch) == 10000:
+            _insert(conn, batch)
+            batch.clear()
+    if batch:
+        _insert(conn, batch)
+
+
+def _insert(conn, batch):
+    with conn:
+        conn.executemany("""
+            INSERT INTO messages (
+                user_id, type, message, name, position,
+                is_anonymous, reason, file_path, status, answer, created_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, batch)
+
+
+def measure(conn, sql, params_fn):
+    timings = []
+    for _ in range(REPEAT):
+        started = time.perf_counter()
+        conn.execute(sql, params_fn()).fetchall()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def run(rows):
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(path)
+        apply_migrations(conn, target=1)
+        fill(conn, rows)
+        results = []
+        for label in ("без индексов", "с индексами"):
+            if label == "с индексами":
+                apply_migrations(conn, target=10)
+            history = measure(conn, USER_HISTORY, lambda: (random.randint(1, USERS),))
+            listing = measure(conn, ADMIN_LISTING, lambda: ())
+            results.append((label, history, listing))
+        conn.close()
+    finally:
+        os.remove(path)
+    for label, history, listing in results:
+        print(f"{rows:>9} строк | {label:<13} | история: {history:8.3f} мс | админка: {listing:8.3f} мс")
+
+
+if __name__ == "__main__":
+    sizes = [int(x) for x in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    for size in sizes:
+        run(size)
@@ -0,0 +1,68 @@
+# benchmarks/bench_keyboards.py
+"""
+Стоимость клавиатур и одного апдейта формы.
+
+Сравнивает сборку клавиатуры руководителей на каждый ответ (как раньше) с
+готовой клавиатурой из keyboards.py, показывает цену сериализации разметки и
+меряет полный проход «Назад»/шаг формы через Dispatcher с ботом без сети.
+
+    python benchmarks/bench_keyboards.py [повторов]
+"""
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aiogram import Dispatcher  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+from aiogram.types import KeyboardButton, ReplyKeyboardMarkup  # noqa: E402
+
+from config import MANAGERS  # noqa: E402
+import keyboards  # noqa: E402
+from fake_bot import make_bot, message_update  # noqa: E402
+
+
+def per_call_us(func, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1_000_000
+
+
+def build_managers_kb():
+    buttons = [[KeyboardButton(text=name)] for name in MANAGERS]
+    return ReplyKeyboardMarkup(
+        keyboard=buttons + [[keyboards.BACK_BTN]],
+        resize_keyboard=True, one_time_keyboard=True
+    )
+
+
+async def per_update_us(repeat):
+    import handlers  # noqa: F401 — роутер подключается ниже
+
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(handlers.router)
+    bot = make_bot()
+    flow = ["👨‍💼 Задать вопрос руководителю", MANAGERS[0], keyboards.BACK_TEXT, keyboards.BACK_TEXT]
+    updates = [message_update(1, text) for _ in range(repeat) for text in flow]
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - started) / len(updates) * 1_000_000
+
+
+def main(repeat):
+    build = per_call_us(build_managers_kb, repeat)
+    lookup = per_call_us(lambda: keyboards.STEPS["choosing_manager"], repeat)
+    dump = per_call_us(lambda: json.dumps(keyboards.MANAGERS_KB.model_dump(exclude_none=True)), repeat)
+    print(f"Сборка клавиатуры руководителей:  {build:8.2f} мкс")
+    print(f"Готовая клавиатура из реестра:    {lookup:8.2f} мкс")
+    print(f"Сериализация клавиатуры (aiogram): {dump:7.2f} мкс")
+    print(f"Апдейт формы через Dispatcher:    {asyncio.run(per_update_us(repeat // 10)):8.2f} мкс")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,100 @@
+# benchmarks/bench_outbox.py
+"""
+Прогон OutboxScheduler на боте без сети: часть чатов отвечает RetryAfter,
+временными и постоянными ошибками. Печатает скорость доставки, итоговые
+статусы и проверяет лимиты (глобальный и на чат); если проверки не прошли,
+код выхода — 1.
+
+    python benchmarks/bench_outbox.py [чатов]
+"""
+import asyncio
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aiogram import Bot  # noqa: E402
+from aiogram.exceptions import (  # noqa: E402
+    TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+)
+
+import database  # noqa: E402
+import notify  # noqa: E402
+from fake_bot import FakeSession, temp_database  # noqa: E402
+
+RATE = 50
+CHAT_INTERVAL = 0.2
+
+
+class FlakySession(FakeSession):
+    """Первые вызовы в отдельные чаты завершаются заданными ошибками."""
+
+    def __init__(self, failures, **kwargs):
+        super().__init__(**kwargs)
+        self.failures = failures
+        self.sent = defaultdict(list)   # chat_id -> моменты успешных отправок
+
+    async def make_request(self, bot, method, timeout=None):
+        script = self.failures.get(method.chat_id)
+        if script:
+            error = script.pop(0)
+            if error == "retry":
+                raise TelegramRetryAfter(method=method, message="Too Many Requests", retry_after=1)
+            if error == "network":
+                raise TelegramNetworkError(method=method, message="Connection reset")
+            raise TelegramForbiddenError(method=method, message="bot was blocked by the user")
+        result = await super().make_request(bot, method, timeout)
+        self.sent[method.chat_id].append(time.monotonic())
+        return result
+
+
+async def main(chats):
+    notify.BACKOFF_BASE = 0.2
+    failures = {1: ["retry"], 2: ["network", "network"], 3: ["forbidden"]}
+    session = FlakySession(failures)
+    scheduler = notify.OutboxScheduler(
+        Bot(token="42:FAKE", session=session), rate=RATE, chat_interval=CHAT_INTERVAL, poll_interval=0.05
+    )
+    with temp_database():
+        try:
+            await database.init_db()
+            scheduler.start()
+            started = time.monotonic()
+            # Каждому чату — два сообщения подряд, чтобы сработал лимит на чат
+            for n in range(2):
+                await notify.enqueue(range(1, chats + 1), f"Сообщение {n}", message_id=n)
+
+            expected = chats * 2 - 1   # первое сообщение в чат 3 недоставляемо
+            while sum(len(times) for times in session.sent.values()) < expected:
+                await asyncio.sleep(0.05)
+                if time.monotonic() - started > 60:
+                    break
+            elapsed = time.monotonic() - started
+            await asyncio.sleep(0.2)   # дать записать результаты последних попыток
+
+            counts, dead = await database.get_outbox_summary()
+            all_times = sorted(t for times in session.sent.values() for t in times)
+            min_gap = min(
+                (b - a for times in session.sent.values() for a, b in zip(times, times[1:])), default=None
+            )
+            peak = max(
+                (sum(1 for t in all_times if s <= t < s + 1) for s in all_times), default=0
+            )
+            print(f"Доставлено {len(all_times)} сообщений за {elapsed:.2f} с ({len(all_times) / elapsed:.0f}/с)")
+            print(f"Статусы outbox: {counts}")
+            print(f"Недоставленные: {[(r[2], r[6]) for r in dead]}")
+            print(f"Минимальный интервал в чате: {min_gap:.3f} с (лимит {CHAT_INTERVAL})")
+            print(f"Пик за секунду: {peak} (лимит {RATE})")
+            ok = (counts.get("dead") == 1 and min_gap is not None and min_gap >= CHAT_INTERVAL * 0.95
+                  and peak <= RATE + 1 and len(session.sent[1]) == 2 and len(session.sent[2]) == 2)
+            print("Проверки:", "OK" if ok else "FAIL")
+            return ok
+        finally:
+            await scheduler.stop()
+
+
+if __name__ == "__main__":
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    sys.exit(0 if asyncio.run(main(chats)) else 1)
@@ -0,0 +1,68 @@
+# benchmarks/bench_search.py
+"""
+Латентность полнотекстового поиска (database.search_messages) на большой таблице.
+
+    python benchmarks/bench_search.py [строк]
+"""
+import asyncio
+import random
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database  # noqa: E402
+from fake_bot import temp_database  # noqa: E402
+
+SYLLABLES = "ка ло ми ру то не за пе ди са ко ль ва ны ре го ба ту жи хо".split()
+# Словарь с распределением Ципфа: немного частых слов и длинный хвост редких
+VOCABULARY = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+QUERIES = [VOCABULARY[0], VOCABULARY[50], VOCABULARY[500] + " " + VOCABULARY[700], VOCABULARY[3000][:4] + "*",
+           "несуществующееслово"]
+REPEAT = 20
+
+
+def fill(conn, rows):
+    batch = []
+    with conn:
+        msg_type = database._code(conn, "message_types", "общий")
+    created = int(datetime(2025, 1, 1).timestamp())
+    for i in range(rows):
+        text = " ".join(random.choices(VOCABULARY, WEIGHTS, k=20))
+        batch.append((random.randint(1, 5000), msg_type, text, "Иван", "Инженер", 0, "", created))
+        if len(batch) == 20000:
+            _insert(conn, batch)
+            batch.clear()
+    if batch:
+        _insert(conn, batch)
+
+
+def _insert(conn, batch):
+    with conn:
+        conn.executemany("""
+            INSERT INTO messages (user_id, type, message, name, position, is_anonymous, reason, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, batch)
+
+
+async def main(rows):
+    with temp_database():
+        await database.init_db()
+        started = time.perf_counter()
+        await database.run_in_db(fill, rows)
+        print(f"{rows} строк загружено за {time.perf_counter() - started:.1f} с (индекс обновляется триггерами)")
+        for query in QUERIES:
+            timings = []
+            for _ in range(REPEAT):
+                started = time.perf_counter()
+                hits, _ = await database.search_messages(query, limit=5)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            print(f"«{query}»: медиана {timings[len(timings) // 2] * 1000:7.2f} мс, найдено на странице: {len(hits)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000))
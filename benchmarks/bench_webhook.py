@@ -0,0 +1,162 @@
+# benchmarks/bench_webhook.py
+"""
+Сквозная задержка «апдейт отправлен → хендлер вызван» в режимах polling и webhook.
+
+Поднимает локальную заглушку Bot API (getUpdates с long polling, sendMessage и
+прочее) и локальный webhook-сервер из webhook.py, отправляет синтетические
+апдейты и считает перцентили задержки.
+
+    python benchmarks/bench_webhook.py [апдейтов]
+"""
+import asyncio
+import statistics
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+from aiohttp import ClientSession, web
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aiogram import Bot, Dispatcher  # noqa: E402
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+
+import handlers  # noqa: E402
+from keyboards import HELP_TEXT  # noqa: E402
+from webhook import SECRET_HEADER, WebhookServer  # noqa: E402
+
+TOKEN = "42:BENCH"
+API_PORT = 8766
+WEBHOOK_PORT = 8767
+SECRET = "bench-secret"
+
+
+class FakeBotAPI:
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.message_id = 0
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        if method == "getUpdates":
+            params = await request.post()
+            timeout = float(params.get("timeout") or 0)
+            try:
+                first = await asyncio.wait_for(self.queue.get(), timeout or 0.01)
+            except asyncio.TimeoutError:
+                return web.json_response({"ok": True, "result": []})
+            updates = [first]
+            while not self.queue.empty():
+                updates.append(self.queue.get_nowait())
+            return web.json_response({"ok": True, "result": updates})
+        if method == "sendMessage":
+            self.message_id += 1
+            params = await request.post()
+            return web.json_response({"ok": True, "result": {
+                "message_id": self.message_id, "date": 0,
+                "chat": {"id": int(params["chat_id"]), "type": "private"}, "text": params.get("text", ""),
+            }})
+        if method == "getMe":
+            return web.json_response({"ok": True, "result": {"id": 42, "is_bot": True, "first_name": "Bench"}})
+        return web.json_response({"ok": True, "result": True})
+
+
+def make_update(update_id):
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()),
+        "chat": {"id": update_id, "type": "private"},
+        "from": {"id": update_id, "is_bot": False, "first_name": "Bench"},
+        "text": HELP_TEXT,
+    }}
+
+
+def make_dispatcher(sent_at, latencies):
+    dp = Dispatcher(storage=MemoryStorage())
+    dp.include_router(handlers.router)
+
+    @dp.update.outer_middleware()
+    async def measure(handler, event, data):
+        latencies.append(time.perf_counter() - sent_at.pop(event.update_id))
+        return await handler(event, data)
+
+    return dp
+
+
+def report(mode, latencies):
+    ms = sorted(x * 1000 for x in latencies)
+    p = lambda q: ms[min(len(ms) - 1, int(len(ms) * q))]  # noqa: E731
+    print(f"{mode:<8} n={len(ms):<5} p50={p(0.5):7.2f} мс  p95={p(0.95):7.2f} мс  "
+          f"p99={p(0.99):7.2f} мс  среднее={statistics.mean(ms):7.2f} мс")
+
+
+async def bench_polling(dp, api, sent_at, latencies, count):
+    latencies.clear()
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{API_PORT}")))
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=10))
+    await asyncio.sleep(0.5)
+    for i in range(1, count + 1):
+        sent_at[i] = time.perf_counter()
+        api.queue.put_nowait(make_update(i))
+        await asyncio.sleep(0.005)
+    while len(latencies) < count:
+        await asyncio.sleep(0.05)
+    await dp.stop_polling()
+    await polling
+    report("polling", latencies)
+
+
+async def bench_webhook(dp, sent_at, latencies, count):
+    latencies.clear()
+    bot = Bot(TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(f"http://127.0.0.1:{API_PORT}")))
+    server = WebhookServer(bot, partial(dp.feed_update, bot), SECRET, max_concurrency=100)
+    runner = web.AppRunner(server.make_app("/webhook"))
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", WEBHOOK_PORT).start()
+
+    async with ClientSession() as client:
+        for i in range(1, count + 1):
+            sent_at[i] = time.perf_counter()
+            async with client.post(f"http://127.0.0.1:{WEBHOOK_PORT}/webhook", json=make_update(i),
+                                   headers={SECRET_HEADER: SECRET}) as resp:
+                assert resp.status == 200
+            await asyncio.sleep(0.005)
+        async with client.post(f"http://127.0.0.1:{WEBHOOK_PORT}/webhook", json=make_update(0)) as resp:
+            assert resp.status == 401, "запрос без секрета должен отклоняться"
+        async with client.post(f"http://127.0.0.1:{WEBHOOK_PORT}/webhook", json=make_update(0),
+                               headers={SECRET_HEADER: SECRET + "x"}) as resp:
+            assert resp.status == 401, "запрос с чужим секретом должен отклоняться"
+        async with client.post(f"http://127.0.0.1:{WEBHOOK_PORT}/webhook", data=b"{not json",
+                               headers={SECRET_HEADER: SECRET}) as resp:
+            assert resp.status == 400, "битый JSON — 400, а не 500"
+        async with client.post(f"http://127.0.0.1:{WEBHOOK_PORT}/webhook", json={"update_id": "x"},
+                               headers={SECRET_HEADER: SECRET}) as resp:
+            assert resp.status == 400, "апдейт, не прошедший валидацию, — 400"
+
+    await server.shutdown()
+    await runner.cleanup()
+    await bot.session.close()
+    report("webhook", latencies)
+
+
+async def main(count):
+    api = FakeBotAPI()
+    app = web.Application()
+    app.router.add_post(f"/bot{TOKEN}/{{method}}", api.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", API_PORT).start()
+    # Роутер можно подключить только к одному диспетчеру — он общий для обоих режимов
+    sent_at, latencies = {}, []
+    dp = make_dispatcher(sent_at, latencies)
+    try:
+        await bench_polling(dp, api, sent_at, latencies, count)
+        await bench_webhook(dp, sent_at, latencies, count)
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
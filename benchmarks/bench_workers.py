@@ -0,0 +1,75 @@
+# benchmarks/bench_workers.py
+"""
+Пропускная способность обработки апдейтов в 1..N процессах (workers.WorkerPool).
+
+Каждый синтетический пользователь проходит форму «💡 Предложить идею» до
+отправки; боты в процессах-обработчиках работают без сети (fake_bot).
+Заодно проверяется перезапуск упавшего процесса.
+
+    python benchmarks/bench_workers.py [пользователей] [макс. процессов]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database  # noqa: E402
+from fake_bot import make_bot, message_update  # noqa: E402
+from workers import WorkerPool  # noqa: E402
+
+FLOW = ["💡 Предложить идею", "🤐 Анонимно", "Причина", "Текст предложения", "❌ Нет"]
+
+
+async def run(users, count):
+    pool = WorkerPool(count, bot_factory=make_bot)
+    pool.start()
+    updates = [message_update(user_id, text) for user_id in range(1, users + 1) for text in FLOW]
+    # Даём процессам подняться, чтобы не мерить импорт aiogram
+    await asyncio.sleep(3)
+    started = time.perf_counter()
+    for update in updates:
+        pool.dispatch(update)
+    while sum(v.value for v in pool.processed) < len(updates):
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - started
+
+    pool.processes[0].kill()
+    supervisor = asyncio.create_task(pool.supervise())
+    await asyncio.sleep(3)
+    restarted = pool.restarts[0] == 1 and pool.processes[0].is_alive()
+    supervisor.cancel()
+    await pool.stop()
+    return len(updates) / elapsed, restarted
+
+
+def count_submissions():
+    conn = database.connect()
+    try:
+        return conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+    finally:
+        conn.close()
+
+
+async def main(users, max_workers):
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    await database.init_db()
+    database.close_db()
+    count = 1
+    while count <= max_workers:
+        before = count_submissions()
+        throughput, restarted = await run(users, count)
+        submitted = count_submissions() - before
+        print(f"процессов: {count:<2} | {throughput:8.0f} апдейтов/с | обращений сохранено: {submitted}/{users} | "
+              f"перезапуск после падения: {'да' if restarted else 'нет'}")
+        count *= 2
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    asyncio.run(main(users, max_workers))
@@ -0,0 +1,57 @@
+# benchmarks/bench_writes.py
+"""
+Пропускная способность insert_message при 1/10/100 одновременных отправителях:
+отдельная транзакция на каждую запись против групповой фиксации (WriteQueue).
+
+    python benchmarks/bench_writes.py [записей на замер]
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database  # noqa: E402
+from dedup import fingerprint  # noqa: E402
+from fake_bot import temp_database  # noqa: E402
+
+DATA = {
+    "user_id": 1, "type": "общий", "message": "Текст обращения " * 10,
+    "name": "Иван", "position": "Инженер", "recipient": "",
+}
+
+
+def _insert_one(conn, data, fp):
+    # Прежнее поведение: своя транзакция и fsync на каждую запись
+    with conn:
+        return database._insert_message(conn, data, fp)
+
+
+async def direct_insert(data):
+    return await database.run_in_db(_insert_one, data, fingerprint(data["message"]))
+
+
+async def run(insert, submitters, total):
+    async def submitter(count):
+        for _ in range(count):
+            await insert(DATA)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(submitter(total // submitters) for _ in range(submitters)))
+    return total / (time.perf_counter() - started)
+
+
+async def main(total):
+    with temp_database():
+        await database.init_db()
+        print(f"{'отправителей':>12} {'по одной, зап/с':>16} {'пачками, зап/с':>16}")
+        for submitters in (1, 10, 100):
+            direct = await run(direct_insert, submitters, total)
+            grouped = await run(database.insert_message, submitters, total)
+            print(f"{submitters:>12} {direct:>16.0f} {grouped:>16.0f}")
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    asyncio.run(main(total))
@@ -0,0 +1,110 @@
+# benchmarks/fake_bot.py
+"""
+Бот без сети для бенчмарков: сессия отвечает на методы Bot API сразу,
+не отправляя запросов, и считает вызовы. Плюс конструкторы синтетических
+апдейтов и временная БД (temp_database).
+"""
+import itertools
+import os
+import tempfile
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetFile, SendDocument, SendMessage, SendPhoto
+from aiogram.types import Chat, Document, File, Message, PhotoSize, Update
+
+import database
+
+_ids = itertools.count(1)
+
+
+class FakeSession(BaseSession):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = Counter()
+
+    async def make_request(self, bot, method, timeout=None):
+        self.calls[type(method).__name__] += 1
+        # Отправленное сообщение нужно вернуть как Message, остальным методам хватает True
+        if isinstance(method, (SendMessage, SendDocument, SendPhoto)):
+            extra = {}
+            if isinstance(method, SendDocument):
+                extra["document"] = Document(file_id="fake-document", file_unique_id="fake-document")
+            if isinstance(method, SendPhoto):
+                extra["photo"] = [PhotoSize(file_id="fake-photo", file_unique_id="fake-photo", width=1, height=1)]
+            return Message(
+                message_id=next(_ids), date=datetime.now(),
+                chat=Chat(id=method.chat_id, type="private"),
+                text=getattr(method, "text", None), **extra,
+            )
+        if isinstance(method, GetFile):
+            return File(file_id=method.file_id, file_unique_id=method.file_id, file_size=1024,
+                        file_path=f"documents/{method.file_id}")
+        return True
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b"%PDF-1.4 fake" * 64
+
+    async def close(self):
+        pass
+
+
+@contextmanager
+def temp_database():
+    """
+    Направляет database на временный файл и по выходе закрывает соединения
+    и удаляет его вместе с архивом и их -wal/-shm. Возвращает путь к файлу.
+    """
+    fd, path = tempfile.mkstemp(suffix=".db")
+    os.close(fd)
+    database.DB_NAME = path
+    try:
+        yield path
+    finally:
+        database.close_db()
+        for db_path in (path, database.archive_path(path)):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(db_path + suffix):
+                    os.remove(db_path + suffix)
+
+
+def make_bot():
+    return Bot(token="42:FAKE", session=FakeSession())
+
+
+def _user(user_id):
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+
+def message_update(user_id, text=None, chat_type="private", **extra):
+    message = {
+        "message_id": next(_ids), "date": 0,
+        "chat": {"id": user_id, "type": chat_type},
+        "from": _user(user_id),
+    }
+    if text is not None:
+        message["text"] = text
+    message.update(extra)
+    return Update.model_validate({"update_id": next(_ids), "message": message})
+
+
+def document_update(user_id, file_name="report.pdf", mime_type="application/pdf"):
+    file_id = f"doc{next(_ids)}"
+    return message_update(user_id, document={
+        "file_id": file_id, "file_unique_id": file_id, "file_name": file_name,
+        "mime_type": mime_type, "file_size": 1024,
+    })
+
+
+def callback_update(user_id, data, chat_type="private"):
+    return Update.model_validate({"update_id": next(_ids), "callback_query": {
+        "id": str(next(_ids)), "from": _user(user_id), "chat_instance": "1", "data": data,
+        "message": {
+            # date=0 aiogram считает недоступным сообщением (InaccessibleMessage)
+            "message_id": next(_ids), "date": 1,
+            "chat": {"id": user_id, "type": chat_type}, "text": "…",
+        },
+    }})
@@ -0,0 +1,290 @@
+# benchmarks/loadtest.py
+"""
+Сквозной нагрузочный тест: синтетические апдейты идут через Dispatcher с
+handlers.router и admin.router, бот работает без сети (fake_bot).
+
+Пользователи параллельно проходят форму по всем веткам (руководитель,
+анонимная идея, общий вопрос с файлом, директор), админы в это время
+открывают /admin, выбирают обращение и отвечают, в конце — /export.
+БД заранее наполняется --seed обращениями. Печатает пропускную способность,
+перцентили задержек по видам апдейтов и пик памяти, сохраняет результат в
+benchmarks/results/<время>-<коммит>.json; --compare сравнивает с прошлым.
+
+Прогон засчитывается, только если ни один апдейт не упал и не записал в лог
+ошибку, а в БД ровно seed + users обращений и отвечены все, на которые
+ответили админы. Иначе результат не сохраняется и код выхода — 1: сравнение
+с прошлым прогоном не должно мерить пути ошибок.
+
+    python benchmarks/loadtest.py [--users 2000] [--seed 10000] [--compare results/....json]
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from aiogram import Dispatcher  # noqa: E402
+
+import config  # noqa: E402
+import database  # noqa: E402
+from dedup import fingerprint  # noqa: E402
+from fake_bot import make_bot, message_update, document_update, callback_update  # noqa: E402
+from keyboards import ANONYMOUS_TEXT, NO_TEXT  # noqa: E402
+from storage import SQLiteStorage  # noqa: E402
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+ADMIN_IDS = [1, 2, 3]
+FIRST_USER_ID = 1_000_000
+TYPES = ["руководитель", "общий", "директор", "идея"]
+ADMIN_ANSWER = "Спасибо, разберёмся"
+SHOWN_ERRORS = 5
+
+# Вид апдейта, который сейчас обрабатывается в этой задаче, — для подсчёта ошибок из логов
+_current_kind = contextvars.ContextVar("kind", default="other")
+
+
+def user_flow(rnd):
+    """Шаги формы одного пользователя по случайной ветке; None — отправка файла."""
+    text = "Текст обращения " * rnd.randint(1, 30)
+    branch = rnd.choice(["manager", "anonymous", "file", "director"])
+    if branch == "manager":
+        steps = ["👨‍💼 Задать вопрос руководителю", rnd.choice(config.MANAGERS), "Иван Петров", "Инженер", text, NO_TEXT]
+    elif branch == "anonymous":
+        steps = ["💡 Предложить идею", ANONYMOUS_TEXT, "Не хочу раскрываться", text, NO_TEXT]
+    elif branch == "file":
+        steps = ["📢 Общий вопрос", "Мария", "Бухгалтер", text, None]
+    else:
+        steps = ["📝 Написать генеральному директору", "Олег", "Менеджер", text, NO_TEXT]
+    return ["/start", *steps]
+
+
+def seed(path, rows, rnd):
+    conn = database.connect(path)
+    database._init_db(conn)
+    with conn:
+        for i in range(rows):
+            text = "Старое обращение " * rnd.randint(1, 20)
+            database._insert_message(conn, {
+                "user_id": FIRST_USER_ID + rnd.randrange(rows), "type": rnd.choice(TYPES),
+                "message": text, "name": "Сотрудник", "position": "Должность", "recipient": "",
+            }, fingerprint(text))
+    conn.close()
+
+
+class Recorder(logging.Handler):
+    """Задержки по видам апдейтов и ошибки: исключения обработчиков и записи лога уровня ERROR."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.messages = []
+
+    def emit(self, record):
+        self.errors[_current_kind.get()] += 1
+        if len(self.messages) < SHOWN_ERRORS:
+            self.messages.append(record.getMessage())
+
+    async def feed(self, dp, bot, kind, update):
+        token = _current_kind.set(kind)
+        started = time.perf_counter()
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            self.errors[kind] += 1
+            if len(self.messages) < SHOWN_ERRORS:
+                self.messages.append(f"{type(e).__name__}: {e}")
+        finally:
+            self.latencies[kind].append(time.perf_counter() - started)
+            _current_kind.reset(token)
+
+
+def percentiles(values):
+    values = sorted(values)
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))] * 1000  # noqa: E731
+    return {"count": len(values), "p50_ms": pick(0.5), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+            "max_ms": values[-1] * 1000}
+
+
+async def run_users(dp, bot, recorder, users, concurrency, rnd):
+    semaphore = asyncio.Semaphore(concurrency)
+    flows = [(FIRST_USER_ID + n, user_flow(rnd)) for n in range(users)]
+
+    async def simulate(user_id, steps):
+        async with semaphore:
+            for step in steps:
+                update = document_update(user_id) if step is None else message_update(user_id, step)
+                await recorder.feed(dp, bot, "form", update)
+
+    await asyncio.gather(*(simulate(user_id, steps) for user_id, steps in flows))
+
+
+async def run_admins(dp, bot, recorder, cycles, rnd, answered):
+    from admin import InboxItem
+
+    async def admin_loop(admin_id):
+        for _ in range(cycles):
+            await recorder.feed(dp, bot, "admin", message_update(admin_id, "/admin", chat_type="group"))
+            rows, _ = await database.get_messages_page(status=database.STATUS_PENDING, limit=10)
+            if not rows:
+                continue
+            msg_id = rnd.choice(rows)[0]
+            await recorder.feed(dp, bot, "admin", callback_update(admin_id, InboxItem(id=msg_id).pack(),
+                                                                  chat_type="group"))
+            await recorder.feed(dp, bot, "admin", message_update(admin_id, ADMIN_ANSWER, chat_type="group"))
+            answered.add(msg_id)
+
+    await asyncio.gather(*(admin_loop(admin_id) for admin_id in ADMIN_IDS))
+
+
+def check_database(expected_rows, answered):
+    """Расхождения итогового содержимого БД с тем, что отправили пользователи и админы."""
+    conn = database.connect()
+    try:
+        rows = sum(conn.execute(f"SELECT COUNT(*) FROM {schema}.messages").fetchone()[0]
+                   for schema in ("main", "archive"))
+        with_answer = {row[0] for schema in ("main", "archive") for row in conn.execute(
+            f"SELECT id FROM {schema}.messages_readable WHERE answer = ? AND status = ?",
+            (ADMIN_ANSWER, database.STATUS_ANSWERED))}
+    finally:
+        conn.close()
+    problems = []
+    if rows != expected_rows:
+        problems.append(f"обращений в БД {rows}, ожидалось {expected_rows}")
+    if with_answer != answered:
+        problems.append(f"отвечено {len(with_answer)} обращений, ожидалось {len(answered)} "
+                        f"(без ответа: {sorted(answered - with_answer)[:10]})")
+    return problems
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(result, previous_path):
+    previous = json.loads(Path(previous_path).read_text())
+    print(f"\nСравнение с {previous_path} ({previous['commit']}):")
+    old, new = previous["throughput_ups"], result["throughput_ups"]
+    print(f"  пропускная способность: {old:.0f} -> {new:.0f} апд/с ({(new / old - 1) * 100:+.1f}%)")
+    for kind, stats in result["latency"].items():
+        if kind in previous["latency"]:
+            old, new = previous["latency"][kind]["p95_ms"], stats["p95_ms"]
+            print(f"  {kind} p95: {old:.2f} -> {new:.2f} мс ({(new / old - 1) * 100:+.1f}%)")
+    old, new = previous["peak_memory_mb"], result["peak_memory_mb"]
+    if old and new:
+        print(f"  пик памяти: {old:.1f} -> {new:.1f} МБ")
+
+
+async def main(args):
+    rnd = random.Random(args.random_seed)
+    if args.compare:
+        args.compare = str(Path(args.compare).resolve())   # до смены рабочей папки
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)   # uploads/ и exports/ — во временной папке
+    database.DB_NAME = str(Path(workdir) / "messages.db")
+    config.ADMINS[:] = ADMIN_IDS
+
+    started = time.perf_counter()
+    seed(database.DB_NAME, args.seed, rnd)
+    print(f"БД: {args.seed} обращений за {time.perf_counter() - started:.1f} с ({workdir})")
+
+    import handlers
+    import admin
+
+    storage = SQLiteStorage()
+    dp = Dispatcher(storage=storage)
+    dp.include_router(handlers.router)
+    dp.include_router(admin.router)
+    bot = make_bot()
+    recorder = Recorder()
+    logging.getLogger().addHandler(recorder)
+    answered = set()
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    started = time.perf_counter()
+    await asyncio.gather(
+        run_users(dp, bot, recorder, args.users, args.concurrency, rnd),
+        run_admins(dp, bot, recorder, args.admin_cycles, rnd, answered),
+    )
+    for _ in range(args.exports):
+        await recorder.feed(dp, bot, "export", message_update(ADMIN_IDS[0], "/export csv", chat_type="group"))
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1] / 2**20 if args.tracemalloc else None
+    tracemalloc.stop()
+
+    await storage.close()
+    database.close_db()
+    logging.getLogger().removeHandler(recorder)
+    problems = check_database(args.seed + args.users, answered)
+
+    total = sum(len(v) for v in recorder.latencies.values())
+    result = {
+        "commit": git_commit(),
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "params": vars(args),
+        "updates": total,
+        "elapsed_s": elapsed,
+        "throughput_ups": total / elapsed,
+        "latency": {kind: percentiles(values) for kind, values in recorder.latencies.items()},
+        "peak_memory_mb": peak,
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "api_calls": dict(bot.session.calls),
+    }
+
+    print(f"Апдейтов: {total} за {elapsed:.2f} с — {result['throughput_ups']:.0f} апд/с")
+    for kind, stats in result["latency"].items():
+        print(f"  {kind:7} n={stats['count']:6}  p50 {stats['p50_ms']:7.2f}  p95 {stats['p95_ms']:7.2f}  "
+              f"p99 {stats['p99_ms']:7.2f}  max {stats['max_ms']:8.2f} мс")
+    if peak is not None:
+        print(f"Пик памяти Python (tracemalloc): {peak:.1f} МБ")
+    print(f"Max RSS: {result['max_rss_mb']:.1f} МБ")
+
+    if recorder.errors or problems:
+        print("\nПрогон не засчитан, результат не сохранён:")
+        for kind, count in recorder.errors.items():
+            print(f"  ошибок в {kind}: {count}")
+        for message in recorder.messages:
+            print(f"    {message}")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+
+    RESULTS_DIR.mkdir(exist_ok=True)
+    out = RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}-{result['commit']}.json"
+    out.write_text(json.dumps(result, ensure_ascii=False, indent=2))
+    print(f"Результат: {out}")
+    if args.compare:
+        compare(result, args.compare)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочный тест формы обратной связи")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200, help="пользователей одновременно")
+    parser.add_argument("--seed", type=int, default=10000, help="обращений в БД до начала теста")
+    parser.add_argument("--admin-cycles", type=int, default=50, help="циклов /admin → ответ на админа")
+    parser.add_argument("--exports", type=int, default=1)
+    parser.add_argument("--random-seed", type=int, default=1)
+    parser.add_argument("--no-tracemalloc", dest="tracemalloc", action="store_false",
+                        help="не считать пик памяти (tracemalloc замедляет прогон)")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    asyncio.run(main(parser.parse_args()))
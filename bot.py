@@ -1,27 +1,137 @@
 import asyncio
+from functools import partial
 from aiogram import Bot, Dispatcher
 from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer, PRODUCTION
+from aiogram.fsm.storage.memory import MemoryStorage
 
-from config import TOKEN, PROXY_URL
-from database import init_db
-from handlers import router as user_router
+from config import (
+    TOKEN, PROXY_URL, TELEGRAM_API_URL, BOT_MODE, WORKERS,
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_MAX_CONCURRENCY,
+    METRICS_HOST, METRICS_PORT, ARCHIVE_AFTER_DAYS
+)
+from archive import Archiver
+from database import backfill_fingerprints, init_db, close_db
+from export import SnapshotJob
+from handlers import Form, router as user_router
 from admin import router as admin_router
+from logs import LogContextMiddleware, setup_logging
+from metrics import ApiMetricsMiddleware, HandlerMetricsMiddleware, start_metrics_server
+from notify import OutboxScheduler
+from storage import SQLiteStorage
+from throttle import ThrottleMiddleware
+from webhook import check_webhook_config, run_webhook
+from workers import WorkerPool, run_sharded_polling
 
 
-async def main():
+def create_bot() -> Bot:
+    api = TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else PRODUCTION
     if PROXY_URL:
-        session = AiohttpSession(proxy=PROXY_URL)
-        bot = Bot(token=TOKEN, session=session)
+        session = AiohttpSession(proxy=PROXY_URL, api=api)
     else:
-        bot = Bot(token=TOKEN)
+        session = AiohttpSession(api=api)
+    session.middleware(ApiMetricsMiddleware())
+    return Bot(token=TOKEN, session=session)
+
 
-    dp = Dispatcher()
+def create_dispatcher(storage) -> Dispatcher:
+    dp = Dispatcher(storage=storage)
+    # После встроенных FSM-middleware (нужно состояние), до роутеров
+    dp.update.outer_middleware(LogContextMiddleware())
+    dp.update.outer_middleware(ThrottleMiddleware(expensive_states={Form.uploading_file.state}))
+    # Внутренние middleware диспетчера действуют на хендлеры всех вложенных роутеров
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
     dp.include_router(user_router)
     dp.include_router(admin_router)
+    return dp
+
+
+async def run_with_workers(bot: Bot):
+    """Приёмник апдейтов + WORKERS процессов-обработчиков (см. workers.py)."""
+    pool = WorkerPool(WORKERS)
+    allowed_updates = create_dispatcher(MemoryStorage()).resolve_used_update_types()
+    if BOT_MODE == "webhook":
+        pool.start()
+        supervisor = asyncio.create_task(pool.supervise())
+
+        async def feed(update):
+            pool.dispatch(update)
+
+        try:
+            await run_webhook(
+                bot, feed,
+                url=WEBHOOK_URL, path=WEBHOOK_PATH, host=WEBHOOK_HOST, port=WEBHOOK_PORT,
+                secret=WEBHOOK_SECRET, max_concurrency=WEBHOOK_MAX_CONCURRENCY,
+                allowed_updates=allowed_updates,
+            )
+        finally:
+            supervisor.cancel()
+            await pool.stop()
+    else:
+        await run_sharded_polling(bot, pool, allowed_updates)
+
+
+async def main():
+    setup_logging()
+    if BOT_MODE == "webhook":
+        # До запуска фоновых задач: без секрета webhook-сервер принимал бы чужие апдейты
+        check_webhook_config(WEBHOOK_URL, WEBHOOK_SECRET)
+    bot = create_bot()
+    await init_db()
+    # Очередь исходящих разбирает только этот процесс, воркеры лишь пополняют её
+    outbox = OutboxScheduler(bot)
+    outbox.start()
+    snapshots = SnapshotJob()
+    snapshots.start()
+    archiver = Archiver()
+    if ARCHIVE_AFTER_DAYS:
+        archiver.start()
+    # Индекс похожих обращений догоняет messages пачками, не задерживая запуск
+    backfill = asyncio.create_task(backfill_fingerprints())
+    metrics_runner = await start_metrics_server(METRICS_HOST, METRICS_PORT) if METRICS_PORT else None
+
+    if WORKERS > 1:
+        try:
+            await run_with_workers(bot)
+        finally:
+            await outbox.stop()
+            await snapshots.stop()
+            await archiver.stop()
+            backfill.cancel()
+            await asyncio.gather(backfill, return_exceptions=True)
+            if metrics_runner:
+                await metrics_runner.cleanup()
+            close_db()
+        return
 
-    init_db()
+    storage = SQLiteStorage()
+    dp = create_dispatcher(storage)
 
-    await dp.start_polling(bot)
+    try:
+        if BOT_MODE == "webhook":
+            await dp.emit_startup(bot=bot)
+            try:
+                await run_webhook(
+                    bot, partial(dp.feed_update, bot),
+                    url=WEBHOOK_URL, path=WEBHOOK_PATH, host=WEBHOOK_HOST, port=WEBHOOK_PORT,
+                    secret=WEBHOOK_SECRET, max_concurrency=WEBHOOK_MAX_CONCURRENCY,
+                    allowed_updates=dp.resolve_used_update_types(),
+                )
+            finally:
+                await dp.emit_shutdown(bot=bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await outbox.stop()
+        await snapshots.stop()
+        await archiver.stop()
+        backfill.cancel()
+        await asyncio.gather(backfill, return_exceptions=True)
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await storage.close()
+        close_db()
 
 
 if __name__ == "__main__":
@@ -19,3 +19,54 @@ MANAGERS = [
     "Лукьянчук Татьяна",
     "Курдюмова Мария/Новосельцева Наталья"
 ]
+
+# Число потоков (и соединений SQLite) в пуле database.py
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+# Кэш чтений database.py: записей в каждом кэше (0 — выключен) и срок их жизни, секунды
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "1000"))
+DB_CACHE_TTL = float(os.getenv("DB_CACHE_TTL", "60"))
+# Архив (archive.py): отвеченные обращения, не менявшиеся ARCHIVE_AFTER_DAYS дней,
+# переносятся в отдельный файл БД пачками по ARCHIVE_BATCH_SIZE раз в ARCHIVE_INTERVAL секунд
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))   # 0 — не архивировать
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "500"))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+
+# Адрес Bot API (например, локального сервера или тестовой заглушки); по умолчанию api.telegram.org
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+
+# Вложения: максимальный размер, размер куска при скачивании и число одновременных скачиваний
+MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", str(20 * 1024 * 1024)))
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(64 * 1024)))
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv("MAX_CONCURRENT_DOWNLOADS", "4"))
+
+# Режим получения апдейтов: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")          # публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", os.getenv("PORT", "8080")))
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", "100"))
+
+# Число процессов-обработчиков апдейтов (0 или 1 — всё в одном процессе, см. workers.py)
+WORKERS = int(os.getenv("WORKERS", "0"))
+
+# Метрики в формате Prometheus на http://METRICS_HOST:METRICS_PORT/metrics (0 — выключено)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+
+# Логи: JSON-строки в LOG_FILE с ротацией по размеру (size) или времени (time, см. LOG_WHEN)
+LOG_FILE = os.getenv("LOG_FILE", "bot.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_ROTATION = os.getenv("LOG_ROTATION", "size")
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_WHEN = os.getenv("LOG_WHEN", "midnight")
+LOG_BACKUPS = int(os.getenv("LOG_BACKUPS", "7"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "") == "1"
+# Доля записываемых частых событий или логгеров, например "file_saved=0.1,aiogram.event=0.01"
+LOG_SAMPLING = {
+    name: float(rate)
+    for name, _, rate in (item.partition("=") for item in os.getenv("LOG_SAMPLING", "").split(","))
+    if rate
+}
@@ -1,112 +1,1025 @@
+import asyncio
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import pandas as pd
-import os
+from pathlib import Path
+
+from config import DB_POOL_SIZE, DB_CACHE_SIZE, DB_CACHE_TTL, WORKERS
+from dedup import fingerprint, record_fingerprint
+from metrics import observe
+from migrations import ARCHIVE_MIGRATIONS, apply_migrations, sync_message_sequence
+from stats import record_created, record_status_change, collect_stats
 
 DB_NAME = "messages.db"
 
+STATUS_PENDING = "Ожидает ответа"
+STATUS_ANSWERED = "✅ Ответ отправлен"
 
-def init_db():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS messages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            type TEXT,
-            message TEXT,
-            name TEXT,
-            position TEXT,
-            is_anonymous INTEGER,
-            reason TEXT,
-            file_path TEXT,
-            status TEXT DEFAULT 'Ожидает ответа',
-            answer TEXT DEFAULT '',
-            created_at TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
+SEARCH_CANDIDATES = 500
+
+# Колонки messages в порядке схемы; у archive.messages они те же. В таблице
+# статус и тип хранятся кодами, время — секундами Unix (формат v2, см.
+# migrations._compact_encoding); запросы читают представление messages_readable,
+# где у этих колонок прежние значения — строки
+MESSAGE_COLUMNS = (
+    "id", "user_id", "type", "message", "name", "position", "is_anonymous", "reason", "file_path",
+    "status", "answer", "created_at", "recipient", "answered_at", "change_seq", "updated_at"
+)
+
+OUTBOX_PENDING = "pending"
+OUTBOX_SENT = "sent"
+OUTBOX_DEAD = "dead"
+
+# Групповая фиксация записей: сколько операций в одной транзакции и сколько
+# ждать попутчиков для первой операции пачки
+WRITE_BATCH_SIZE = 100
+WRITE_BATCH_DELAY = 0.002
+
+# Фоновое заполнение индекса dedup (backfill_fingerprints): обращений за
+# транзакцию и пауза между пачками
+FINGERPRINT_BATCH = 500
+FINGERPRINT_PAUSE = 0.05
+
+# Каждый поток пула держит своё долгоживущее соединение (WAL позволяет
+# читать параллельно с записью), запросы выполняются вне event loop.
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="db")
+# Все записи через write_queue идут из одного потока-писателя
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+
+
+class LRUCache:
+    """Кэш ограниченного размера (вытесняется давно не использованное) со сроком жизни записей."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return _MISS
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def put(self, key, value):
+        if not self.maxsize:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_MISS = object()
+
+# Кэш чтений: карточки обращений, страницы истории пользователей и админки.
+# Сбрасывается записями этого процесса, поэтому при WORKERS > 1 (у каждого
+# процесса своя копия, а ответ админа пишет другой процесс) он выключен.
+_cache_size = DB_CACHE_SIZE if WORKERS <= 1 else 0
+_records = LRUCache(_cache_size, DB_CACHE_TTL)
+_histories = LRUCache(_cache_size, DB_CACHE_TTL)
+_inbox = LRUCache(_cache_size, DB_CACHE_TTL)
+# Поколения входят в ключи: страница, прочитанная до записи, кладётся под
+# старым ключом и больше никогда не будет выдана
+_user_generation = {}
+_generation = 0
+
+
+def _invalidate(message_id=None, user_id=None):
+    """Вызывается после COMMIT записи, меняющей обращение message_id пользователя user_id."""
+    global _generation
+    _generation += 1
+    if message_id is not None:
+        _records.pop(message_id)
+    if user_id is not None:
+        _user_generation[user_id] = _user_generation.get(user_id, 0) + 1
+    _inbox.clear()
+
+
+async def _read_through(cache, key, func, *args):
+    value = cache.get(key)
+    if value is not _MISS:
+        return value
+    generation = _generation
+    value = await run_in_db(func, *args)
+    # Пока шёл запрос, могла завершиться запись — тогда результат не кэшируем.
+    # «Нет такого обращения» тоже не кэшируем: id может появиться следующей вставкой
+    if value is not None and generation == _generation:
+        cache.put(key, value)
+    return value
+
+
+def cache_stats():
+    """{имя кэша: (попаданий, промахов, записей)}."""
+    return {
+        name: (cache.hits, cache.misses, len(cache))
+        for name, cache in (("records", _records), ("histories", _histories), ("inbox", _inbox))
+    }
+
+
+def archive_path(db_name):
+    """Файл архива рядом с основной БД: messages.db -> messages.archive.db."""
+    if db_name == ":memory:":
+        return db_name
+    path = Path(db_name)
+    return str(path.with_name(f"{path.stem}.archive{path.suffix}"))
+
+
+def connect(db_name=None):
+    db_name = db_name or DB_NAME
+    conn = sqlite3.connect(db_name, timeout=30, check_same_thread=False)
+    # Архив подключён к каждому соединению как schema archive: общие чтения
+    # и перенос строк — обычные запросы одного соединения
+    conn.execute("ATTACH DATABASE ? AS archive", (archive_path(db_name),))
+    # auto_vacuum действует только на новый файл (до WAL и первой таблицы):
+    # место от перенесённых в архив строк возвращает incremental_vacuum
+    for schema in ("main", "archive"):
+        conn.execute(f"PRAGMA {schema}.auto_vacuum = INCREMENTAL")
+        conn.execute(f"PRAGMA {schema}.journal_mode=WAL")
+    return conn
+
+
+def _get_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = connect()
+        _local.conn = conn
+        with _connections_lock:
+            _connections.append(conn)
+    return conn
+
+
+def _call(func, args):
+    return func(_get_connection(), *args)
+
+
+async def run_in_db(func, *args):
+    """
+    Выполняет func(conn, *args) в пуле потоков БД и возвращает результат.
+    """
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, _call, func, args)
+    finally:
+        observe("db_seconds", time.perf_counter() - started, query=func.__name__.lstrip("_"))
+
+
+def _commit_batch(conn, ops):
+    """
+    Выполняет пачку операций одной транзакцией. Каждая операция — в своём
+    SAVEPOINT: ошибка откатывает только её, остальные фиксируются.
+    """
+    results = []
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for func, args in ops:
+            conn.execute("SAVEPOINT op")
+            try:
+                results.append((func(conn, *args), None))
+            except Exception as e:
+                conn.execute("ROLLBACK TO op")
+                results.append((None, e))
+            conn.execute("RELEASE op")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return results
+
+
+class WriteQueue:
+    """
+    Один асинхронный писатель: собирает операции func(conn, *args) от всех
+    корутин и фиксирует их пачками — по WRITE_BATCH_SIZE или, под нагрузкой,
+    через WRITE_BATCH_DELAY после первой. submit возвращается только после COMMIT,
+    так что надёжность та же, что у отдельной транзакции на каждую запись.
+    Операции не должны сами открывать или фиксировать транзакцию.
+    """
+
+    def __init__(self, batch_size=WRITE_BATCH_SIZE, delay=WRITE_BATCH_DELAY):
+        self.batch_size = batch_size
+        self.delay = delay
+        self._pending = []
+        self._full = None
+        self._task = None
+
+    async def submit(self, func, *args):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((func, args, future))
+        if self._full and len(self._pending) >= self.batch_size:
+            self._full.set()
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        started = time.perf_counter()
+        try:
+            return await future
+        finally:
+            observe("db_seconds", time.perf_counter() - started, query=func.__name__.lstrip("_"))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        burst = False
+        while self._pending:
+            # Даём сразу же поставить в очередь тем, кто уже готов. Ждать
+            # дедлайн имеет смысл только под нагрузкой — одиночная запись
+            # фиксируется без задержки
+            await asyncio.sleep(0)
+            if burst and len(self._pending) < self.batch_size:
+                self._full = asyncio.Event()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._full = None
+
+            batch = self._pending[:self.batch_size]
+            del self._pending[:self.batch_size]
+            burst = len(batch) > 1 or bool(self._pending)
+            ops = [(func, args) for func, args, _ in batch]
+            try:
+                results = await loop.run_in_executor(_writer, _call, _commit_batch, (ops,))
+            except Exception as e:
+                results = [(None, e)] * len(batch)
+
+            for (_, _, future), (result, error) in zip(batch, results):
+                if future.done():
+                    continue  # вызывающий уже отменён
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+
+write_queue = WriteQueue()
+
+
+def close_db():
+    _writer.shutdown(wait=True)
+    _executor.shutdown(wait=True)
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+
+
+def _init_db(conn):
+    apply_migrations(conn)
+    # Архив — после основной схемы: его миграции опираются на её справочники
+    apply_migrations(conn, migrations=ARCHIVE_MIGRATIONS, schema="archive")
+    # Счётчик id мог отстать от архива (файлы, перенесённые по отдельности,
+    # или БД, обновлённая до v2 без сохранения счётчика)
+    with conn:
+        sync_message_sequence(conn)
+
+
+async def init_db():
+    await run_in_db(_init_db)
 
 
-def insert_message(data):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
+def _code(conn, table, name):
+    """Код значения из справочника message_statuses / message_types; новое значение добавляется."""
+    row = conn.execute(f"SELECT code FROM main.{table} WHERE name = ?", (name,)).fetchone()
+    if row:
+        return row[0]
+    return conn.execute(f"INSERT INTO main.{table} (name) VALUES (?)", (name,)).lastrowid
+
+
+def _insert_message(conn, data, fp):
+    # fp — dedup.fingerprint(data["message"]), посчитанный до транзакции
+    now = datetime.now().replace(microsecond=0)
+    created_at = now.strftime("%Y-%m-%d %H:%M:%S")
+    cursor = conn.execute("""
         INSERT INTO messages (
             user_id, type, message, name, position,
-            is_anonymous, reason, file_path, status, answer, created_at
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            is_anonymous, reason, file_path, status, answer, created_at, recipient
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     """, (
         data["user_id"],
-        data["type"],
+        _code(conn, "message_types", data["type"]),
         data["message"],
         data["name"],
         data["position"],
         data.get("is_anonymous", 0),
         data.get("reason", ""),
         data.get("file_path"),
-        "Ожидает ответа",
+        _code(conn, "message_statuses", STATUS_PENDING),
         "",
-        datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        int(now.timestamp()),
+        data.get("recipient", "")
     ))
-    conn.commit()
-    last_id = cursor.lastrowid
-    conn.close()
-    return last_id
-
-
-def get_user_messages(user_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, type, message, status, answer
-        FROM messages
-        WHERE user_id = ?
-        ORDER BY created_at DESC
-    """, (user_id,))
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    record_created(conn, data["type"], STATUS_PENDING, data.get("recipient", ""), created_at)
+    record_fingerprint(conn, cursor.lastrowid, fp)
+    return cursor.lastrowid
+
+
+async def insert_message(data):
+    # Отпечаток считается здесь, а не в потоке-писателе: иначе он держал бы всю пачку
+    message_id = await write_queue.submit(_insert_message, data, fingerprint(data["message"]))
+    _invalidate(user_id=data["user_id"])
+    return message_id
+
+
+def _get_user_messages_page(conn, user_id, cursor_id, limit, preview_len):
+    # Страница собирается из живой таблицы и архива: по limit + 1 строк из каждой
+    part = """
+        SELECT * FROM (
+            SELECT id, type, substr(message, 1, ?), length(message) > ?, status, answer != '', created_ts
+            FROM {schema}.messages_readable
+            WHERE user_id = ?{cursor}
+            ORDER BY created_ts DESC, id DESC LIMIT ?
+        )
+    """
+    params = [preview_len, preview_len, user_id]
+    cursor = ""
+    if cursor_id:
+        anchor = _get_created_ts(conn, cursor_id)
+        if anchor is None:
+            return [], False
+        cursor = " AND (created_ts, id) < (?, ?)"
+        params += [anchor, cursor_id]
+    params.append(limit + 1)
+    sql = (part.format(schema="main", cursor=cursor) + " UNION ALL " + part.format(schema="archive", cursor=cursor)
+           + " ORDER BY 7 DESC, 1 DESC LIMIT ?")
+    rows = conn.execute(sql, params * 2 + [limit + 1]).fetchall()
+    return [row[:6] for row in rows[:limit]], len(rows) > limit
+
+
+async def get_user_messages_page(user_id, cursor_id=None, limit=10, preview_len=200):
+    """
+    Страница истории пользователя (от новых к старым), keyset-пагинация по (created_at, id).
+    Строки: (id, type, начало текста, текст обрезан, status, есть ответ).
+    Возвращает (rows, has_more).
+    """
+    key = (user_id, _user_generation.get(user_id, 0), cursor_id, limit, preview_len)
+    return await _read_through(_histories, key, _get_user_messages_page, user_id, cursor_id, limit, preview_len)
+
+
+def _get_created_ts(conn, message_id):
+    for schema in ("main", "archive"):
+        row = conn.execute(f"SELECT created_at FROM {schema}.messages WHERE id = ?", (message_id,)).fetchone()
+        if row:
+            return row[0]
+    return None
+
 
+def _get_message_by_id(conn, message_id):
+    for schema in ("main", "archive"):
+        row = conn.execute(
+            f"SELECT {', '.join(MESSAGE_COLUMNS)} FROM {schema}.messages_readable WHERE id = ?", (message_id,)
+        ).fetchone()
+        if row:
+            return row
+    return None
 
-def get_message_by_id(message_id):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM messages WHERE id = ?", (message_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
 
+async def get_message_by_id(message_id):
+    return await _read_through(_records, message_id, _get_message_by_id, message_id)
 
-def update_status_and_response(message_id, status, answer):
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
+
+def _update_status_and_response(conn, message_id, status, answer):
+    now = datetime.now().replace(microsecond=0)
+    if not _restore_message(conn, message_id):
+        return None
+    row = conn.execute("""
+        SELECT type, recipient, status, created_at, answered_at, user_id FROM main.messages_readable WHERE id = ?
+    """, (message_id,)).fetchone()
+    msg_type, recipient, old_status, created_at, answered_at, user_id = row
+    # Время первого ответа не перезаписываем при повторных ответах
+    first_answer = now.strftime("%Y-%m-%d %H:%M:%S") if status != STATUS_PENDING and not answered_at else None
+    conn.execute("""
         UPDATE messages
-        SET status = ?, answer = ?
+        SET status = ?, answer = ?, answered_at = COALESCE(answered_at, ?)
         WHERE id = ?
-    """, (status, answer, message_id))
-    conn.commit()
-    conn.close()
-
-
-def export_all_messages(file_path="exported_messages.xlsx"):
-    conn = sqlite3.connect(DB_NAME)
-    df = pd.read_sql_query("SELECT * FROM messages", conn)
-    conn.close()
-    df.to_excel(file_path, index=False)
-    return os.path.abspath(file_path)
-
-
-def get_all_messages():
-    conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT id, type, message, status
-        FROM messages
-        ORDER BY created_at DESC
-    """)
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    """, (_code(conn, "message_statuses", status), answer, int(now.timestamp()) if first_answer else None,
+          message_id))
+    record_status_change(conn, msg_type, recipient, old_status, status, STATUS_PENDING,
+                         created_at, first_answer)
+    return user_id
+
+
+async def update_status_and_response(message_id, status, answer):
+    user_id = await write_queue.submit(_update_status_and_response, message_id, status, answer)
+    _invalidate(message_id, user_id)
+
+
+# Колонки экспорта: всё, кроме служебного change_seq
+EXPORT_COLUMNS = tuple(column for column in MESSAGE_COLUMNS if column != "change_seq")
+
+
+def _unified(select, where="", params=()):
+    """Один запрос по живой таблице и архиву: (sql, params) для UNION ALL двух частей."""
+    sql = f"{select} FROM main.messages_readable{where} UNION ALL {select} FROM archive.messages_readable{where}"
+    return sql, list(params) * 2
+
+
+def _ts(moment):
+    return int(moment.timestamp())
+
+
+def _export_where(date_from, date_to, status, since=None):
+    where, params = [], []
+    if date_from:
+        where.append("created_ts >= ?")
+        params.append(_ts(date_from))
+    if date_to:
+        where.append("created_ts < ?")
+        params.append(_ts(date_to))
+    if status:
+        where.append("status_code = (SELECT code FROM main.message_statuses WHERE name = ?)")
+        params.append(status)
+    if since:
+        # Созданные или изменённые начиная с since
+        where.append("updated_ts >= ?")
+        params.append(_ts(since))
+    return (" WHERE " + " AND ".join(where) if where else ""), params
+
+
+def count_export_rows(conn, date_from=None, date_to=None, status=None, since=None):
+    sql, params = _unified("SELECT COUNT(*)", *_export_where(date_from, date_to, status, since))
+    return sum(count for count, in conn.execute(sql, params))
+
+
+def open_export_cursor(conn, date_from=None, date_to=None, status=None, since=None):
+    """
+    Курсор по обращениям для экспорта (в порядке id). Читать через fetchmany,
+    чтобы не держать всю таблицу в памяти; названия колонок — в cursor.description.
+    Синхронная функция: вызывать из рабочего потока со своим соединением.
+    """
+    sql, params = _unified(f"SELECT {', '.join(EXPORT_COLUMNS)}", *_export_where(date_from, date_to, status, since))
+    return conn.execute(sql + " ORDER BY id", params)
+
+
+def current_change_seq(conn):
+    """Номер последнего изменения messages (см. миграцию _add_change_tracking)."""
+    return conn.execute("SELECT value FROM sequences WHERE name = 'messages'").fetchone()[0]
+
+
+def max_export_id(conn):
+    """Наибольший id среди строк экспорта — в messages и в архиве."""
+    sql, params = _unified("SELECT MAX(id)")
+    return max((row[0] for row in conn.execute(sql, params) if row[0] is not None), default=0)
+
+
+def fetch_changes(conn, after_seq):
+    """Строки экспорта, созданные или изменённые после after_seq, в порядке id."""
+    # Строку могли изменить и сразу унести в архив — смотрим и туда
+    sql, params = _unified(f"SELECT {', '.join(EXPORT_COLUMNS)}", " WHERE change_seq > ?", (after_seq,))
+    return conn.execute(sql + " ORDER BY id", params).fetchall()
+
+
+def load_snapshot(conn, fmt):
+    """(path, change_seq, max_id, rows, created_at) готового файла экспорта или None."""
+    return conn.execute("""
+        SELECT path, change_seq, max_id, rows, created_at FROM export_snapshots WHERE format = ?
+    """, (fmt,)).fetchone()
+
+
+def save_snapshot(conn, fmt, path, change_seq, max_id, rows):
+    with conn:
+        conn.execute("""
+            INSERT OR REPLACE INTO export_snapshots (format, path, change_seq, max_id, rows, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (fmt, str(path), change_seq, max_id, rows, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+
+def _get_messages_page(conn, cursor_id, newer, limit, status, msg_type):
+    where, params = [], []
+    if status:
+        where.append("status_code = (SELECT code FROM message_statuses WHERE name = ?)")
+        params.append(status)
+    if msg_type:
+        where.append("type_code = (SELECT code FROM message_types WHERE name = ?)")
+        params.append(msg_type)
+    if cursor_id:
+        op = ">" if newer else "<"
+        where.append(f"(created_ts, id) {op} (SELECT created_at, id FROM messages WHERE id = ?)")
+        params.append(cursor_id)
+    order = "ASC" if newer else "DESC"
+    sql = "SELECT id, type, message, status FROM messages_readable"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY created_ts {order}, id {order} LIMIT ?"
+    params.append(limit + 1)
+    rows = conn.execute(sql, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if newer:
+        rows.reverse()
+    return rows, has_more
+
+
+async def get_messages_page(cursor_id=None, newer=False, limit=10, status=None, msg_type=None):
+    """
+    Страница обращений для админки (от новых к старым), keyset-пагинация по (created_at, id).
+    cursor_id — id крайнего обращения предыдущей страницы, newer — листать к более новым.
+    Возвращает (rows, has_more), где has_more — есть ли ещё строки в направлении листания.
+    """
+    key = (cursor_id, newer, limit, status, msg_type)
+    return await _read_through(_inbox, key, _get_messages_page, cursor_id, newer, limit, status, msg_type)
+
+
+def _enqueue_outbox(conn, items):
+    created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    now = time.time()
+    conn.executemany("""
+        INSERT INTO outbox (
+            message_id, chat_id, kind, text, file_id, file_path,
+            status, next_attempt_at, created_at
+        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [(*item, OUTBOX_PENDING, now, created_at) for item in items])
+
+
+async def enqueue_outbox(items):
+    """items: список (message_id, chat_id, kind, text, file_id, file_path)."""
+    if items:
+        await write_queue.submit(_enqueue_outbox, items)
+
+
+def _fetch_due_outbox(conn, now, limit):
+    # Только первое неотправленное сообщение каждого чата — порядок внутри чата сохраняется
+    return conn.execute("""
+        SELECT id, message_id, chat_id, kind, text, file_id, file_path, attempts
+        FROM outbox AS o
+        WHERE status = 'pending' AND next_attempt_at <= ?
+          AND NOT EXISTS (
+              SELECT 1 FROM outbox AS p
+              WHERE p.chat_id = o.chat_id AND p.status = 'pending' AND p.id < o.id
+          )
+        ORDER BY next_attempt_at
+        LIMIT ?
+    """, (now, limit)).fetchall()
+
+
+async def fetch_due_outbox(now, limit=50):
+    """Строки: (id, message_id, chat_id, kind, text, file_id, file_path, attempts)."""
+    return await run_in_db(_fetch_due_outbox, now, limit)
+
+
+def _next_outbox_at(conn):
+    return conn.execute("""
+        SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'
+    """).fetchone()[0]
+
+
+async def next_outbox_at():
+    """Время ближайшей попытки отправки или None, если очередь пуста."""
+    return await run_in_db(_next_outbox_at)
+
+
+def _record_outbox_attempt(conn, outbox_id, status, attempts, error, retry_at, file_id):
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn.execute("""
+        UPDATE outbox
+        SET status = ?, attempts = ?, last_error = ?,
+            next_attempt_at = COALESCE(?, next_attempt_at),
+            sent_at = CASE WHEN ? = 'sent' THEN ? END
+        WHERE id = ?
+    """, (status, attempts, error, retry_at, status, now, outbox_id))
+    conn.execute("""
+        INSERT INTO deliveries (message_id, chat_id, error, created_at, outbox_id)
+        SELECT message_id, chat_id, ?, ?, id FROM outbox WHERE id = ?
+    """, (error, now, outbox_id))
+    if file_id:
+        # Файл загружен один раз — остальным получателям уходит его file_id
+        conn.execute("""
+            UPDATE outbox SET file_id = ?
+            WHERE file_path = (SELECT file_path FROM outbox WHERE id = ?)
+              AND file_id IS NULL AND status = 'pending'
+        """, (file_id, outbox_id))
+
+
+async def record_outbox_attempt(outbox_id, status, attempts, error=None, retry_at=None, file_id=None):
+    """
+    Результат попытки отправки: обновляет строку outbox и пишет попытку в deliveries.
+    file_id — полученный при загрузке локального файла.
+    """
+    await write_queue.submit(_record_outbox_attempt, outbox_id, status, attempts, error, retry_at, file_id)
+
+
+def _get_outbox_summary(conn, message_id, limit):
+    counts = dict(conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+    sql = """
+        SELECT id, message_id, chat_id, kind, status, attempts, last_error
+        FROM outbox
+    """
+    if message_id:
+        rows = conn.execute(sql + " WHERE message_id = ? ORDER BY id", (message_id,)).fetchall()
+    else:
+        rows = conn.execute(sql + " WHERE status = 'dead' ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return counts, rows
+
+
+async def get_outbox_summary(message_id=None, limit=10):
+    """
+    Число сообщений в очереди по статусам и строки (id, message_id, chat_id, kind,
+    status, attempts, last_error): все по обращению message_id либо последние недоставленные.
+    """
+    return await run_in_db(_get_outbox_summary, message_id, limit)
+
+
+def _requeue_dead_outbox(conn):
+    cursor = conn.execute("""
+        UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ?
+        WHERE status = 'dead'
+    """, (time.time(),))
+    return cursor.rowcount
+
+
+async def requeue_dead_outbox():
+    """Возвращает недоставленные сообщения в очередь; возвращает их число."""
+    return await write_queue.submit(_requeue_dead_outbox)
+
+
+def _purge_outbox(conn, older_than):
+    cursor = conn.execute("""
+        DELETE FROM outbox WHERE status = 'sent' AND sent_at < ?
+    """, (older_than,))
+    return cursor.rowcount
+
+
+async def purge_outbox(older_than):
+    """Удаляет отправленные сообщения старше older_than ("%Y-%m-%d %H:%M:%S")."""
+    return await write_queue.submit(_purge_outbox, older_than)
+
+
+def _load_fsm_record(conn, key):
+    return conn.execute("SELECT state, data FROM fsm_storage WHERE key = ?", (key,)).fetchone()
+
+
+async def load_fsm_record(key):
+    """Возвращает (state, data_json) или None."""
+    return await run_in_db(_load_fsm_record, key)
+
+
+def _save_fsm_records(conn, upserts, deletes):
+    now = time.time()
+    with conn:
+        conn.executemany("""
+            INSERT INTO fsm_storage (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE
+            SET state = excluded.state, data = excluded.data, updated_at = excluded.updated_at
+        """, [(key, state, data, now) for key, state, data in upserts])
+        conn.executemany("DELETE FROM fsm_storage WHERE key = ?", [(key,) for key in deletes])
+
+
+async def save_fsm_records(upserts, deletes):
+    """upserts: список (key, state, data_json); deletes: список key. Одной транзакцией."""
+    await run_in_db(_save_fsm_records, upserts, deletes)
+
+
+def _purge_fsm_records(conn, older_than):
+    with conn:
+        conn.execute("DELETE FROM fsm_storage WHERE updated_at < ?", (older_than,))
+
+
+async def purge_fsm_records(older_than):
+    await run_in_db(_purge_fsm_records, older_than)
+
+
+def _fts_query(text):
+    # Все слова обязательны; «слово*» — поиск по началу слова. Кавычки исключают синтаксис FTS5
+    terms = re.findall(r"(\w+)(\*?)", text)
+    return " ".join(f'"{term}"{star}' for term, star in terms)
+
+
+def _search_messages(conn, query, limit, offset):
+    match = _fts_query(query)
+    if not match:
+        return [], False
+    # Ранжируем только SEARCH_CANDIDATES самых свежих совпадений: для частых слов
+    # сортировка всех совпадений по релевантности на миллионах строк слишком дорогая.
+    # Живая таблица и архив ищутся отдельно, результаты сливаются по rank
+    rows = []
+    for schema in ("main", "archive"):
+        rows += conn.execute(f"""
+            SELECT m.id, m.type, m.status, snippet(messages_fts, -1, '«', '»', '…', 12), messages_fts.rank
+            FROM {schema}.messages_fts
+            JOIN {schema}.messages_readable m ON m.id = messages_fts.rowid
+            WHERE messages_fts MATCH :match AND messages_fts.rowid >= (
+                SELECT COALESCE(MIN(rowid), 0) FROM (
+                    SELECT rowid FROM {schema}.messages_fts WHERE messages_fts MATCH :match
+                    ORDER BY rowid DESC LIMIT :candidates
+                )
+            )
+            ORDER BY messages_fts.rank
+            LIMIT :limit
+        """, {"match": match, "candidates": SEARCH_CANDIDATES, "limit": limit + offset + 1}).fetchall()
+    rows.sort(key=lambda row: row[4])
+    rows = [row[:4] for row in rows[offset:offset + limit + 1]]
+    return rows[:limit], len(rows) > limit
+
+
+async def search_messages(query, limit=5, offset=0):
+    """
+    Полнотекстовый поиск по тексту, ответу, имени, должности и причине анонимности.
+    Строки: (id, type, status, фрагмент с подсветкой «»), по убыванию релевантности.
+    Возвращает (rows, has_more).
+    """
+    return await run_in_db(_search_messages, query, limit, offset)
+
+
+def _rebuild_search_index(conn):
+    with conn:
+        conn.execute("INSERT INTO main.messages_fts (messages_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO archive.messages_fts (messages_fts) VALUES ('rebuild')")
+
+
+async def rebuild_search_index():
+    await run_in_db(_rebuild_search_index)
+
+
+# --- Похожие обращения (dedup.py) ---
+
+def _get_clusters(conn, limit):
+    # Неотвеченные обращения — по индексу статуса; строка группы берётся у
+    # самого свежего обращения (MAX в SQLite возвращает колонки его строки)
+    return conn.execute("""
+        SELECT f.cluster_id, COUNT(*), SUM(NOT m.is_anonymous), MAX(m.created_at), m.message
+        FROM messages m
+        JOIN message_fingerprints f ON f.message_id = m.id
+        WHERE m.status = (SELECT code FROM message_statuses WHERE name = ?) AND f.cluster_id IS NOT NULL
+        GROUP BY f.cluster_id
+        HAVING COUNT(*) > 1
+        ORDER BY 4 DESC
+        LIMIT ?
+    """, (STATUS_PENDING, limit)).fetchall()
+
+
+async def get_clusters(limit=10):
+    """
+    Группы похожих неотвеченных обращений, от недавних к давним.
+    Строки: (cluster_id, обращений, из них не анонимных, время последнего (секунды Unix), текст последнего).
+    """
+    return await run_in_db(_get_clusters, limit)
+
+
+def _get_cluster(conn, cluster_id):
+    return conn.execute("""
+        SELECT m.id, m.user_id, m.is_anonymous, m.message
+        FROM message_fingerprints f
+        JOIN messages m ON m.id = f.message_id
+        WHERE f.cluster_id = ? AND m.status = (SELECT code FROM message_statuses WHERE name = ?)
+        ORDER BY m.id
+    """, (cluster_id, STATUS_PENDING)).fetchall()
+
+
+async def get_cluster(cluster_id):
+    """Неотвеченные обращения группы: (id, user_id, is_anonymous, message)."""
+    return await run_in_db(_get_cluster, cluster_id)
+
+
+def _answer_cluster(conn, cluster_id, answer):
+    members = _get_cluster(conn, cluster_id)
+    for message_id, *_ in members:
+        _update_status_and_response(conn, message_id, STATUS_ANSWERED, answer)
+    return [row[:3] for row in members]
+
+
+async def answer_cluster(cluster_id, answer):
+    """
+    Один ответ на все неотвеченные обращения группы (одной транзакцией).
+    Возвращает [(id, user_id, is_anonymous)] отвеченных.
+    """
+    answered = await write_queue.submit(_answer_cluster, cluster_id, answer)
+    for message_id, user_id, _ in answered:
+        _invalidate(message_id, user_id)
+    return answered
+
+
+def _unfingerprinted(conn, after_id, limit):
+    # Обращения, сохранённые до индекса dedup (миграция 11), с отпечатками,
+    # посчитанными здесь, в потоке чтения
+    rows = conn.execute("""
+        SELECT m.id, m.message FROM main.messages m
+        LEFT JOIN message_fingerprints f ON f.message_id = m.id
+        WHERE m.id > ? AND f.message_id IS NULL
+        ORDER BY m.id LIMIT ?
+    """, (after_id, limit)).fetchall()
+    return {message_id: fingerprint(text) for message_id, text in rows}
+
+
+def _store_fingerprints(conn, fingerprints):
+    for message_id, fp in fingerprints.items():
+        # Пока пачка считалась, обращение могло уйти в архив
+        if conn.execute("SELECT 1 FROM main.messages WHERE id = ?", (message_id,)).fetchone():
+            if not conn.execute("SELECT 1 FROM message_fingerprints WHERE message_id = ?", (message_id,)).fetchone():
+                record_fingerprint(conn, message_id, fp)
+
+
+def _archived_fingerprints(conn, after_id, limit):
+    # Строки индекса обращений, перенесённых в архив до того, как перенос
+    # начал их убирать; ключи полос восстанавливаются по тексту из архива
+    rows = conn.execute("""
+        SELECT f.message_id, a.message FROM message_fingerprints f
+        LEFT JOIN main.messages m ON m.id = f.message_id
+        LEFT JOIN archive.messages a ON a.id = f.message_id
+        WHERE f.message_id > ? AND m.id IS NULL
+        ORDER BY f.message_id LIMIT ?
+    """, (after_id, limit)).fetchall()
+    return {message_id: fingerprint(text) for message_id, text in rows}
+
+
+def _drop_archived_fingerprints(conn, fingerprints):
+    marks = ", ".join("?" * len(fingerprints))
+    restored = {row[0] for row in conn.execute(
+        f"SELECT id FROM main.messages WHERE id IN ({marks})", list(fingerprints)
+    )}
+    _drop_fingerprints(conn, {key: fp for key, fp in fingerprints.items() if key not in restored})
+
+
+async def backfill_fingerprints(batch_size=FINGERPRINT_BATCH):
+    """
+    Приводит индекс dedup в соответствие с messages: досчитывает отпечатки
+    обращений без них и убирает строки обращений, уже лежащих в архиве.
+    Идёт пачками по batch_size через очередь записей, чтобы не держать одну
+    длинную транзакцию. Возвращает (добавлено, убрано).
+    """
+    counts = []
+    for select, write in ((_unfingerprinted, _store_fingerprints),
+                          (_archived_fingerprints, _drop_archived_fingerprints)):
+        after_id, count = 0, 0
+        while True:
+            fingerprints = await run_in_db(select, after_id, batch_size)
+            if not fingerprints:
+                break
+            await write_queue.submit(write, fingerprints)
+            after_id = max(fingerprints)
+            count += len(fingerprints)
+            await asyncio.sleep(FINGERPRINT_PAUSE)
+        counts.append(count)
+    return tuple(counts)
+
+
+# --- Архив ---
+
+def _move_rows(conn, source, target, ids):
+    marks = ", ".join("?" * len(ids))
+    columns = ", ".join(MESSAGE_COLUMNS)
+    if target == "archive":
+        # Коды общие: справочники архива — копия основных
+        for table in ("message_statuses", "message_types"):
+            conn.execute(f"INSERT OR IGNORE INTO archive.{table} SELECT code, name FROM main.{table}")
+    # Переносы между файлами в WAL не атомарны как целое: сначала копия, потом
+    # удаление, поэтому при сбое строка может оказаться в обоих местах, но не пропасть.
+    # Такую копию можно заменить; другое обращение с тем же id — нельзя
+    clash = conn.execute(f"""
+        SELECT t.id FROM {target}.messages t JOIN {source}.messages s ON s.id = t.id
+        WHERE t.id IN ({marks})
+          AND (t.user_id IS NOT s.user_id OR t.created_at IS NOT s.created_at OR t.message IS NOT s.message)
+    """, ids).fetchall()
+    if clash:
+        raise sqlite3.IntegrityError(
+            f"В {target}.messages уже есть другие обращения с теми же id: {[row[0] for row in clash]}"
+        )
+    conn.execute(f"DELETE FROM {target}.messages WHERE id IN ({marks})", ids)
+    conn.execute(f"""
+        INSERT INTO {target}.messages ({columns}) SELECT {columns} FROM {source}.messages WHERE id IN ({marks})
+    """, ids)
+    conn.execute(f"DELETE FROM {source}.messages WHERE id IN ({marks})", ids)
+
+
+def _archive_candidates(conn, cutoff, limit):
+    # Отпечатки считаются здесь, в потоке чтения: по ним находятся строки
+    # message_bands, которые уходят из индекса вместе с обращением
+    rows = conn.execute("""
+        SELECT id, message FROM main.messages
+        WHERE updated_at < ? AND status != (SELECT code FROM main.message_statuses WHERE name = ?)
+        ORDER BY updated_at LIMIT ?
+    """, (cutoff, STATUS_PENDING, limit)).fetchall()
+    return {message_id: fingerprint(text) for message_id, text in rows}
+
+
+def _drop_fingerprints(conn, fingerprints):
+    """Убирает из индекса dedup обращения {id: Fingerprint}, которых больше нет в messages."""
+    conn.executemany("DELETE FROM message_bands WHERE key = ? AND message_id = ?",
+                     [(key, message_id) for message_id, fp in fingerprints.items() if fp for key in fp.keys])
+    conn.executemany("DELETE FROM message_fingerprints WHERE message_id = ?", [(message_id,) for message_id in fingerprints])
+
+
+def _archive_batch(conn, cutoff, candidates):
+    if not candidates:
+        return 0
+    # Между выбором и записью обращение могло измениться — условия проверяются снова
+    marks = ", ".join("?" * len(candidates))
+    ids = [row[0] for row in conn.execute(f"""
+        SELECT id FROM main.messages
+        WHERE id IN ({marks}) AND updated_at < ?
+          AND status != (SELECT code FROM main.message_statuses WHERE name = ?)
+    """, (*candidates, cutoff, STATUS_PENDING))]
+    if ids:
+        _move_rows(conn, "main", "archive", ids)
+        _drop_fingerprints(conn, {message_id: candidates[message_id] for message_id in ids})
+    return len(ids)
+
+
+async def archive_batch(cutoff, limit):
+    """
+    Переносит в архив до limit отвеченных обращений, не менявшихся с cutoff
+    (секунды Unix), и убирает их из индекса dedup той же транзакцией.
+    Возвращает число перенесённых.
+    """
+    candidates = await run_in_db(_archive_candidates, cutoff, limit)
+    moved = await write_queue.submit(_archive_batch, cutoff, candidates)
+    if moved:
+        _invalidate()
+    return moved
+
+
+def _restore_message(conn, message_id):
+    """Возвращает обращение из архива в messages (перед изменением). False — такого нет нигде."""
+    if conn.execute("SELECT 1 FROM main.messages WHERE id = ?", (message_id,)).fetchone():
+        return True
+    if not conn.execute("SELECT 1 FROM archive.messages WHERE id = ?", (message_id,)).fetchone():
+        return False
+    _move_rows(conn, "archive", "main", [message_id])
+    return True
+
+
+def _merge_search_index(conn, pages):
+    # Удаление из внешнего FTS5 оставляет в индексе пометки; merge переписывает
+    # сегменты без них (отрицательное число — даже единственный сегмент).
+    # Если работы не было, total_changes почти не растёт
+    before = conn.total_changes
+    conn.execute("INSERT INTO main.messages_fts (messages_fts, rank) VALUES ('merge', ?)", (-pages,))
+    return conn.total_changes - before > 1
+
+
+async def merge_search_index(pages):
+    """Один шаг сжатия поискового индекса после переноса строк; False — сжимать больше нечего."""
+    return await write_queue.submit(_merge_search_index, pages)
+
+
+def _enable_incremental_vacuum(conn):
+    # Для БД, созданных до архива: смена auto_vacuum требует одного полного VACUUM
+    if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] == 2:
+        return False
+    conn.execute("PRAGMA main.auto_vacuum = INCREMENTAL")
+    conn.execute("VACUUM main")
+    return True
+
+
+def _incremental_vacuum(conn, pages):
+    if conn.execute("PRAGMA main.auto_vacuum").fetchone()[0] != 2:
+        return 0
+    # executescript выполняет прагму до конца; execute освободил бы одну страницу
+    conn.executescript(f"PRAGMA main.incremental_vacuum({int(pages)});")
+    return conn.execute("PRAGMA main.freelist_count").fetchone()[0]
+
+
+async def _run_in_writer(func, *args):
+    # Вне транзакций write_queue, но в том же потоке-писателе — не мешает пачкам
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_writer, _call, func, args)
+
+
+async def enable_incremental_vacuum():
+    return await _run_in_writer(_enable_incremental_vacuum)
+
+
+async def incremental_vacuum(pages):
+    """Возвращает файлу до pages свободных страниц; результат — сколько ещё осталось."""
+    return await _run_in_writer(_incremental_vacuum, pages)
+
+
+def _archive_counts(conn):
+    return tuple(conn.execute(f"SELECT COUNT(*) FROM {schema}.messages").fetchone()[0]
+                 for schema in ("main", "archive"))
+
+
+async def archive_counts():
+    """(обращений в живой таблице, в архиве)."""
+    return await run_in_db(_archive_counts)
+
+
+def _get_stats(conn):
+    return collect_stats(conn)
+
+
+async def get_stats():
+    """Сводка для /stats из таблиц счётчиков (см. stats.py)."""
+    return await run_in_db(_get_stats)
@@ -0,0 +1,159 @@
+# dedup.py
+"""
+Поиск почти одинаковых обращений: MinHash-отпечатки и LSH-индекс в messages.db.
+
+Текст нормализуется (регистр, ё, пунктуация) и режется на шинглы по
+SHINGLE_SIZE символов. Отпечаток — MinHash по одной перестановке (one
+permutation hashing): хэш каждого шингла попадает в одну из SLOTS ячеек, в
+ячейке остаётся минимум, пустые ячейки заполняются от соседних
+(densification). Так отпечаток считается за один проход по шинглам, а не за
+SLOTS проходов.
+
+Ячейки разбиты на BANDS полос по ROWS; у похожих текстов хотя бы одна полоса
+совпадает целиком с высокой вероятностью (при сходстве 0.8 — около 98%, при
+0.3 — около 6%). message_bands хранит по ключу на полосу, поэтому поиск —
+несколько поисков по первичному ключу, а не проход по всем обращениям.
+Кандидаты проверяются по сохранённой подписи (младшие 8 бит каждой ячейки,
+SLOTS байт на обращение).
+
+Обращение, похожее на уже сохранённое не меньше чем на SIMILARITY_THRESHOLD,
+попадает в его группу (cluster_id — id первого обращения группы); группы
+неотвеченных обращений админ видит в /clusters и отвечает всем сразу.
+
+fingerprint (весь расчёт по тексту) вызывается до постановки записи в очередь,
+вне транзакции; внутри транзакции insert_message record_fingerprint только
+ищет по корзинам и пишет строки индекса.
+"""
+import operator
+import re
+import zlib
+from collections import Counter
+from typing import NamedTuple
+
+SHINGLE_SIZE = 5
+SLOTS = 32
+BANDS = 8
+ROWS = SLOTS // BANDS
+SIMILARITY_THRESHOLD = 0.7
+BUCKET_LIMIT = 20   # сколько последних обращений брать из одной корзины полосы
+MAX_VERIFIED = 10   # сколько кандидатов с наибольшим числом общих полос сверять по подписи
+
+_WORD = re.compile(r"\w+")
+_SLOT_BITS = (SLOTS - 1).bit_length()
+_VALUE_BITS = 32 - _SLOT_BITS
+_VALUE_MASK = (1 << _VALUE_BITS) - 1
+_EMPTY = 1 << 32
+# Случайное совпадение младших 8 бит разных значений — 1/256
+_CHANCE = 1 / 256
+
+
+def normalize(text):
+    return " ".join(_WORD.findall((text or "").lower().replace("ё", "е")))
+
+
+def shingles(text):
+    text = normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """SLOTS значений MinHash или None, если в тексте нет слов."""
+    parts = shingles(text)
+    if not parts:
+        return None
+    slots = [_EMPTY] * SLOTS
+    for h in map(zlib.crc32, map(str.encode, parts)):
+        # crc32 линеен, перемешиваем умножением; старшие биты — номер ячейки
+        h = h * 0x9E3779B1 & 0xFFFFFFFF
+        slot, value = h >> _VALUE_BITS, h & _VALUE_MASK
+        if value < slots[slot]:
+            slots[slot] = value
+    if _EMPTY in slots:
+        # Пустая ячейка берёт значение ближайшей непустой справа со сдвигом на
+        # расстояние, чтобы не совпадать с ней самой
+        for i in range(SLOTS):
+            if slots[i] >= _EMPTY:
+                distance = 1
+                while slots[(i + distance) % SLOTS] >= _EMPTY:
+                    distance += 1
+                slots[i] = slots[(i + distance) % SLOTS] + (distance << _VALUE_BITS)
+    return slots
+
+
+class Fingerprint(NamedTuple):
+    signature: bytes   # младшие 8 бит каждой ячейки
+    keys: list         # ключи полос для message_bands
+
+
+def signature(slots):
+    return bytes(value & 0xFF for value in slots)
+
+
+def band_keys(slots):
+    """Ключи полос для message_bands — 31 бит, чтобы SQLite хранил их в 4 байтах."""
+    return [
+        zlib.crc32(b"%d:%d:%d:%d:%d" % (band, *slots[band * ROWS:(band + 1) * ROWS])) & 0x7FFFFFFF
+        for band in range(BANDS)
+    ]
+
+
+def fingerprint(text):
+    """Отпечаток текста или None, если в тексте нет слов. Не трогает БД."""
+    slots = minhash(text)
+    if slots is None:
+        return None
+    return Fingerprint(signature(slots), band_keys(slots))
+
+
+def similarity(a, b):
+    """Оценка сходства Жаккара по двум подписям."""
+    same = sum(map(operator.eq, a, b)) / SLOTS
+    return max(0.0, (same - _CHANCE) / (1 - _CHANCE))
+
+
+def find_similar(conn, fp, exclude=None):
+    """[(message_id, сходство, cluster_id)] по убыванию сходства, не ниже порога."""
+    keys = fp.keys
+    part = "SELECT * FROM (SELECT message_id FROM message_bands WHERE key = ? ORDER BY message_id DESC LIMIT ?)"
+    sql = " UNION ALL ".join([part] * len(keys))
+    params = [value for key in keys for value in (key, BUCKET_LIMIT)]
+    candidates = Counter(row[0] for row in conn.execute(sql, params))
+    candidates.pop(exclude, None)
+    if not candidates:
+        return []
+    # Чем больше общих полос, тем вероятнее сходство: сверяем только самых вероятных
+    ids = [message_id for message_id, _ in candidates.most_common(MAX_VERIFIED)]
+    marks = ", ".join("?" * len(ids))
+    found = []
+    for message_id, stored, cluster_id in conn.execute(f"""
+        SELECT message_id, signature, cluster_id FROM message_fingerprints WHERE message_id IN ({marks})
+    """, ids):
+        score = similarity(fp.signature, stored)
+        if score >= SIMILARITY_THRESHOLD:
+            found.append((message_id, score, cluster_id))
+    found.sort(key=lambda item: (-item[1], item[0]))
+    return found
+
+
+def record_fingerprint(conn, message_id, fp):
+    """
+    Сохраняет отпечаток обращения (результат fingerprint) и добавляет его в
+    группу самого похожего. Возвращает cluster_id или None, если похожих нет.
+    """
+    if fp is None:
+        return None
+    cluster_id = None
+    similar = find_similar(conn, fp, exclude=message_id)
+    if similar:
+        match_id, _, cluster_id = similar[0]
+        if cluster_id is None:
+            cluster_id = match_id
+            conn.execute("UPDATE message_fingerprints SET cluster_id = ? WHERE message_id = ?",
+                         (cluster_id, match_id))
+    conn.execute("INSERT OR REPLACE INTO message_fingerprints (message_id, signature, cluster_id) VALUES (?, ?, ?)",
+                 (message_id, fp.signature, cluster_id))
+    conn.executemany("INSERT OR IGNORE INTO message_bands (key, message_id) VALUES (?, ?)",
+                     [(key, message_id) for key in fp.keys])
+    return cluster_id
@@ -0,0 +1,311 @@
+# export.py
+"""
+Потоковый экспорт обращений в xlsx / csv / csv.gz.
+
+Строки читаются из SQLite порциями и сразу пишутся в файл (openpyxl в режиме
+write_only), поэтому память не растёт с размером таблицы. Вся работа идёт в
+отдельном потоке со своим соединением, event loop не блокируется.
+
+Полный экспорт без фильтров готовится заранее: SnapshotJob раз в
+SNAPSHOT_INTERVAL доводит снимок до текущего состояния БД. Основной снимок —
+csv; к нему дописываются только строки с change_seq больше запомненного
+(новые — в конец, изменённые старые — слиянием по id). Файлы снимка не
+меняются на месте: каждая версия пишется в новый файл, поэтому уже
+отправляемую версию ничто не испортит. xlsx и csv.gz строятся из csv и только
+для форматов, которые запрашивали. Выгрузки по запросу (с фильтрами или
+since) получают уникальные имена; старые файлы удаляются cleanup_exports.
+"""
+import asyncio
+import csv
+import gzip
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+from pathlib import Path
+from uuid import uuid4
+
+from openpyxl import Workbook
+
+from database import (
+    EXPORT_COLUMNS, connect, count_export_rows, open_export_cursor, current_change_seq, fetch_changes,
+    max_export_id, load_snapshot, save_snapshot
+)
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = Path("exports")
+SNAPSHOT_DIR = EXPORT_DIR / "snapshots"
+CHUNK_SIZE = 1000
+FORMATS = ("xlsx", "csv", "csv.gz")
+SNAPSHOT_INTERVAL = 60        # секунды между обновлениями снимка
+SNAPSHOT_KEEP = 3600          # заменённые версии снимка — их могут ещё отправлять
+ARTIFACT_TTL = 24 * 3600      # выгрузки по запросу
+INT_COLUMNS = {"id", "user_id", "is_anonymous"}
+
+_snapshot_lock = asyncio.Lock()
+
+
+class ExportProgress:
+    def __init__(self):
+        self.total = 0
+        self.done = 0
+
+
+def _write_rows(path, fmt, columns, chunks, progress):
+    if fmt == "xlsx":
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet("messages")
+        ws.append(columns)
+        for chunk in chunks:
+            for row in chunk:
+                ws.append(row)
+            progress.done += len(chunk)
+        wb.save(path)
+        return
+
+    opener = gzip.open if fmt == "csv.gz" else open
+    # utf-8-sig — чтобы Excel правильно открыл кириллицу
+    with opener(path, "wt", encoding="utf-8-sig", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for chunk in chunks:
+            writer.writerows(chunk)
+            progress.done += len(chunk)
+
+
+def _iter_chunks(cursor):
+    while True:
+        chunk = cursor.fetchmany(CHUNK_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+def write_export(path, fmt="xlsx", date_from=None, date_to=None, status=None, progress=None, since=None):
+    progress = progress or ExportProgress()
+    conn = connect()
+    try:
+        progress.total = count_export_rows(conn, date_from, date_to, status, since)
+        cursor = open_export_cursor(conn, date_from, date_to, status, since)
+        columns = [d[0] for d in cursor.description]
+        _write_rows(path, fmt, columns, _iter_chunks(cursor), progress)
+    finally:
+        conn.close()
+    return os.path.abspath(path)
+
+
+def unique_path(fmt, prefix="messages", directory=EXPORT_DIR):
+    """Своё имя для каждой выгрузки: одновременные запросы не пишут в один файл."""
+    return directory / f"{prefix}-{datetime.now():%Y%m%d-%H%M%S}-{uuid4().hex[:8]}.{fmt}"
+
+
+async def export_messages(fmt="xlsx", date_from=None, date_to=None, status=None, progress=None, since=None):
+    """
+    Экспортирует обращения в EXPORT_DIR в рабочем потоке и возвращает путь к файлу.
+    progress (ExportProgress) обновляется по мере записи — его можно опрашивать из event loop.
+    since — только созданные или изменённые начиная с этой даты (дельта).
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+    EXPORT_DIR.mkdir(exist_ok=True)
+    path = unique_path(fmt, "delta" if since else "messages")
+    return await asyncio.to_thread(write_export, path, fmt, date_from, date_to, status, progress, since)
+
+
+# --- Снимок полного экспорта ---
+
+def _read_header(path):
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        return next(csv.reader(f), None)
+
+
+def _merge_changes(base_path, path, changes):
+    """
+    Сливает csv-снимок (по возрастанию id) с изменёнными строками (тоже по id):
+    изменённые заменяют старые, новые встают на своё место. Возвращает число строк.
+    """
+    changed = iter(changes)
+    pending = next(changed, None)
+    rows = 0
+    with open(base_path, encoding="utf-8-sig", newline="") as src, \
+            open(path, "w", encoding="utf-8-sig", newline="") as dst:
+        reader, writer = csv.reader(src), csv.writer(dst)
+        writer.writerow(next(reader))
+        for row in reader:
+            row_id = int(row[0])
+            while pending is not None and pending[0] < row_id:
+                writer.writerow(pending)
+                rows += 1
+                pending = next(changed, None)
+            if pending is not None and pending[0] == row_id:
+                row = pending
+                pending = next(changed, None)
+            writer.writerow(row)
+            rows += 1
+        while pending is not None:
+            writer.writerow(pending)
+            rows += 1
+            pending = next(changed, None)
+    return rows
+
+
+def _update_csv_snapshot(conn):
+    """Доводит csv-снимок до текущего состояния БД; возвращает (path, change_seq, max_id, rows)."""
+    base = load_snapshot(conn, "csv")
+    if base and not (Path(base[0]).exists() and _read_header(base[0]) == list(EXPORT_COLUMNS)):
+        base = None   # файл удалён или поменялись колонки — строим заново
+    # Номер изменений и строки читаются в одной транзакции — из одного состояния БД
+    conn.execute("BEGIN")
+    try:
+        seq = current_change_seq(conn)
+        if base and base[1] == seq:
+            return base[:4]
+        path = SNAPSHOT_DIR / f"messages-{seq}-{uuid4().hex[:8]}.csv"
+        part_path = path.with_name(path.name + ".part")
+        if base is None:
+            progress = ExportProgress()
+            _write_rows(part_path, "csv", EXPORT_COLUMNS, _iter_chunks(open_export_cursor(conn)), progress)
+            rows = progress.done
+            max_id = max_export_id(conn)
+        else:
+            base_path, _, max_id, rows = base[:4]
+            changes = fetch_changes(conn, base[1])
+            if changes and changes[0][0] > max_id:
+                # Только новые строки — копия прошлой версии плюс хвост
+                shutil.copyfile(base_path, part_path)
+                with open(part_path, "a", encoding="utf-8", newline="") as f:
+                    csv.writer(f).writerows(changes)
+                rows += len(changes)
+            else:
+                rows = _merge_changes(base_path, part_path, changes)
+            if changes:
+                max_id = max(max_id, changes[-1][0])
+    finally:
+        conn.commit()
+    part_path.replace(path)
+    save_snapshot(conn, "csv", path, seq, max_id, rows)
+    logger.info(f"Снимок экспорта обновлён: {path} ({rows} строк)")
+    return str(path), seq, max_id, rows
+
+
+def _csv_chunks(reader):
+    int_columns = [i for i, name in enumerate(EXPORT_COLUMNS) if name in INT_COLUMNS]
+    chunk = []
+    for row in reader:
+        values = [value if value != "" else None for value in row]
+        for i in int_columns:
+            if values[i] is not None:
+                values[i] = int(values[i])
+        chunk.append(values)
+        if len(chunk) == CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _derive(csv_path, fmt, path):
+    """Строит снимок в формате fmt из csv-снимка, не трогая БД."""
+    if fmt == "csv.gz":
+        with open(csv_path, "rb") as src, gzip.open(path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        return
+    with open(csv_path, encoding="utf-8-sig", newline="") as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+        _write_rows(path, fmt, columns, _csv_chunks(reader), ExportProgress())
+
+
+def update_snapshots(formats=()):
+    """
+    Обновляет csv-снимок и все ранее запрошенные форматы (плюс formats).
+    Синхронная функция: вызывать из рабочего потока.
+    """
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    conn = connect()
+    try:
+        csv_path, seq, max_id, rows = _update_csv_snapshot(conn)
+        wanted = set(formats) | {r[0] for r in conn.execute("SELECT format FROM export_snapshots")}
+        for fmt in sorted(wanted - {"csv"}):
+            current = load_snapshot(conn, fmt)
+            if current and current[1] == seq and Path(current[0]).exists():
+                continue
+            path = SNAPSHOT_DIR / f"messages-{seq}-{uuid4().hex[:8]}.{fmt}"
+            part_path = path.with_name(path.name + ".part")
+            _derive(csv_path, fmt, part_path)
+            part_path.replace(path)
+            save_snapshot(conn, fmt, path, seq, max_id, rows)
+    finally:
+        conn.close()
+
+
+def _current_snapshot(fmt):
+    conn = connect()
+    try:
+        snapshot = load_snapshot(conn, fmt)
+    finally:
+        conn.close()
+    if snapshot is None or not Path(snapshot[0]).exists():
+        # Формат запрошен впервые — строим сейчас, дальше его обновляет SnapshotJob
+        update_snapshots([fmt])
+        return _current_snapshot(fmt)
+    path, _, _, rows, created_at = snapshot
+    return path, rows, created_at
+
+
+async def get_snapshot(fmt="xlsx"):
+    """Готовый полный экспорт: (путь, число строк, когда снят)."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат экспорта: {fmt}")
+    async with _snapshot_lock:
+        return await asyncio.to_thread(_current_snapshot, fmt)
+
+
+def cleanup_exports(now=None):
+    """Удаляет выгрузки старше ARTIFACT_TTL и заменённые версии снимка старше SNAPSHOT_KEEP."""
+    now = now or time.time()
+    conn = connect()
+    try:
+        current = {Path(r[0]).name for r in conn.execute("SELECT path FROM export_snapshots")}
+    finally:
+        conn.close()
+    removed = 0
+    for directory, ttl in ((SNAPSHOT_DIR, SNAPSHOT_KEEP), (EXPORT_DIR, ARTIFACT_TTL)):
+        if not directory.exists():
+            continue
+        for path in directory.iterdir():
+            if path.is_file() and path.name not in current and now - path.stat().st_mtime > ttl:
+                path.unlink(missing_ok=True)
+                removed += 1
+    return removed
+
+
+class SnapshotJob:
+    """Фоновая задача: раз в interval обновляет снимок экспорта и чистит старые файлы."""
+
+    def __init__(self, interval: float = SNAPSHOT_INTERVAL):
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def _run(self):
+        while True:
+            try:
+                async with _snapshot_lock:
+                    await asyncio.to_thread(update_snapshots)
+                await asyncio.to_thread(cleanup_exports)
+            except Exception as e:
+                logger.error(f"Ошибка обновления снимка экспорта: {e}")
+            await asyncio.sleep(self.interval)
@@ -1,26 +1,30 @@
 # handlers.py
 from aiogram import Router, F, types
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.filters import CommandStart, Command, StateFilter
-from aiogram.fsm.context import FSMContext
+from aiogram.filters.callback_data import CallbackData
 from aiogram.fsm.state import StatesGroup, State
-from config import ADMINS, MANAGERS
-from database import insert_message, get_user_messages
-from utils import save_file
+from config import ADMINS, MANAGERS, MAX_FILE_SIZE
+from database import insert_message, get_user_messages_page, get_message_by_id
+from utils import save_file, FileTooLargeError
+from notify import Attachment, enqueue
+from transitions import FormContext, FormContextMiddleware
+from keyboards import (
+    BACK_TEXT, NO_TEXT, HELP_TEXT, ANONYMOUS_TEXT, MAIN_MENU, MANAGERS_KB, NAME_KB,
+    BACK_KB, FILE_KB, MANAGER_PROMPT, NAME_PROMPT, MESSAGE_PROMPT, FILE_PROMPT, STEPS, step_view
+)
 import logging
 
 router = Router()
-logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
 
 # <<< ВАЖНО: ограничиваем этот роутер ТОЛЬКО приватными чатами >>>
 router.message.filter(F.chat.type == "private")
 
-BACK_TEXT = "⬅ Назад"
-BACK_BTN = KeyboardButton(text=BACK_TEXT)
-NO_TEXT = "❌ Нет"          # Кнопка «Нет» для пропуска файла
-NO_BTN = KeyboardButton(text=NO_TEXT)
-HELP_TEXT = "❓ Помощь"
-HELP_BTN = KeyboardButton(text=HELP_TEXT)
+HISTORY_PAGE_SIZE = 10
+HISTORY_PREVIEW_LEN = 200     # символов сообщения в списке, полный текст — по кнопке
+HISTORY_TEXT_LIMIT = 3500     # байт на одно сообщение со списком (лимит Telegram — 4096 символов)
+TELEGRAM_TEXT_LIMIT = 4096
 
 
 class Form(StatesGroup):
@@ -32,41 +36,16 @@ class Form(StatesGroup):
     uploading_file = State()
 
 
-def main_menu():
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="👨‍💼 Задать вопрос руководителю")],
-            [KeyboardButton(text="📢 Общий вопрос")],
-            [KeyboardButton(text="📝 Написать генеральному директору")],
-            [KeyboardButton(text="💡 Предложить идею")],
-            [KeyboardButton(text="📂 Мои обращения")],
-            [HELP_BTN],
-        ],
-        resize_keyboard=True
-    )
+# Состояние формы читается один раз на апдейт и сохраняется одной записью (см. transitions.py)
+router.message.middleware(FormContextMiddleware(Form))
 
 
-# --- История для кнопки «Назад» -------------------------------------------
-async def push_history(state: FSMContext):
-    current = await state.get_state()
-    if not current:
-        return
-    data = await state.get_data()
-    history = data.get("history", [])
-    if not history or history[-1] != current:
-        history.append(current)
-        await state.update_data(history=history)
+class HistoryPage(CallbackData, prefix="hist"):
+    cursor: int = 0
 
 
-async def pop_previous(state: FSMContext):
-    data = await state.get_data()
-    history = data.get("history", [])
-    if not history:
-        return None
-    prev = history.pop()
-    await state.update_data(history=history)
-    return prev
-# ---------------------------------------------------------------------------
+class HistoryItem(CallbackData, prefix="hitem"):
+    id: int
 
 
 @router.message(Command("chat_id"))
@@ -98,98 +77,50 @@ async def help_text(message: Message):
 
 # Универсальный «Назад»
 @router.message(F.text == BACK_TEXT)
-async def go_back(message: Message, state: FSMContext):
-    prev = await pop_previous(state)
-    if not prev:
-        await state.clear()
-        await state.update_data(history=[])
-        await message.answer("Вы вернулись в главное меню.", reply_markup=main_menu())
+async def go_back(message: Message, form: FormContext):
+    state_name = form.back()
+    if state_name not in STEPS:
+        form.reset()
+        await message.answer("Вы вернулись в главное меню.", reply_markup=MAIN_MENU)
         return
 
-    await state.set_state(prev)
-    state_name = prev.split(":")[-1] if ":" in prev else prev
-
-    if state_name == "choosing_manager":
-        buttons = [[KeyboardButton(text=name)] for name in MANAGERS]
-        kb = ReplyKeyboardMarkup(
-            keyboard=buttons + [[BACK_BTN]],
-            resize_keyboard=True, one_time_keyboard=True
-        )
-        await message.answer("Выберите руководителя:", reply_markup=kb)
-    elif state_name == "entering_name":
-        kb = ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(text="🤐 Анонимно")], [BACK_BTN]],
-            resize_keyboard=True, one_time_keyboard=True
-        )
-        await message.answer("Введите ваше имя и фамилию или нажмите 'Анонимно'.", reply_markup=kb)
-    elif state_name == "entering_position":
-        await message.answer("Укажите вашу должность:",
-                             reply_markup=ReplyKeyboardMarkup(keyboard=[[BACK_BTN]], resize_keyboard=True))
-    elif state_name == "anonymous_reason":
-        await message.answer("Почему вы хотите остаться анонимным?",
-                             reply_markup=ReplyKeyboardMarkup(keyboard=[[BACK_BTN]], resize_keyboard=True))
-    elif state_name == "typing_message":
-        await message.answer("Введите ваше сообщение (до 1000 символов):",
-                             reply_markup=ReplyKeyboardMarkup(keyboard=[[BACK_BTN]], resize_keyboard=True))
-    elif state_name == "uploading_file":
-        await message.answer("Если хотите, прикрепите файл (pdf, docx, xls, jpg, png) или нажмите «❌ Нет».",
-                             reply_markup=ReplyKeyboardMarkup(keyboard=[[NO_BTN], [BACK_BTN]], resize_keyboard=True))
-    else:
-        await state.clear()
-        await state.update_data(history=[])
-        await message.answer("Вы вернулись в главное меню.", reply_markup=main_menu())
+    prompt, kb = step_view(state_name, form.data.get("type"))
+    await message.answer(prompt, reply_markup=kb)
 
 
 @router.message(CommandStart())
-async def start(message: Message, state: FSMContext):
-    await state.clear()
-    await state.update_data(history=[])
+async def start(message: Message, form: FormContext):
+    form.reset()
     await message.answer(
         "👋 Привет! Я бот для обратной связи.\n"
         "Вы можете задать вопрос, поделиться идеей или предложить улучшение.\n"
         "Выберите действие:",
-        reply_markup=main_menu()
+        reply_markup=MAIN_MENU
     )
 
 
 @router.message(F.text == "👨‍💼 Задать вопрос руководителю")
-async def choose_manager(message: Message, state: FSMContext):
-    await state.update_data(user_id=message.from_user.id, type="руководитель")
-    await push_history(state)
-    buttons = [[KeyboardButton(text=name)] for name in MANAGERS]
-    kb = ReplyKeyboardMarkup(
-        keyboard=buttons + [[BACK_BTN]],
-        resize_keyboard=True, one_time_keyboard=True
-    )
-    await message.answer("Выберите руководителя:", reply_markup=kb)
-    await state.set_state(Form.choosing_manager)
+async def choose_manager(message: Message, form: FormContext):
+    form.update(user_id=message.from_user.id, type="руководитель")
+    await message.answer(MANAGER_PROMPT, reply_markup=MANAGERS_KB)
+    form.goto(Form.choosing_manager)
 
 
 # ✅ Корректный выбор руководителя (нажата кнопка из списка MANAGERS)
 @router.message(Form.choosing_manager, F.text.in_(MANAGERS))
-async def manager_chosen(message: Message, state: FSMContext):
-    await push_history(state)
-    await state.update_data(recipient=message.text)
-    kb = ReplyKeyboardMarkup(
-        keyboard=[[KeyboardButton(text="🤐 Анонимно")], [BACK_BTN]],
-        resize_keyboard=True, one_time_keyboard=True
-    )
-    await message.answer("Введите ваше имя и фамилию или нажмите 'Анонимно'.", reply_markup=kb)
-    await state.set_state(Form.entering_name)
+async def manager_chosen(message: Message, form: FormContext):
+    form.update(recipient=message.text)
+    await message.answer(NAME_PROMPT, reply_markup=NAME_KB)
+    form.goto(Form.entering_name)
 
 
 # 🚫 Любой другой ввод на шаге выбора руководителя — подсказываем и оставляем в том же состоянии
 @router.message(Form.choosing_manager)
-async def manager_invalid_input(message: Message, state: FSMContext):
-    buttons = [[KeyboardButton(text=name)] for name in MANAGERS]
-    kb = ReplyKeyboardMarkup(
-        keyboard=buttons + [[BACK_BTN]],
-        resize_keyboard=True, one_time_keyboard=True
-    )
+async def manager_invalid_input(message: Message):
     await message.answer(
         "Пожалуйста, выберите руководителя из списка нажатием кнопки.\n"
         ,
-        reply_markup=kb
+        reply_markup=MANAGERS_KB
     )
     # остаёмся в Form.choosing_manager
 
@@ -199,81 +130,63 @@ async def manager_invalid_input(message: Message, state: FSMContext):
     "📝 Написать генеральному директору",
     "💡 Предложить идею"
 }))
-async def choose_type(message: Message, state: FSMContext):
+async def choose_type(message: Message, form: FormContext):
     type_map = {
         "📢 Общий вопрос": "общий",
         "📝 Написать генеральному директору": "директор",
         "💡 Предложить идею": "идея"
     }
     msg_type = type_map[message.text]
-    await state.update_data(user_id=message.from_user.id, type=msg_type, recipient="")
-    await push_history(state)
-
-    if msg_type == "директор":
-        # Без анонимности
-        await message.answer("Введите ваше имя и фамилию:",
-                             reply_markup=ReplyKeyboardMarkup(keyboard=[[BACK_BTN]],
-                                                              resize_keyboard=True, one_time_keyboard=True))
-    else:
-        kb = ReplyKeyboardMarkup(
-            keyboard=[[KeyboardButton(text="🤐 Анонимно")], [BACK_BTN]],
-            resize_keyboard=True, one_time_keyboard=True
-        )
-        await message.answer("Введите ваше имя и фамилию или нажмите 'Анонимно'.", reply_markup=kb)
-    await state.set_state(Form.entering_name)
+    form.update(user_id=message.from_user.id, type=msg_type, recipient="")
+
+    # Генеральному директору — без анонимности (см. STEP_OVERRIDES)
+    prompt, kb = step_view("entering_name", msg_type)
+    await message.answer(prompt, reply_markup=kb)
+    form.goto(Form.entering_name)
 
 
 @router.message(Form.entering_name)
-async def get_name(message: Message, state: FSMContext):
-    await push_history(state)
+async def get_name(message: Message, form: FormContext):
     text = message.text
-    if text == "🤐 Анонимно":
-        await state.update_data(is_anonymous=1, name="Аноним", position="Аноним")
-        await message.answer("Почему вы хотите остаться анонимным?",
-                             reply_markup=ReplyKeyboardMarkup(keyboard=[[BACK_BTN]], resize_keyboard=True))
-        await state.set_state(Form.anonymous_reason)
+    if text == ANONYMOUS_TEXT:
+        form.update(is_anonymous=1, name="Аноним", position="Аноним")
+        prompt, kb = STEPS["anonymous_reason"]
+        await message.answer(prompt, reply_markup=kb)
+        form.goto(Form.anonymous_reason)
     else:
-        await state.update_data(is_anonymous=0, name=text)
-        await message.answer("Укажите вашу должность:",
-                             reply_markup=ReplyKeyboardMarkup(keyboard=[[BACK_BTN]], resize_keyboard=True))
-        await state.set_state(Form.entering_position)
+        form.update(is_anonymous=0, name=text)
+        prompt, kb = STEPS["entering_position"]
+        await message.answer(prompt, reply_markup=kb)
+        form.goto(Form.entering_position)
 
 
 @router.message(Form.entering_position)
-async def get_position(message: Message, state: FSMContext):
-    await push_history(state)
-    await state.update_data(position=message.text, reason="")
-    await message.answer("Введите ваше сообщение (до 1000 символов):",
-                         reply_markup=ReplyKeyboardMarkup(keyboard=[[BACK_BTN]], resize_keyboard=True))
-    await state.set_state(Form.typing_message)
+async def get_position(message: Message, form: FormContext):
+    form.update(position=message.text, reason="")
+    await message.answer(MESSAGE_PROMPT, reply_markup=BACK_KB)
+    form.goto(Form.typing_message)
 
 
 @router.message(Form.anonymous_reason)
-async def get_reason(message: Message, state: FSMContext):
-    await push_history(state)
-    await state.update_data(reason=message.text)
-    await message.answer("Введите ваше сообщение (до 1000 символов):",
-                         reply_markup=ReplyKeyboardMarkup(keyboard=[[BACK_BTN]], resize_keyboard=True))
-    await state.set_state(Form.typing_message)
+async def get_reason(message: Message, form: FormContext):
+    form.update(reason=message.text)
+    await message.answer(MESSAGE_PROMPT, reply_markup=BACK_KB)
+    form.goto(Form.typing_message)
 
 
 @router.message(Form.typing_message)
-async def get_message(message: Message, state: FSMContext):
-    await push_history(state)
+async def get_message(message: Message, form: FormContext):
     if len(message.text) > 1000:
         await message.answer("Слишком длинное сообщение. Пожалуйста, сократите до 1000 символов.")
         return
-    await state.update_data(message=message.text)
+    form.update(message=message.text)
     # Кнопка «❌ Нет» для пропуска файла
-    await message.answer(
-        "Если хотите, прикрепите файл (pdf, docx, xls, jpg, png) или нажмите «❌ Нет».",
-        reply_markup=ReplyKeyboardMarkup(keyboard=[[NO_BTN], [BACK_BTN]], resize_keyboard=True)
-    )
-    await state.set_state(Form.uploading_file)
+    await message.answer(FILE_PROMPT, reply_markup=FILE_KB)
+    form.goto(Form.uploading_file)
 
 
 @router.message(Form.uploading_file)
-async def handle_file_or_skip(message: Message, state: FSMContext):
+async def handle_file_or_skip(message: Message, form: FormContext):
     file_path = None
     try:
         if message.document:
@@ -287,7 +200,7 @@ async def handle_file_or_skip(message: Message, state: FSMContext):
                 file_path = await save_file(message)   # сохраняем документ/изображение
             else:
                 await message.answer("⛔ Неподдерживаемый тип файла.",
-                                     reply_markup=ReplyKeyboardMarkup(keyboard=[[NO_BTN], [BACK_BTN]], resize_keyboard=True))
+                                     reply_markup=FILE_KB)
                 return
         elif message.photo:
             # save_file умеет фото
@@ -297,18 +210,23 @@ async def handle_file_or_skip(message: Message, state: FSMContext):
         else:
             await message.answer(
                 "Пожалуйста, прикрепите файл (pdf, docx, xls, jpg, png) или нажмите «❌ Нет».",
-                reply_markup=ReplyKeyboardMarkup(keyboard=[[NO_BTN], [BACK_BTN]], resize_keyboard=True)
+                reply_markup=FILE_KB
             )
             return
+    except FileTooLargeError as e:
+        logger.warning(str(e))
+        await message.answer(f"⛔ Файл слишком большой (максимум {MAX_FILE_SIZE // (1024 * 1024)} МБ).",
+                             reply_markup=FILE_KB)
+        return
     except Exception as e:
-        logging.error(f"Ошибка при сохранении файла: {e}")
+        logger.error(f"Ошибка при сохранении файла: {e}")
         await message.answer("Произошла ошибка при загрузке файла.",
-                             reply_markup=ReplyKeyboardMarkup(keyboard=[[NO_BTN], [BACK_BTN]], resize_keyboard=True))
+                             reply_markup=FILE_KB)
         return
 
-    await state.update_data(file_path=file_path)
-    user = await state.get_data()
-    msg_id = insert_message(user)
+    form.update(file_path=file_path)
+    user = form.data
+    msg_id = await insert_message(user)
 
     if user.get("is_anonymous"):
         text = (
@@ -326,35 +244,92 @@ async def handle_file_or_skip(message: Message, state: FSMContext):
             f"Сообщение:\n{user.get('message','')}"
         )
 
-    for admin in ADMINS:
-        try:
-            if admin == message.chat.id:
-                # не отправляем в тот же чат, откуда пришло
-                continue
-            await message.bot.send_message(admin, text)
-            if file_path:
-                await message.bot.send_document(admin, types.FSInputFile(file_path))
-        except Exception as e:
-            logging.error(f"Ошибка при отправке админу {admin}: {e}")
+    attachment = None
+    if message.document:
+        attachment = Attachment("document", file_id=message.document.file_id, path=file_path)
+    elif message.photo:
+        attachment = Attachment("photo", file_id=message.photo[-1].file_id, path=file_path)
 
-    await state.clear()
-    await state.update_data(history=[])
-    await message.answer("✅ Спасибо! Ваше сообщение отправлено.", reply_markup=main_menu())
+    # не отправляем в тот же чат, откуда пришло
+    recipients = [admin for admin in ADMINS if admin != message.chat.id]
+    await enqueue(recipients, text, attachment, message_id=msg_id)
+
+    form.reset()
+    await message.answer("✅ Спасибо! Ваше сообщение отправлено.", reply_markup=MAIN_MENU)
+
+
+async def build_history(user_id: int, cursor: int = 0):
+    rows, has_more = await get_user_messages_page(
+        user_id, cursor_id=cursor or None, limit=HISTORY_PAGE_SIZE, preview_len=HISTORY_PREVIEW_LEN
+    )
+    if not rows:
+        return None, None
+
+    entries, shown, size = [], [], 0
+    for r in rows:
+        # r: (id, type, preview, truncated, status, has_answer)
+        entry = f"🆔#{r[0]} | Тип: {r[1]} | Статус: {r[4]}\n📨 {r[2]}"
+        if r[3]:
+            entry += "…"
+        if r[5]:
+            entry += "\n📬 Есть ответ"
+        entry_size = len(entry.encode()) + 2
+        # Остальное уйдёт на следующую страницу, но хотя бы одно обращение показываем всегда
+        if shown and size + entry_size > HISTORY_TEXT_LIMIT:
+            has_more = True
+            break
+        entries.append(entry)
+        shown.append(r[0])
+        size += entry_size
+
+    buttons = [
+        InlineKeyboardButton(text=f"🆔#{msg_id}", callback_data=HistoryItem(id=msg_id).pack())
+        for msg_id in shown
+    ]
+    kb = [buttons[i:i + 5] for i in range(0, len(buttons), 5)]
+    if has_more:
+        kb.append([InlineKeyboardButton(text="Ещё ➡", callback_data=HistoryPage(cursor=shown[-1]).pack())])
+    return "\n\n".join(entries), InlineKeyboardMarkup(inline_keyboard=kb)
 
 
 @router.message(F.text == "📂 Мои обращения")
 async def show_my_requests(message: Message):
-    rows = get_user_messages(message.from_user.id)
-    if not rows:
+    text, kb = await build_history(message.from_user.id)
+    if not text:
         await message.answer("У вас пока нет сохранённых обращений.")
     else:
-        result = []
-        for r in rows:
-            entry = f"🆔#{r[0]} | Тип: {r[1]} | Статус: {r[3]}\n📨 {r[2]}"
-            if r[4]:
-                entry += f"\n📬 Ответ: {r[4]}"
-            result.append(entry)
-        await message.answer("\n\n".join(result))
+        await message.answer(text, reply_markup=kb)
+
+
+@router.callback_query(HistoryPage.filter())
+async def show_my_requests_page(callback: CallbackQuery, callback_data: HistoryPage):
+    text, kb = await build_history(callback.from_user.id, callback_data.cursor)
+    if text:
+        await callback.message.answer(text, reply_markup=kb)
+    await callback.answer()
+
+
+@router.callback_query(HistoryItem.filter())
+async def show_request_details(callback: CallbackQuery, callback_data: HistoryItem):
+    record = await get_message_by_id(callback_data.id)
+    # record: (id, user_id, type, message, name, position, is_anonymous, reason, file_path, status, answer, created_at)
+    if not record or record[1] != callback.from_user.id:
+        await callback.answer("Обращение не найдено.", show_alert=True)
+        return
+
+    text = (
+        f"🆔#{record[0]} | Тип: {record[2]} | Статус: {record[9]}\n"
+        f"🕒 {record[11]}\n\n"
+        f"📨 {record[3]}"
+    )
+    answer = f"📬 Ответ:\n{record[10]}" if record[10] else ""
+    if answer and len(text) + len(answer) + 2 <= TELEGRAM_TEXT_LIMIT:
+        await callback.message.answer(f"{text}\n\n{answer}")
+    else:
+        await callback.message.answer(text)
+        if answer:
+            await callback.message.answer(answer[:TELEGRAM_TEXT_LIMIT])
+    await callback.answer()
 
 
 # --- Fallback: только когда НЕТ состояния и только в приватном чате ---
@@ -362,5 +337,5 @@ async def show_my_requests(message: Message):
 async def unknown_private(message: Message):
     await message.answer(
         "Я не понял сообщение. Пожалуйста, используйте меню ниже:",
-        reply_markup=main_menu()
+        reply_markup=MAIN_MENU
     )
@@ -0,0 +1,73 @@
+# keyboards.py
+"""
+Реестр клавиатур пользовательского меню и шагов формы.
+
+Все клавиатуры собираются один раз при импорте из config.MANAGERS и STEPS и
+дальше переиспользуются в каждом ответе. STEPS задаёт подсказку и клавиатуру
+для каждого шага Form — по нему же работает «Назад»; STEP_OVERRIDES — шаги,
+которые для отдельных типов обращений выглядят иначе.
+"""
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+
+from config import MANAGERS
+
+BACK_TEXT = "⬅ Назад"
+BACK_BTN = KeyboardButton(text=BACK_TEXT)
+NO_TEXT = "❌ Нет"          # Кнопка «Нет» для пропуска файла
+NO_BTN = KeyboardButton(text=NO_TEXT)
+HELP_TEXT = "❓ Помощь"
+HELP_BTN = KeyboardButton(text=HELP_TEXT)
+ANONYMOUS_TEXT = "🤐 Анонимно"
+
+MAIN_MENU = ReplyKeyboardMarkup(
+    keyboard=[
+        [KeyboardButton(text="👨‍💼 Задать вопрос руководителю")],
+        [KeyboardButton(text="📢 Общий вопрос")],
+        [KeyboardButton(text="📝 Написать генеральному директору")],
+        [KeyboardButton(text="💡 Предложить идею")],
+        [KeyboardButton(text="📂 Мои обращения")],
+        [HELP_BTN],
+    ],
+    resize_keyboard=True
+)
+
+MANAGERS_KB = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text=name)] for name in MANAGERS] + [[BACK_BTN]],
+    resize_keyboard=True, one_time_keyboard=True
+)
+
+# Имя с возможностью анонимности и без неё (обращение к генеральному директору)
+NAME_KB = ReplyKeyboardMarkup(
+    keyboard=[[KeyboardButton(text=ANONYMOUS_TEXT)], [BACK_BTN]],
+    resize_keyboard=True, one_time_keyboard=True
+)
+NAME_DIRECTOR_KB = ReplyKeyboardMarkup(keyboard=[[BACK_BTN]], resize_keyboard=True, one_time_keyboard=True)
+
+BACK_KB = ReplyKeyboardMarkup(keyboard=[[BACK_BTN]], resize_keyboard=True)
+FILE_KB = ReplyKeyboardMarkup(keyboard=[[NO_BTN], [BACK_BTN]], resize_keyboard=True)
+
+MANAGER_PROMPT = "Выберите руководителя:"
+NAME_PROMPT = "Введите ваше имя и фамилию или нажмите 'Анонимно'."
+NAME_DIRECTOR_PROMPT = "Введите ваше имя и фамилию:"
+MESSAGE_PROMPT = "Введите ваше сообщение (до 1000 символов):"
+FILE_PROMPT = "Если хотите, прикрепите файл (pdf, docx, xls, jpg, png) или нажмите «❌ Нет»."
+
+# Шаг формы -> (подсказка, клавиатура)
+STEPS = {
+    "choosing_manager": (MANAGER_PROMPT, MANAGERS_KB),
+    "entering_name": (NAME_PROMPT, NAME_KB),
+    "entering_position": ("Укажите вашу должность:", BACK_KB),
+    "anonymous_reason": ("Почему вы хотите остаться анонимным?", BACK_KB),
+    "typing_message": (MESSAGE_PROMPT, BACK_KB),
+    "uploading_file": (FILE_PROMPT, FILE_KB),
+}
+
+# (шаг формы, тип обращения) -> (подсказка, клавиатура): генеральному директору — без анонимности
+STEP_OVERRIDES = {
+    ("entering_name", "директор"): (NAME_DIRECTOR_PROMPT, NAME_DIRECTOR_KB),
+}
+
+
+def step_view(state_name, msg_type=None):
+    """Подсказка и клавиатура шага с учётом типа обращения."""
+    return STEP_OVERRIDES.get((state_name, msg_type)) or STEPS[state_name]
@@ -0,0 +1,169 @@
+# logs.py
+"""
+Неблокирующее логирование.
+
+Вызов logger.info/error в хендлере только кладёт запись в ограниченную очередь
+(QueueHandler), в файл её пишет фоновый поток (QueueListener) — с ротацией по
+размеру или по времени. Записи — JSON-строки с update_id, user_id и состоянием
+FSM текущего апдейта (их проставляет LogContextMiddleware через contextvars).
+Частые события можно прореживать: запись с extra={"sample": "<событие>"} или
+от логгера с таким именем (например, aiogram.event — строка на каждый апдейт)
+пишется с вероятностью из LOG_SAMPLING; предупреждения и ошибки — всегда.
+Если очередь переполнена, запись отбрасывается, а не задерживает хендлер.
+"""
+import atexit
+import copy
+import json
+import logging
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from config import (
+    LOG_FILE, LOG_LEVEL, LOG_ROTATION, LOG_MAX_BYTES, LOG_BACKUPS, LOG_WHEN, LOG_QUEUE_SIZE,
+    LOG_SAMPLING, LOG_CONSOLE
+)
+
+update_id_var: ContextVar[int | None] = ContextVar("update_id", default=None)
+user_id_var: ContextVar[int | None] = ContextVar("user_id", default=None)
+state_var: ContextVar[str | None] = ContextVar("state", default=None)
+
+_listener = None
+
+
+class ContextFilter(logging.Filter):
+    """Проставляет в запись контекст апдейта и прореживает частые события."""
+
+    def __init__(self, sampling: Dict[str, float]):
+        super().__init__()
+        self.sampling = sampling
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.sampling and record.levelno < logging.WARNING:
+            # Доля задаётся для события (extra sample) или для логгера целиком
+            rate = self.sampling.get(getattr(record, "sample", None) or record.name, 1.0)
+            if rate < 1.0 and random.random() >= rate:
+                return False
+        # Контекст читается здесь, в задаче апдейта, — в фоновом потоке его уже нет
+        record.update_id = update_id_var.get()
+        record.user_id = user_id_var.get()
+        record.state = state_var.get()
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler, который при переполненной очереди считает и отбрасывает запись."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Как в QueueHandler, но трассировка остаётся отдельным полем, а не частью message
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            DroppingQueueHandler.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key in ("update_id", "user_id", "state", "sample"):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _file_handler(filename: str) -> logging.Handler:
+    if LOG_ROTATION == "time":
+        handler = TimedRotatingFileHandler(filename, when=LOG_WHEN, backupCount=LOG_BACKUPS, encoding="utf-8")
+    else:
+        handler = RotatingFileHandler(filename, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8")
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+def setup_logging(filename: str = LOG_FILE):
+    """
+    Настраивает корневой логгер процесса. Вызывается один раз при старте;
+    у каждого процесса-обработчика (workers.py) должен быть свой файл —
+    ротация из нескольких процессов в один файл небезопасна.
+    """
+    global _listener
+    if _listener:
+        return
+    handlers = [_file_handler(filename)]
+    if LOG_CONSOLE:
+        console = logging.StreamHandler(sys.stderr)
+        console.setFormatter(JsonFormatter())
+        handlers.append(console)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter(LOG_SAMPLING))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает фоновый поток."""
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """Внешний middleware апдейтов: контекст для записей лога на время обработки."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        tokens = (
+            update_id_var.set(getattr(event, "update_id", None)),
+            user_id_var.set(user.id if user else None),
+            state_var.set(data.get("raw_state")),
+        )
+        try:
+            return await handler(event, data)
+        finally:
+            state_var.reset(tokens[2])
+            user_id_var.reset(tokens[1])
+            update_id_var.reset(tokens[0])
@@ -0,0 +1,172 @@
+# metrics.py
+"""
+Метрики производительности: гистограммы задержек и счётчики в памяти процесса.
+
+Гистограмма — фиксированные корзины (как в Prometheus), наблюдение стоит
+один bisect и два сложения. Источники:
+- HandlerMetricsMiddleware — время каждого хендлера по имени и состоянию FSM;
+- database.run_in_db / write_queue — время каждого запроса к БД (с ожиданием пула);
+- timed — обёртка для отдельных корутин (save_file);
+- ApiMetricsMiddleware — вызовы Bot API, их время и ошибки.
+Снимок отдаётся в формате Prometheus (start_metrics_server) и в /perf.
+В режиме WORKERS у каждого процесса свои метрики.
+"""
+import functools
+import time
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict
+
+from aiohttp import web
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+
+# Верхние границы корзин, секунды
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)   # последняя — +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля линейной интерполяцией внутри корзины."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                if i == len(BUCKETS):
+                    return lower
+                return lower + (BUCKETS[i] - lower) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+# (имя, ((метка, значение), ...)) -> Histogram / число
+histograms: Dict[tuple, Histogram] = {}
+counters = Counter()
+
+
+def observe(name: str, seconds: float, **labels):
+    key = (name, tuple(labels.items()))
+    histogram = histograms.get(key)
+    if histogram is None:
+        histogram = histograms[key] = Histogram()
+    histogram.observe(seconds)
+
+
+def inc(name: str, **labels):
+    counters[(name, tuple(labels.items()))] += 1
+
+
+def timed(name: str, **labels):
+    """Декоратор для корутин: время выполнения в гистограмму name."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                observe(name, time.perf_counter() - started, **labels)
+        return wrapper
+    return decorator
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Внутренний middleware: время хендлера по имени и состоянию FSM."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        state = data.get("raw_state") or ""
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            inc("handler_errors_total", handler=name, state=state)
+            raise
+        finally:
+            observe("handler_seconds", time.perf_counter() - started, handler=name, state=state)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: число, время и ошибки вызовов Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            inc("telegram_api_errors_total", method=name, error=type(e).__name__)
+            raise
+        finally:
+            inc("telegram_api_calls_total", method=name)
+            observe("telegram_api_seconds", time.perf_counter() - started, method=name)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = ((k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def render_prometheus() -> str:
+    lines, typed = [], set()
+    for (name, labels), value in sorted(counters.items()):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), histogram in sorted(histograms.items(), key=lambda kv: kv[0]):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, n in zip((*BUCKETS, "+Inf"), histogram.counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels((*labels, ('le', bound)))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+    return "\n".join(lines) + "\n"
+
+
+def top_histograms(name: str, limit: int = 10):
+    """Самые затратные по суммарному времени: [(метки, Histogram)]."""
+    items = [(dict(labels), h) for (n, labels), h in histograms.items() if n == name]
+    items.sort(key=lambda item: item[1].sum, reverse=True)
+    return items[:limit]
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=render_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Отдаёт /metrics в формате Prometheus; вызывающий закрывает runner.cleanup()."""
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
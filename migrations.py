@@ -0,0 +1,553 @@
+# migrations.py
+"""
+Версионированные миграции схемы messages.db.
+
+Текущая версия хранится в PRAGMA user_version. Миграции применяются по порядку,
+каждая в своей транзакции, поэтому повторный запуск ничего не меняет.
+У архивной БД (подключается как schema archive) — свой список ARCHIVE_MIGRATIONS
+и своя версия.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _create_messages(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            type TEXT,
+            message TEXT,
+            name TEXT,
+            position TEXT,
+            is_anonymous INTEGER,
+            reason TEXT,
+            file_path TEXT,
+            status TEXT DEFAULT 'Ожидает ответа',
+            answer TEXT DEFAULT '',
+            created_at TEXT
+        )
+    """)
+
+
+def _add_listing_indexes(conn):
+    # История пользователя: WHERE user_id = ? ORDER BY created_at DESC
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_user_created
+        ON messages (user_id, created_at, id)
+    """)
+    # Список обращений в админке: ORDER BY created_at DESC
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_created
+        ON messages (created_at, id)
+    """)
+
+
+def _add_inbox_filter_indexes(conn):
+    # Фильтры админки по статусу и типу с тем же порядком (created_at, id)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_status_created
+        ON messages (status, created_at, id)
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_messages_type_created
+        ON messages (type, created_at, id)
+    """)
+
+
+def _create_deliveries(conn):
+    # Результат доставки уведомления каждому получателю
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER,
+            chat_id INTEGER,
+            error TEXT,
+            created_at TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_deliveries_message
+        ON deliveries (message_id)
+    """)
+
+
+def _create_fsm_storage(conn):
+    # Состояния FSM (storage.SQLiteStorage), data — JSON
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at REAL
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated
+        ON fsm_storage (updated_at)
+    """)
+
+
+def _create_search_triggers(conn):
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, message, answer, name, position, reason)
+            VALUES (new.id, new.message, new.answer, new.name, new.position, new.reason);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message, answer, name, position, reason)
+            VALUES ('delete', old.id, old.message, old.answer, old.name, old.position, old.reason);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_fts_update
+        AFTER UPDATE OF message, answer, name, position, reason ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message, answer, name, position, reason)
+            VALUES ('delete', old.id, old.message, old.answer, old.name, old.position, old.reason);
+            INSERT INTO messages_fts (rowid, message, answer, name, position, reason)
+            VALUES (new.id, new.message, new.answer, new.name, new.position, new.reason);
+        END
+    """)
+
+
+def _create_search_index(conn):
+    # Полнотекстовый индекс по тексту, ответу и автору; синхронизируется триггерами
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+            message, answer, name, position, reason,
+            content='messages', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='3'
+        )
+    """)
+    _create_search_triggers(conn)
+    # Заполняем индекс для уже существующих обращений
+    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+
+
+def _create_stats(conn):
+    # Кому адресовано обращение и когда на него ответили — для статистики
+    conn.execute("ALTER TABLE messages ADD COLUMN recipient TEXT DEFAULT ''")
+    conn.execute("ALTER TABLE messages ADD COLUMN answered_at TEXT")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            name TEXT,
+            key TEXT,
+            value INTEGER,
+            PRIMARY KEY (name, key)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stats_daily (
+            day TEXT,
+            type TEXT,
+            created INTEGER,
+            answered INTEGER,
+            PRIMARY KEY (day, type)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS stats_answer_time (
+            day TEXT,
+            bucket INTEGER,
+            count INTEGER,
+            PRIMARY KEY (day, bucket)
+        ) WITHOUT ROWID
+    """)
+    # Счётчики по уже существующим обращениям. Получатель и время ответа
+    # раньше не сохранялись, поэтому по старым обращениям их нет
+    conn.execute("""
+        INSERT INTO stats_counters (name, key, value)
+        SELECT 'type', COALESCE(type, ''), COUNT(*) FROM messages GROUP BY type
+    """)
+    conn.execute("""
+        INSERT INTO stats_counters (name, key, value)
+        SELECT 'status', COALESCE(status, ''), COUNT(*) FROM messages GROUP BY status
+    """)
+    conn.execute("""
+        INSERT INTO stats_daily (day, type, created, answered)
+        SELECT substr(created_at, 1, 10), COALESCE(type, ''), COUNT(*), 0
+        FROM messages GROUP BY 1, 2
+    """)
+
+
+def _create_outbox(conn):
+    # Очередь исходящих сообщений (notify.py); deliveries становится журналом попыток
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            message_id INTEGER,
+            chat_id INTEGER,
+            kind TEXT,
+            text TEXT,
+            file_id TEXT,
+            file_path TEXT,
+            status TEXT,
+            attempts INTEGER DEFAULT 0,
+            next_attempt_at REAL,
+            last_error TEXT,
+            created_at TEXT,
+            sent_at TEXT
+        )
+    """)
+    # Только для неотправленных: очередь по времени и порядок внутри чата
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_due
+        ON outbox (next_attempt_at) WHERE status = 'pending'
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_chat
+        ON outbox (chat_id, id) WHERE status = 'pending'
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_outbox_message
+        ON outbox (message_id)
+    """)
+    conn.execute("ALTER TABLE deliveries ADD COLUMN outbox_id INTEGER")
+
+
+def _create_change_triggers(conn, now):
+    # now — SQL-выражение текущего времени в формате колонки updated_at
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS messages_change_insert AFTER INSERT ON messages BEGIN
+            UPDATE sequences SET value = value + 1 WHERE name = 'messages';
+            UPDATE messages
+            SET change_seq = (SELECT value FROM sequences WHERE name = 'messages'),
+                updated_at = COALESCE(new.updated_at, new.created_at)
+            WHERE id = new.id;
+        END
+    """)
+    # Перечислены все колонки, кроме самих change_seq и updated_at
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS messages_change_update
+        AFTER UPDATE OF user_id, type, message, name, position, is_anonymous, reason,
+                        file_path, status, answer, created_at, recipient, answered_at
+        ON messages BEGIN
+            UPDATE sequences SET value = value + 1 WHERE name = 'messages';
+            UPDATE messages
+            SET change_seq = (SELECT value FROM sequences WHERE name = 'messages'),
+                updated_at = {now}
+            WHERE id = new.id;
+        END
+    """)
+
+
+def _add_change_tracking(conn):
+    # Номер изменения (change_seq) и время изменения каждой строки — для
+    # инкрементального снимка экспорта и /export since. Ведутся триггерами,
+    # поэтому их не нужно помнить в каждом месте, которое пишет в messages
+    conn.execute("ALTER TABLE messages ADD COLUMN change_seq INTEGER")
+    conn.execute("ALTER TABLE messages ADD COLUMN updated_at TEXT")
+    conn.execute("UPDATE messages SET change_seq = id, updated_at = COALESCE(answered_at, created_at)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sequences (
+            name TEXT PRIMARY KEY,
+            value INTEGER
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        INSERT INTO sequences (name, value)
+        SELECT 'messages', COALESCE(MAX(id), 0) FROM messages
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_change_seq ON messages (change_seq)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_updated ON messages (updated_at)")
+    _create_change_triggers(conn, "strftime('%Y-%m-%d %H:%M:%S', 'now', 'localtime')")
+    # Готовые файлы экспорта (export.py): по одному актуальному на формат
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS export_snapshots (
+            format TEXT PRIMARY KEY,
+            path TEXT,
+            change_seq INTEGER,
+            max_id INTEGER,
+            rows INTEGER,
+            created_at TEXT
+        ) WITHOUT ROWID
+    """)
+
+
+# Формат v2: статус и тип — коды из справочников, время — секунды Unix
+V2_TIMESTAMP = "CAST(strftime('%s', {}, 'utc') AS INTEGER)"   # из локального "ГГГГ-ММ-ДД ЧЧ:ММ:СС"
+V2_NOW = "CAST(strftime('%s', 'now') AS INTEGER)"
+STATUS_CODES = (
+    (1, "Ожидает ответа"),
+    (2, "✅ Ответ отправлен"),
+)
+
+
+def _create_lookup_tables(conn, schema):
+    for table in ("message_statuses", "message_types"):
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {schema}.{table} (
+                code INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+        """)
+
+
+def _archive_attached(conn):
+    if not any(row[1] == "archive" for row in conn.execute("PRAGMA database_list")):
+        return False
+    return bool(conn.execute(
+        "SELECT 1 FROM archive.sqlite_master WHERE type = 'table' AND name = 'messages'"
+    ).fetchone())
+
+
+def _last_message_id(conn):
+    """Наибольший id, когда-либо выданный обращению: счётчик AUTOINCREMENT, messages и архив."""
+    values = [conn.execute("SELECT MAX(id) FROM main.messages").fetchone()[0]]
+    if conn.execute("SELECT 1 FROM main.sqlite_master WHERE name = 'sqlite_sequence'").fetchone():
+        values.append(conn.execute("SELECT MAX(seq) FROM main.sqlite_sequence WHERE name = 'messages'").fetchone()[0])
+    if _archive_attached(conn):
+        values.append(conn.execute("SELECT MAX(id) FROM archive.messages").fetchone()[0])
+    return max(value or 0 for value in values)
+
+
+def sync_message_sequence(conn, last_id=0):
+    """
+    Поднимает счётчик AUTOINCREMENT messages до last_id и до наибольшего id
+    в messages и архиве, чтобы новые обращения не получали id архивных.
+    """
+    last_id = max(last_id, _last_message_id(conn))
+    updated = conn.execute("UPDATE main.sqlite_sequence SET seq = ? WHERE name = 'messages' AND seq < ?",
+                           (last_id, last_id)).rowcount
+    if not updated and last_id and not conn.execute(
+            "SELECT 1 FROM main.sqlite_sequence WHERE name = 'messages'").fetchone():
+        conn.execute("INSERT INTO main.sqlite_sequence (name, seq) VALUES ('messages', ?)", (last_id,))
+
+
+def _rebuild_messages_v2(conn, schema, autoincrement):
+    """
+    Переписывает {schema}.messages в формат v2 (статус и тип — коды, время —
+    секунды Unix) и создаёт представление messages_readable с прежними,
+    человекочитаемыми значениями. Справочники уже заполнены, индексы и
+    триггеры создаёт вызывающий.
+    """
+    conn.execute(f"""
+        CREATE TABLE {schema}.messages_v2 (
+            id INTEGER PRIMARY KEY{" AUTOINCREMENT" if autoincrement else ""},
+            user_id INTEGER,
+            type INTEGER,
+            message TEXT,
+            name TEXT,
+            position TEXT,
+            is_anonymous INTEGER,
+            reason TEXT,
+            file_path TEXT,
+            status INTEGER,
+            answer TEXT DEFAULT '',
+            created_at INTEGER,
+            recipient TEXT DEFAULT '',
+            answered_at INTEGER,
+            change_seq INTEGER,
+            updated_at INTEGER
+        )
+    """)
+    conn.execute(f"""
+        INSERT INTO {schema}.messages_v2 (
+            id, user_id, type, message, name, position, is_anonymous, reason, file_path,
+            status, answer, created_at, recipient, answered_at, change_seq, updated_at
+        )
+        SELECT m.id, m.user_id, t.code, m.message, m.name, m.position, m.is_anonymous, m.reason, m.file_path,
+               s.code, m.answer, {V2_TIMESTAMP.format("m.created_at")}, m.recipient,
+               {V2_TIMESTAMP.format("m.answered_at")}, m.change_seq, {V2_TIMESTAMP.format("m.updated_at")}
+        FROM {schema}.messages m
+        LEFT JOIN {schema}.message_types t ON t.name = m.type
+        LEFT JOIN {schema}.message_statuses s ON s.name = m.status
+    """)
+    # DROP уносит и строку sqlite_sequence: без неё AUTOINCREMENT продолжит с
+    # MAX(id) оставшихся строк и выдаст заново id, уже ушедшие в архив
+    last_id = _last_message_id(conn) if autoincrement else 0
+    conn.execute(f"DROP TABLE {schema}.messages")
+    conn.execute(f"ALTER TABLE {schema}.messages_v2 RENAME TO messages")
+    if autoincrement:
+        sync_message_sequence(conn, last_id)
+    # Прежний вид строк — для экспорта и чтения человеком; *_ts и *_code —
+    # исходные колонки, по ним фильтруют и сортируют (работают индексы)
+    conn.execute(f"""
+        CREATE VIEW IF NOT EXISTS {schema}.messages_readable AS
+        SELECT m.id, m.user_id, t.name AS type, m.message, m.name, m.position, m.is_anonymous, m.reason,
+               m.file_path, s.name AS status, m.answer,
+               datetime(m.created_at, 'unixepoch', 'localtime') AS created_at, m.recipient,
+               datetime(m.answered_at, 'unixepoch', 'localtime') AS answered_at, m.change_seq,
+               datetime(m.updated_at, 'unixepoch', 'localtime') AS updated_at,
+               m.type AS type_code, m.status AS status_code,
+               m.created_at AS created_ts, m.updated_at AS updated_ts
+        FROM messages m
+        LEFT JOIN message_types t ON t.code = m.type
+        LEFT JOIN message_statuses s ON s.code = m.status
+    """)
+
+
+def _compact_encoding(conn):
+    # Справочники заполняются до переписывания таблицы: коды нужны для INSERT ... SELECT
+    _create_lookup_tables(conn, "main")
+    conn.executemany("INSERT OR IGNORE INTO message_statuses (code, name) VALUES (?, ?)", STATUS_CODES)
+    conn.execute("""
+        INSERT OR IGNORE INTO message_statuses (name)
+        SELECT DISTINCT status FROM messages WHERE status IS NOT NULL
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO message_types (name)
+        SELECT DISTINCT type FROM messages WHERE type IS NOT NULL ORDER BY type
+    """)
+    _rebuild_messages_v2(conn, "main", autoincrement=True)
+    conn.execute("CREATE INDEX idx_messages_user_created ON messages (user_id, created_at, id)")
+    conn.execute("CREATE INDEX idx_messages_created ON messages (created_at, id)")
+    conn.execute("CREATE INDEX idx_messages_status_created ON messages (status, created_at, id)")
+    conn.execute("CREATE INDEX idx_messages_type_created ON messages (type, created_at, id)")
+    conn.execute("CREATE INDEX idx_messages_change_seq ON messages (change_seq)")
+    conn.execute("CREATE INDEX idx_messages_updated ON messages (updated_at)")
+    # Текст не менялся, поэтому поисковый индекс (rowid = id) остаётся верным
+    _create_search_triggers(conn)
+    _create_change_triggers(conn, V2_NOW)
+
+
+def _create_dedup_index(conn):
+    # Отпечатки обращений и LSH-индекс для поиска похожих (dedup.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS message_fingerprints (
+            message_id INTEGER PRIMARY KEY,
+            signature BLOB,
+            cluster_id INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_fingerprints_cluster
+        ON message_fingerprints (cluster_id) WHERE cluster_id IS NOT NULL
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS message_bands (
+            key INTEGER,
+            message_id INTEGER,
+            PRIMARY KEY (key, message_id)
+        ) WITHOUT ROWID
+    """)
+    # Уже сохранённые обращения индексируются не здесь, а пачками в фоне
+    # (database.backfill_fingerprints): одна транзакция на все обращения надолго
+    # заняла бы запись. Обращения из архива не индексируются: они уже отвечены
+
+
+# Порядок важен: номер миграции = позиция в списке + 1
+MIGRATIONS = [
+    _create_messages,
+    _add_listing_indexes,
+    _add_inbox_filter_indexes,
+    _create_deliveries,
+    _create_fsm_storage,
+    _create_search_index,
+    _create_stats,
+    _create_outbox,
+    _add_change_tracking,
+    _compact_encoding,
+    _create_dedup_index,
+]
+
+
+def _create_archive_search_triggers(conn):
+    # Строки архива не меняются: их только добавляют и удаляют (при возврате в messages)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS archive.messages_fts_insert AFTER INSERT ON messages BEGIN
+            INSERT INTO messages_fts (rowid, message, answer, name, position, reason)
+            VALUES (new.id, new.message, new.answer, new.name, new.position, new.reason);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS archive.messages_fts_delete AFTER DELETE ON messages BEGIN
+            INSERT INTO messages_fts (messages_fts, rowid, message, answer, name, position, reason)
+            VALUES ('delete', old.id, old.message, old.answer, old.name, old.position, old.reason);
+        END
+    """)
+
+
+def _create_archive(conn):
+    # Архив отвеченных обращений (archive.py): те же колонки в том же порядке,
+    # что у messages, чтобы строки переносились как есть
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS archive.messages (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            type TEXT,
+            message TEXT,
+            name TEXT,
+            position TEXT,
+            is_anonymous INTEGER,
+            reason TEXT,
+            file_path TEXT,
+            status TEXT,
+            answer TEXT,
+            created_at TEXT,
+            recipient TEXT,
+            answered_at TEXT,
+            change_seq INTEGER,
+            updated_at TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_messages_user_created ON messages (user_id, created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_messages_created ON messages (created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_messages_change_seq ON messages (change_seq)")
+    conn.execute("CREATE INDEX IF NOT EXISTS archive.idx_messages_updated ON messages (updated_at)")
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS archive.messages_fts USING fts5(
+            message, answer, name, position, reason,
+            content='messages', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='3'
+        )
+    """)
+    _create_archive_search_triggers(conn)
+
+
+def _compact_archive(conn):
+    # Коды общие с основной БД: сначала туда добавляются значения, которые
+    # остались только в архиве, затем справочники копируются в архив
+    conn.execute("""
+        INSERT OR IGNORE INTO main.message_statuses (name)
+        SELECT DISTINCT status FROM archive.messages WHERE status IS NOT NULL
+    """)
+    conn.execute("""
+        INSERT OR IGNORE INTO main.message_types (name)
+        SELECT DISTINCT type FROM archive.messages WHERE type IS NOT NULL
+    """)
+    _create_lookup_tables(conn, "archive")
+    for table in ("message_statuses", "message_types"):
+        conn.execute(f"INSERT OR IGNORE INTO archive.{table} SELECT code, name FROM main.{table}")
+    _rebuild_messages_v2(conn, "archive", autoincrement=False)
+    conn.execute("CREATE INDEX archive.idx_messages_user_created ON messages (user_id, created_at)")
+    conn.execute("CREATE INDEX archive.idx_messages_created ON messages (created_at)")
+    conn.execute("CREATE INDEX archive.idx_messages_change_seq ON messages (change_seq)")
+    conn.execute("CREATE INDEX archive.idx_messages_updated ON messages (updated_at)")
+    _create_archive_search_triggers(conn)
+
+
+# Архивные миграции используют справочники основной БД — применяются после MIGRATIONS
+ARCHIVE_MIGRATIONS = [
+    _create_archive,
+    _compact_archive,
+]
+
+
+def get_version(conn, schema="main"):
+    return conn.execute(f"PRAGMA {schema}.user_version").fetchone()[0]
+
+
+def apply_migrations(conn, target=None, migrations=MIGRATIONS, schema="main"):
+    """
+    Применяет все миграции новее текущей версии (или до target включительно).
+    Возвращает итоговую версию схемы.
+    """
+    target = len(migrations) if target is None else target
+    version = get_version(conn, schema)
+    while version < target:
+        migration = migrations[version]
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migration(conn)
+            conn.execute(f"PRAGMA {schema}.user_version = {version + 1}")
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        version += 1
+        logger.info(f"Схема {schema} обновлена до версии {version} ({migration.__name__})")
+    return version
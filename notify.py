@@ -0,0 +1,235 @@
+# notify.py
+"""
+Исходящие сообщения через постоянную очередь (таблица outbox).
+
+enqueue только записывает сообщения в очередь, отправляет их OutboxScheduler:
+не чаще глобального лимита Telegram и не чаще раза в CHAT_INTERVAL в один чат,
+по порядку внутри чата. RetryAfter выдерживается (для всего бота), временные
+ошибки повторяются с экспоненциальной задержкой, постоянные (бот заблокирован,
+чат не найден) и исчерпавшие попытки помечаются как недоставленные (dead).
+Каждая попытка пишется в deliveries. Доставка «как минимум один раз»:
+при падении между отправкой и записью результата сообщение уйдёт повторно.
+
+Вложение передаётся по file_id: исходный file_id пользователя либо file_id,
+полученный после единственной загрузки локального файла.
+"""
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramMigrateToChat,
+    TelegramNotFound, TelegramRetryAfter, TelegramUnauthorizedError
+)
+from aiogram.types import FSInputFile
+
+from database import (
+    OUTBOX_PENDING, OUTBOX_SENT, OUTBOX_DEAD,
+    enqueue_outbox, fetch_due_outbox, next_outbox_at, record_outbox_attempt, purge_outbox
+)
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_CONCURRENCY = 10
+OUTBOX_RATE = 25          # сообщений в секунду на весь бот (лимит Telegram — около 30)
+CHAT_INTERVAL = 1.0       # секунд между сообщениями в один чат
+OUTBOX_BATCH = 50
+POLL_INTERVAL = 1.0       # очередь могут пополнять другие процессы (workers.py)
+MAX_ATTEMPTS = 8
+BACKOFF_BASE = 2.0        # секунды: 2, 4, 8, ... но не больше BACKOFF_MAX
+BACKOFF_MAX = 600.0
+OUTBOX_RETENTION = timedelta(days=7)
+PURGE_INTERVAL = 3600
+
+# Ошибки, которые не исправятся повтором
+PERMANENT_ERRORS = (
+    TelegramForbiddenError, TelegramBadRequest, TelegramNotFound,
+    TelegramMigrateToChat, TelegramUnauthorizedError, FileNotFoundError
+)
+
+
+@dataclass
+class Attachment:
+    kind: str                 # "document" или "photo"
+    file_id: str | None = None
+    path: str | None = None   # используется, только если нет file_id
+
+
+class RateLimiter:
+    """Равномерно распределяет вызовы: не больше rate в секунду."""
+
+    def __init__(self, rate: float):
+        self._interval = 1 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds: float):
+        """Ни одного вызова ближайшие seconds секунд (RetryAfter от Telegram)."""
+        self._next = max(self._next, asyncio.get_running_loop().time() + seconds)
+
+
+# Планировщик этого процесса (если запущен) — чтобы enqueue будил его сразу
+_scheduler = None
+
+
+async def enqueue(chat_ids, text: str, attachment: Attachment | None = None, message_id=None):
+    """
+    Ставит в очередь text (и вложение) для всех chat_ids.
+    Статус доставки — в outbox/deliveries по message_id (см. /outbox).
+    """
+    items = []
+    for chat_id in chat_ids:
+        items.append((message_id, chat_id, "text", text, None, None))
+        if attachment:
+            items.append((message_id, chat_id, attachment.kind, None, attachment.file_id, attachment.path))
+    await enqueue_outbox(items)
+    if _scheduler:
+        _scheduler.wake()
+
+
+def backoff_delay(attempts: int) -> float:
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _sent_file_id(sent, kind: str):
+    if kind == "photo":
+        return sent.photo[-1].file_id
+    return sent.document.file_id
+
+
+class OutboxScheduler:
+    def __init__(self, bot: Bot, rate: float = OUTBOX_RATE, chat_interval: float = CHAT_INTERVAL,
+                 poll_interval: float = POLL_INTERVAL):
+        self.bot = bot
+        self.chat_interval = chat_interval
+        self.poll_interval = poll_interval
+        self._limiter = RateLimiter(rate)
+        self._chat_next = {}      # chat_id -> когда можно писать в чат снова
+        self._semaphore = asyncio.Semaphore(OUTBOX_CONCURRENCY)
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._purged_at = 0.0
+
+    def start(self):
+        global _scheduler
+        _scheduler = self
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        global _scheduler
+        if _scheduler is self:
+            _scheduler = None
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def _send(self, chat_id, kind, text, file_id, file_path):
+        await self._limiter.wait()
+        if kind == "text":
+            return await self.bot.send_message(chat_id, text)
+        media = file_id or FSInputFile(file_path)
+        if kind == "photo":
+            return await self.bot.send_photo(chat_id, media)
+        return await self.bot.send_document(chat_id, media)
+
+    async def _deliver(self, row):
+        outbox_id, message_id, chat_id, kind, text, file_id, file_path, attempts = row
+        async with self._semaphore:
+            try:
+                sent = await self._send(chat_id, kind, text, file_id, file_path)
+                self._chat_next[chat_id] = time.time() + self.chat_interval
+            except TelegramRetryAfter as e:
+                # Флуд-контроль: ждать нужно всему боту, попытка не засчитывается
+                logger.warning(f"Outbox #{outbox_id}: RetryAfter {e.retry_after} с")
+                self._limiter.pause(e.retry_after)
+                await record_outbox_attempt(outbox_id, OUTBOX_PENDING, attempts, str(e),
+                                            retry_at=time.time() + e.retry_after)
+                return
+            except Exception as e:
+                attempts += 1
+                if isinstance(e, PERMANENT_ERRORS) or attempts >= MAX_ATTEMPTS:
+                    logger.error(f"Outbox #{outbox_id}: не доставлено в {chat_id}: {e}")
+                    await record_outbox_attempt(outbox_id, OUTBOX_DEAD, attempts, str(e))
+                else:
+                    logger.warning(f"Outbox #{outbox_id}: ошибка отправки в {chat_id}, попытка {attempts}: {e}")
+                    await record_outbox_attempt(outbox_id, OUTBOX_PENDING, attempts, str(e),
+                                                retry_at=time.time() + backoff_delay(attempts))
+                return
+
+            uploaded = _sent_file_id(sent, kind) if kind != "text" and not file_id else None
+            await record_outbox_attempt(outbox_id, OUTBOX_SENT, attempts + 1, file_id=uploaded)
+
+    async def run_once(self) -> float:
+        """
+        Отправляет всё, что можно отправить сейчас.
+        Возвращает, через сколько секунд стоит проверить очередь снова.
+        """
+        now = time.time()
+        rows = await fetch_due_outbox(now, OUTBOX_BATCH)
+        batch, uploading, wait = [], set(), self.poll_interval
+        for row in rows:
+            chat_id, file_id, file_path = row[2], row[5], row[6]
+            ready_at = self._chat_next.get(chat_id, 0)
+            if ready_at > now:
+                wait = min(wait, ready_at - now)
+                continue
+            if not file_id and file_path:
+                # Локальный файл грузим один раз, остальным — file_id после загрузки
+                if file_path in uploading:
+                    continue
+                uploading.add(file_path)
+            batch.append(row)
+
+        if batch:
+            await asyncio.gather(*(self._deliver(row) for row in batch))
+            return 0
+
+        # Отметки старше интервала больше ничего не ограничивают
+        self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+        if not rows:
+            next_at = await next_outbox_at()
+            if next_at is not None:
+                wait = min(wait, max(next_at - now, 0))
+        return wait
+
+    async def _purge(self):
+        if time.monotonic() - self._purged_at < PURGE_INTERVAL:
+            return
+        self._purged_at = time.monotonic()
+        older_than = (datetime.now() - OUTBOX_RETENTION).strftime("%Y-%m-%d %H:%M:%S")
+        await purge_outbox(older_than)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await self._purge()
+                wait = await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка планировщика outbox: {e}")
+                wait = self.poll_interval
+            if wait > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
@@ -0,0 +1,115 @@
+# stats.py
+"""
+Счётчики для /stats, обновляемые в тех же транзакциях, что и запись обращений.
+
+stats_counters — текущие значения по измерениям: type, status и open_recipient
+(обращения к руководителю без ответа); stats_daily — сколько обращений создано
+и отвечено за день по типам; stats_answer_time — гистограмма времени ответа по
+дням (логарифмические корзины), из неё считается медиана. /stats читает только
+эти таблицы и никогда не сканирует messages.
+"""
+import math
+from datetime import datetime, timedelta
+
+BUCKETS_PER_OCTAVE = 4   # точность медианы — около 20%
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def answer_bucket(seconds):
+    return int(math.log2(max(seconds, 0) + 1) * BUCKETS_PER_OCTAVE)
+
+
+def bucket_seconds(bucket):
+    # Середина корзины в логарифмической шкале
+    return 2 ** ((bucket + 0.5) / BUCKETS_PER_OCTAVE) - 1
+
+
+def _bump(conn, name, key, delta=1):
+    conn.execute("""
+        INSERT INTO stats_counters (name, key, value) VALUES (?, ?, ?)
+        ON CONFLICT (name, key) DO UPDATE SET value = value + excluded.value
+    """, (name, key or "", delta))
+
+
+def _bump_daily(conn, day, msg_type, created=0, answered=0):
+    conn.execute("""
+        INSERT INTO stats_daily (day, type, created, answered) VALUES (?, ?, ?, ?)
+        ON CONFLICT (day, type) DO UPDATE
+        SET created = created + excluded.created, answered = answered + excluded.answered
+    """, (day, msg_type or "", created, answered))
+
+
+def record_created(conn, msg_type, status, recipient, created_at):
+    """Вызывается внутри транзакции insert_message."""
+    _bump(conn, "type", msg_type)
+    _bump(conn, "status", status)
+    if recipient:
+        _bump(conn, "open_recipient", recipient)
+    _bump_daily(conn, created_at[:10], msg_type, created=1)
+
+
+def record_status_change(conn, msg_type, recipient, old_status, new_status, pending_status,
+                         created_at, answered_at):
+    """
+    Вызывается внутри транзакции update_status_and_response.
+    answered_at передаётся, только если обращение получило первый ответ.
+    """
+    if old_status != new_status:
+        _bump(conn, "status", old_status, -1)
+        _bump(conn, "status", new_status)
+        if recipient and old_status == pending_status:
+            _bump(conn, "open_recipient", recipient, -1)
+        elif recipient and new_status == pending_status:
+            _bump(conn, "open_recipient", recipient)
+    if answered_at:
+        _bump_daily(conn, answered_at[:10], msg_type, answered=1)
+        if created_at:
+            seconds = (datetime.strptime(answered_at, TIME_FORMAT)
+                       - datetime.strptime(created_at, TIME_FORMAT)).total_seconds()
+            conn.execute("""
+                INSERT INTO stats_answer_time (day, bucket, count) VALUES (?, ?, 1)
+                ON CONFLICT (day, bucket) DO UPDATE SET count = count + 1
+            """, (answered_at[:10], answer_bucket(seconds)))
+
+
+def _median_seconds(histogram):
+    total = sum(count for _, count in histogram)
+    if not total:
+        return None
+    seen = 0
+    for bucket, count in histogram:
+        seen += count
+        if seen * 2 >= total:
+            return bucket_seconds(bucket)
+
+
+def collect_stats(conn, now=None, windows=(1, 7, 30), daily_days=7):
+    now = now or datetime.now()
+    counters = {}
+    for name, key, value in conn.execute("SELECT name, key, value FROM stats_counters WHERE value != 0"):
+        counters.setdefault(name, {})[key] = value
+
+    result = {
+        "by_status": counters.get("status", {}),
+        "by_type": counters.get("type", {}),
+        "open_by_recipient": counters.get("open_recipient", {}),
+        "windows": [],
+    }
+    for days in windows:
+        since = (now - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        created, answered = conn.execute("""
+            SELECT COALESCE(SUM(created), 0), COALESCE(SUM(answered), 0)
+            FROM stats_daily WHERE day >= ?
+        """, (since,)).fetchone()
+        histogram = conn.execute("""
+            SELECT bucket, SUM(count) FROM stats_answer_time
+            WHERE day >= ? GROUP BY bucket ORDER BY bucket
+        """, (since,)).fetchall()
+        result["windows"].append((days, created, answered, _median_seconds(histogram)))
+
+    since = (now - timedelta(days=daily_days - 1)).strftime("%Y-%m-%d")
+    result["daily"] = conn.execute("""
+        SELECT day, SUM(created), SUM(answered) FROM stats_daily
+        WHERE day >= ? GROUP BY day ORDER BY day
+    """, (since,)).fetchall()
+    return result
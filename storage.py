@@ -0,0 +1,135 @@
+# storage.py
+"""
+FSM-хранилище на SQLite с кэшем в памяти.
+
+Чтение и запись состояния идут в словарь (скорость как у MemoryStorage),
+изменённые записи сбрасываются в таблицу fsm_storage пачкой раз в
+flush_interval секунд. Записи без обращений дольше idle_ttl вытесняются из
+памяти (и подгружаются из БД при следующем обращении), а разговоры, не
+менявшиеся дольше retention, удаляются из БД.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from database import load_fsm_record, save_fsm_records, purge_fsm_records
+
+logger = logging.getLogger(__name__)
+
+
+class _Record:
+    __slots__ = ("state", "data", "last_access")
+
+    def __init__(self, state=None, data=None):
+        self.state = state
+        self.data = data or {}
+        self.last_access = time.monotonic()
+
+
+def _build_key(key: StorageKey) -> str:
+    return ":".join(str(part) if part is not None else "" for part in (
+        key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny
+    ))
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, flush_interval: float = 1.0, idle_ttl: float = 3600,
+                 retention: float = 30 * 24 * 3600):
+        self.flush_interval = flush_interval
+        self.idle_ttl = idle_ttl
+        self.retention = retention
+        self._cache: Dict[str, _Record] = {}
+        self._dirty: set = set()
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+    async def _get(self, key: StorageKey) -> tuple[str, _Record]:
+        k = _build_key(key)
+        record = self._cache.get(k)
+        if record is None:
+            row = await load_fsm_record(k)
+            loaded = _Record(row[0], json.loads(row[1])) if row else _Record()
+            # Пока шла загрузка, запись могли создать параллельно — её не перетираем
+            record = self._cache.setdefault(k, loaded)
+        record.last_access = time.monotonic()
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop())
+        return k, record
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        k, record = await self._get(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._dirty.add(k)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._get(key)
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        k, record = await self._get(key)
+        record.data = data.copy()
+        self._dirty.add(k)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, record = await self._get(key)
+        return record.data.copy()
+
+    async def get_record(self, key: StorageKey) -> tuple[Optional[str], Dict[str, Any]]:
+        """Состояние и копия данных за одно обращение."""
+        _, record = await self._get(key)
+        return record.state, record.data.copy()
+
+    async def set_record(self, key: StorageKey, state: Optional[str], data: Dict[str, Any]) -> None:
+        """Записывает состояние и данные разом; data переходит во владение хранилища."""
+        k, record = await self._get(key)
+        record.state = state
+        record.data = data
+        self._dirty.add(k)
+
+    async def flush(self) -> None:
+        if not self._dirty:
+            return
+        keys, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        for k in keys:
+            record = self._cache.get(k)
+            if record is None:
+                continue
+            if record.state is None and not record.data:
+                deletes.append(k)
+            else:
+                upserts.append((k, record.state, json.dumps(record.data, ensure_ascii=False)))
+        try:
+            await save_fsm_records(upserts, deletes)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения FSM-состояний: {e}")
+            self._dirty |= keys
+
+    def _evict_idle(self) -> None:
+        deadline = time.monotonic() - self.idle_ttl
+        for k in [k for k, r in self._cache.items() if r.last_access < deadline and k not in self._dirty]:
+            del self._cache[k]
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                self._evict_idle()
+                now = time.time()
+                if now - self._last_purge > 3600:
+                    self._last_purge = now
+                    await purge_fsm_records(now - self.retention)
+            except Exception as e:
+                logger.error(f"Ошибка фонового сброса FSM-состояний: {e}")
+
+    async def close(self) -> None:
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
@@ -0,0 +1,146 @@
+# throttle.py
+"""
+Ограничение частоты апдейтов от одного пользователя и из одного чата.
+
+ThrottleMiddleware стоит на уровне апдейтов диспетчера, после FSM-middleware
+(нужно текущее состояние), то есть раньше любых роутеров. Для каждого
+пользователя и чата ведутся token bucket'ы: дешёвые шаги формы тратят общий
+бюджет "cheap", дорогие (вложения, отправка обращения, /export) — ещё и свой
+"expensive". Апдейт сверх бюджета отбрасывается, повтор того же текста сразу
+за предыдущим схлопывается. Счётчики отброшенного — в throttle_stats.
+"""
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, NamedTuple
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import TelegramObject, Update
+
+
+class Budget(NamedTuple):
+    capacity: float   # размер всплеска
+    rate: float       # пополнение, токенов в секунду
+
+
+BUDGETS = {
+    "cheap": Budget(capacity=8, rate=1.0),
+    "expensive": Budget(capacity=3, rate=1 / 20),
+    "chat": Budget(capacity=20, rate=3.0),       # общий на чат, важен для групп
+}
+DUPLICATE_WINDOW = 1.0   # секунды, в которые повтор того же текста схлопывается
+EVICT_INTERVAL = 60.0
+
+throttle_stats = Counter()
+
+
+class TokenBuckets:
+    """
+    Ключ (имя бюджета, id) -> [токены, время обновления]. Запись, не трогавшаяся
+    дольше времени полного пополнения, ничем не отличается от новой и удаляется.
+    """
+
+    def __init__(self, budgets=BUDGETS):
+        self.budgets = budgets
+        self._buckets = {}
+        self._evicted_at = time.monotonic()
+
+    def take(self, name, key, now, cost=1.0) -> bool:
+        budget = self.budgets[name]
+        bucket = self._buckets.get((name, key))
+        if bucket is None:
+            bucket = self._buckets[(name, key)] = [budget.capacity, now]
+        else:
+            bucket[0] = min(budget.capacity, bucket[0] + (now - bucket[1]) * budget.rate)
+            bucket[1] = now
+        if bucket[0] < cost:
+            return False
+        bucket[0] -= cost
+        return True
+
+    def evict(self, now) -> bool:
+        if now - self._evicted_at < EVICT_INTERVAL:
+            return False
+        self._evicted_at = now
+        self._buckets = {
+            (name, key): bucket for (name, key), bucket in self._buckets.items()
+            if now - bucket[1] < self.budgets[name].capacity / self.budgets[name].rate
+        }
+        return True
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def __contains__(self, key):
+        return key in self._buckets
+
+
+class ThrottleMiddleware(BaseMiddleware):
+    """
+    expensive_states — состояния FSM, в которых любой апдейт дорогой
+    (например, шаг с файлом, завершающий отправку обращения).
+    """
+
+    def __init__(self, expensive_states=(), expensive_commands=("/export",)):
+        self.expensive_states = set(expensive_states)
+        self.expensive_commands = tuple(expensive_commands)
+        self.buckets = TokenBuckets()
+        self._last_text = {}   # user_id -> (текст, время) для схлопывания повторов
+        self._warned = set()   # кому уже сказали «подождите» в текущем эпизоде
+
+    def _is_expensive(self, update: Update, raw_state) -> bool:
+        if raw_state in self.expensive_states:
+            return True
+        message = update.message
+        if not message:
+            return False
+        if message.document or message.photo or message.video or message.audio:
+            return True
+        return bool(message.text and message.text.startswith(self.expensive_commands))
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+        chat = data.get("event_chat")
+        now = time.monotonic()
+        if self.buckets.evict(now):
+            self._last_text = {k: v for k, v in self._last_text.items() if now - v[1] < DUPLICATE_WINDOW}
+            self._warned = {k for k in self._warned if ("cheap", k) in self.buckets}
+
+        text = event.message.text if event.message else None
+        if text:
+            last = self._last_text.get(user.id)
+            self._last_text[user.id] = (text, now)
+            if last and last[0] == text and now - last[1] < DUPLICATE_WINDOW:
+                throttle_stats["coalesced"] += 1
+                return None
+
+        expensive = self._is_expensive(event, data.get("raw_state"))
+        allowed = self.buckets.take("cheap", user.id, now)
+        if allowed and expensive:
+            allowed = self.buckets.take("expensive", user.id, now)
+        if allowed and chat and chat.id != user.id:
+            allowed = self.buckets.take("chat", chat.id, now)
+
+        if not allowed:
+            throttle_stats["dropped_expensive" if expensive else "dropped_cheap"] += 1
+            if event.message and user.id not in self._warned:
+                # Предупреждаем один раз за эпизод, дальше молча отбрасываем
+                self._warned.add(user.id)
+                await event.message.answer("⏳ Слишком много сообщений подряд, подождите немного.")
+            if event.callback_query:
+                # Без ответа кнопка «крутится», пока Telegram не отменит запрос по таймауту
+                try:
+                    await event.callback_query.answer("⏳ Слишком часто, подождите немного.")
+                except TelegramAPIError:
+                    pass
+            return None
+
+        self._warned.discard(user.id)
+        return await handler(event, data)
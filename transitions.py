@@ -0,0 +1,113 @@
+# transitions.py
+"""
+Переходы по шагам формы за одно чтение и одну запись FSM-хранилища.
+
+FormContextMiddleware загружает состояние и данные пользователя один раз на
+апдейт и передаёт хендлеру объект FormContext (аргумент form). Хендлер меняет
+состояние, данные и историю «Назад» в памяти, а после его завершения всё
+сохраняется одной записью — и только если что-то изменилось.
+"""
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.types import TelegramObject
+
+HISTORY_KEY = "history"
+
+
+class FormContext:
+    def __init__(self, fsm: FSMContext, group: type[StatesGroup], state: Optional[str], data: Dict[str, Any]):
+        self.fsm = fsm
+        self.group = group
+        self.state = state
+        self.data = data
+        self.changed = False
+
+    @classmethod
+    async def load(cls, fsm: FSMContext, group: type[StatesGroup]) -> "FormContext":
+        storage = fsm.storage
+        if hasattr(storage, "get_record"):
+            state, data = await storage.get_record(fsm.key)
+        else:
+            state, data = await fsm.get_state(), await fsm.get_data()
+        return cls(fsm, group, state, data)
+
+    async def commit(self) -> None:
+        if not self.changed:
+            return
+        storage = self.fsm.storage
+        if hasattr(storage, "set_record"):
+            await storage.set_record(self.fsm.key, self.state, self.data)
+        else:
+            await self.fsm.set_state(self.state)
+            await self.fsm.set_data(self.data)
+        self.changed = False
+
+    def update(self, **kwargs) -> None:
+        self.data.update(kwargs)
+        self.changed = True
+
+    # История хранится короткими именами шагов группы: ["choosing_manager", ...]
+    def _short_name(self, state: str) -> str:
+        return state.split(":")[-1]
+
+    def _full_name(self, name: str) -> Optional[str]:
+        state = getattr(self.group, name, None)
+        return state.state if isinstance(state, State) else None
+
+    def goto(self, state: State) -> None:
+        """Переходит в state, запоминая текущий шаг для «Назад»."""
+        if self.state and self.state != state.state:
+            current = self._short_name(self.state)
+            history = self.data.setdefault(HISTORY_KEY, [])
+            if not history or history[-1] != current:
+                history.append(current)
+        self.state = state.state
+        self.changed = True
+
+    def back(self) -> Optional[str]:
+        """
+        Возвращается на предыдущий шаг. Возвращает его короткое имя
+        или None, если шагов в истории нет.
+        """
+        history = self.data.get(HISTORY_KEY)
+        while history:
+            name = self._short_name(history.pop())
+            full_name = self._full_name(name)
+            if full_name:
+                self.state = full_name
+                self.changed = True
+                return name
+        return None
+
+    def reset(self) -> None:
+        """Выход в главное меню: сбрасывает состояние, данные и историю."""
+        self.state = None
+        self.data = {}
+        self.changed = True
+
+
+class FormContextMiddleware(BaseMiddleware):
+    """Внутренний middleware роутера: передаёт FormContext хендлерам с аргументом form."""
+
+    def __init__(self, group: type[StatesGroup]):
+        self.group = group
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        fsm = data.get("state")
+        if fsm is None or handler_object is None or "form" not in handler_object.params:
+            return await handler(event, data)
+
+        form = await FormContext.load(fsm, self.group)
+        data["form"] = form
+        result = await handler(event, data)
+        await form.commit()
+        return result
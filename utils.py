@@ -1,45 +1,94 @@
+import asyncio
 import logging
+import uuid
+from contextlib import aclosing
 from pathlib import Path
 from aiogram.types import Message
 import aiofiles
 
-logging.basicConfig(
-    filename='bot.log',
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+from config import MAX_FILE_SIZE, DOWNLOAD_CHUNK_SIZE, MAX_CONCURRENT_DOWNLOADS
+from metrics import timed
 
+logger = logging.getLogger(__name__)
 
+DOWNLOAD_TIMEOUT = 60
+
+# Ограничивает число одновременных скачиваний на весь процесс
+_download_semaphore = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)
+
+
+class FileTooLargeError(ValueError):
+    pass
+
+
+@timed("save_file_seconds")
 async def save_file(message: Message) -> str:
     """
     Сохраняет документ или фото в папку uploads.
+    Файл скачивается потоково, кусками по DOWNLOAD_CHUNK_SIZE, прямо на диск;
+    если он больше MAX_FILE_SIZE — выбрасывает FileTooLargeError.
     Возвращает путь к сохранённому файлу.
     """
     if message.document:
         # Документы
         file_id = message.document.file_id
-        file_name = message.document.file_name
+        # Префикс — чтобы одноимённые вложения разных обращений не перезаписывали друг друга
+        original = Path(message.document.file_name or "file").name
+        file_name = f"{message.from_user.id}_{message.document.file_unique_id}_{original}"
+        file_size = message.document.file_size
     elif message.photo:
         # Фото
         photo = message.photo[-1]  # самое большое
         file_id = photo.file_id
         file_name = f"{message.from_user.id}_{photo.file_unique_id}.jpg"
+        file_size = photo.file_size
     else:
         raise ValueError("Сообщение не содержит документа или фото.")
 
-    # Получаем файл
-    file = await message.bot.get_file(file_id)
-    file_stream = await message.bot.download_file(file.file_path)  # это BinaryIO
+    if file_size and file_size > MAX_FILE_SIZE:
+        raise FileTooLargeError(f"Файл {file_name} больше {MAX_FILE_SIZE} байт.")
 
-    # Сохраняем файл в uploads
     path = Path("uploads") / file_name
     path.parent.mkdir(exist_ok=True)
+    # Своё временное имя у каждого скачивания: параллельные загрузки одного
+    # файла не обрезают друг другу .part
+    part_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+    bot = message.bot
 
-    async with aiofiles.open(path, "wb") as f:
-        await f.write(file_stream.read())  # читаем напрямую из BinaryIO
-
-    logging.info(f"Файл сохранён: {path}")
-    return str(path)
+    async with _download_semaphore:
+        # Получаем файл
+        file = await bot.get_file(file_id)
+        if file.file_size and file.file_size > MAX_FILE_SIZE:
+            raise FileTooLargeError(f"Файл {file_name} больше {MAX_FILE_SIZE} байт.")
 
+        if bot.session.api.is_local:
+            # Локальный Bot API сервер отдаёт файл с диска — просто копируем
+            try:
+                await bot.download_file(file.file_path, destination=part_path, chunk_size=DOWNLOAD_CHUNK_SIZE)
+                part_path.replace(path)
+            except BaseException:
+                part_path.unlink(missing_ok=True)
+                raise
+            logger.info(f"Файл сохранён: {path}", extra={"sample": "file_saved"})
+            return str(path)
 
+        url = bot.session.api.file_url(bot.token, file.file_path)
+        size = 0
+        try:
+            async with aiofiles.open(part_path, "wb") as f:
+                stream = bot.session.stream_content(
+                    url=url, timeout=DOWNLOAD_TIMEOUT, chunk_size=DOWNLOAD_CHUNK_SIZE
+                )
+                async with aclosing(stream):
+                    async for chunk in stream:
+                        size += len(chunk)
+                        if size > MAX_FILE_SIZE:
+                            raise FileTooLargeError(f"Файл {file_name} больше {MAX_FILE_SIZE} байт.")
+                        await f.write(chunk)
+            part_path.replace(path)
+        except BaseException:
+            part_path.unlink(missing_ok=True)
+            raise
 
+    logger.info(f"Файл сохранён: {path} ({size} байт)", extra={"sample": "file_saved"})
+    return str(path)
@@ -0,0 +1,112 @@
+# webhook.py
+"""
+Режим webhook: aiohttp-сервер принимает апдейты от Telegram.
+
+Запрос проверяется по секретному токену (без WEBHOOK_SECRET и WEBHOOK_URL
+режим не запускается: сервер слушает внешний адрес, и без секрета любой мог бы
+прислать апдейт от имени админа) и подтверждается сразу, а апдейт
+обрабатывается в фоновой задаче; одновременно обрабатывается не больше
+max_concurrency апдейтов. При остановке сервер перестаёт принимать запросы и
+дожидается уже принятых апдейтов.
+"""
+import asyncio
+import hmac
+import json
+import logging
+import re
+import signal
+from typing import Awaitable, Callable
+
+from aiohttp import web
+from aiogram import Bot
+from aiogram.types import Update
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+SHUTDOWN_TIMEOUT = 30
+# Допустимый secret_token для setWebhook: 1–256 символов A-Z, a-z, 0-9, _ и -
+SECRET_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,256}")
+
+
+def check_webhook_config(url: str | None, secret: str | None):
+    """Без адреса или секрета режим webhook не запускается — ValueError."""
+    if not url:
+        raise ValueError("Для BOT_MODE=webhook нужен WEBHOOK_URL")
+    if not secret:
+        raise ValueError("Для BOT_MODE=webhook нужен WEBHOOK_SECRET")
+    if not SECRET_PATTERN.fullmatch(secret):
+        raise ValueError("WEBHOOK_SECRET: 1–256 символов A-Z, a-z, 0-9, _ и -")
+
+
+class WebhookServer:
+    def __init__(self, bot: Bot, feed: Callable[[Update], Awaitable], secret: str,
+                 max_concurrency: int = 100):
+        if not secret:
+            raise ValueError("WebhookServer требует секретный токен")
+        self.bot = bot
+        self.feed = feed
+        self.secret = secret.encode()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._closing = False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        # Сравнение за постоянное время — секрет не подбирается по времени ответа
+        if not hmac.compare_digest(request.headers.get(SECRET_HEADER, "").encode(), self.secret):
+            return web.Response(status=401)
+        if self._closing:
+            # Telegram повторит доставку после перезапуска
+            return web.Response(status=503)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except (json.JSONDecodeError, UnicodeDecodeError, ValidationError) as e:
+            logger.warning(f"Отклонён некорректный апдейт: {e}")
+            return web.Response(status=400)
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update):
+        async with self._semaphore:
+            try:
+                await self.feed(update)
+            except Exception as e:
+                logger.error(f"Ошибка обработки апдейта {update.update_id}: {e}")
+
+    async def shutdown(self):
+        self._closing = True
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=SHUTDOWN_TIMEOUT)
+
+    def make_app(self, path: str) -> web.Application:
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+        return app
+
+
+async def run_webhook(bot: Bot, feed: Callable[[Update], Awaitable], *, url: str, path: str,
+                      host: str, port: int, secret: str, max_concurrency: int,
+                      allowed_updates: list[str] | None = None):
+    """Регистрирует webhook в Telegram и обслуживает его до SIGINT/SIGTERM."""
+    check_webhook_config(url, secret)
+    server = WebhookServer(bot, feed, secret, max_concurrency)
+    runner = web.AppRunner(server.make_app(path))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    await bot.set_webhook(url.rstrip("/") + path, secret_token=secret, allowed_updates=allowed_updates)
+    logger.info(f"Webhook запущен на {host}:{port}{path}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await server.shutdown()
+        await runner.cleanup()
+        await bot.session.close()
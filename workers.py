@@ -0,0 +1,179 @@
+# workers.py
+"""
+Обработка апдейтов в нескольких процессах.
+
+Процесс-приёмник получает апдейты (polling или webhook) и раскладывает их по
+WORKERS процессам-обработчикам по from_user.id: все апдейты одного
+пользователя попадают в один и тот же процесс, поэтому его FSM-разговор
+(и кэш SQLiteStorage) остаётся согласованным. Каждый обработчик запускает
+обычный Dispatcher с handlers.router и admin.router. Упавший обработчик
+перезапускается супервизором; его очередь при этом сохраняется.
+"""
+import asyncio
+import logging
+import multiprocessing
+import signal
+from functools import partial
+
+from aiogram import Bot
+from aiogram.methods import GetUpdates
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+WORKER_CONCURRENCY = 50      # одновременно обрабатываемых апдейтов в одном процессе
+RESTART_DELAY = 1            # секунды перед перезапуском упавшего процесса
+POLLING_TIMEOUT = 30
+
+
+def shard_key(update: Update) -> int:
+    event = update.event
+    user = getattr(event, "from_user", None)
+    if user:
+        return user.id
+    chat = getattr(event, "chat", None)
+    return chat.id if chat else update.update_id
+
+
+def _worker_main(index, queue, processed, bot_factory):
+    # Ctrl+C ловит приёмник и останавливает обработчики через очередь
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_worker(index, queue, processed, bot_factory))
+
+
+async def _worker(index, queue, processed, bot_factory):
+    # Импорт здесь: модуль bot сам импортирует workers
+    from bot import create_bot, create_dispatcher
+    from config import LOG_FILE
+    from database import close_db
+    from logs import setup_logging
+    from storage import SQLiteStorage
+
+    # Свой файл у каждого процесса: ротация одного файла из нескольких процессов небезопасна
+    setup_logging(f"{LOG_FILE}.worker{index}")
+
+    bot = bot_factory() if bot_factory else create_bot()
+    storage = SQLiteStorage()
+    dp = create_dispatcher(storage)
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(WORKER_CONCURRENCY)
+    # Апдейты одного пользователя обрабатываются строго по очереди
+    last_task = {}
+
+    async def process(update, previous):
+        try:
+            if previous:
+                await asyncio.wait({previous})
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            logger.error(f"Обработчик {index}: ошибка апдейта {update.update_id}: {e}")
+        finally:
+            semaphore.release()
+            with processed.get_lock():
+                processed.value += 1
+
+    def forget(key, task):
+        if last_task.get(key) is task:
+            del last_task[key]
+
+    await dp.emit_startup(bot=bot)
+    try:
+        while True:
+            data = await loop.run_in_executor(None, queue.get)
+            if data is None:
+                break
+            await semaphore.acquire()
+            update = Update.model_validate(data, context={"bot": bot})
+            key = shard_key(update)
+            task = asyncio.create_task(process(update, last_task.get(key)))
+            last_task[key] = task
+            task.add_done_callback(partial(forget, key))
+        if last_task:
+            await asyncio.wait(set(last_task.values()))
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await storage.close()
+        await bot.session.close()
+        close_db()
+
+
+class WorkerPool:
+    def __init__(self, count: int, bot_factory=None):
+        self._ctx = multiprocessing.get_context("spawn")
+        self.count = count
+        self.bot_factory = bot_factory
+        self.queues = [self._ctx.Queue() for _ in range(count)]
+        self.processed = [self._ctx.Value("Q", 0) for _ in range(count)]
+        self.restarts = [0] * count
+        self.processes = [None] * count
+        self._stopping = False
+
+    def _spawn(self, index):
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(index, self.queues[index], self.processed[index], self.bot_factory),
+            name=f"worker-{index}",
+            daemon=True,
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(self.count):
+            self._spawn(index)
+
+    def dispatch(self, update: Update):
+        data = update.model_dump(mode="json", by_alias=True, exclude_none=True)
+        self.queues[shard_key(update) % self.count].put(data)
+
+    async def supervise(self):
+        while not self._stopping:
+            await asyncio.sleep(RESTART_DELAY)
+            for index, process in enumerate(self.processes):
+                if self._stopping or process.is_alive():
+                    continue
+                self.restarts[index] += 1
+                logger.error(f"Обработчик {index} завершился с кодом {process.exitcode}, перезапуск")
+                self._spawn(index)
+
+    async def stop(self, timeout: float = 30):
+        self._stopping = True
+        for queue in self.queues:
+            queue.put(None)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, timeout)
+            if process.is_alive():
+                process.terminate()
+
+
+async def poll_updates(bot: Bot, feed, stop: asyncio.Event, allowed_updates=None):
+    """Long polling без Dispatcher: только получает апдейты и отдаёт их в feed."""
+    offset = None
+    while not stop.is_set():
+        try:
+            updates = await bot(GetUpdates(offset=offset, timeout=POLLING_TIMEOUT, allowed_updates=allowed_updates))
+        except Exception as e:
+            logger.error(f"Ошибка получения апдейтов: {e}")
+            await asyncio.sleep(5)
+            continue
+        for update in updates:
+            feed(update)
+            offset = update.update_id + 1
+
+
+async def run_sharded_polling(bot: Bot, pool: WorkerPool, allowed_updates=None):
+    pool.start()
+    supervisor = asyncio.create_task(pool.supervise())
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await bot.delete_webhook()
+    polling = asyncio.create_task(poll_updates(bot, pool.dispatch, stop, allowed_updates))
+    await stop.wait()
+    polling.cancel()
+    supervisor.cancel()
+    await pool.stop()
+    await bot.session.close()